@@ -0,0 +1,120 @@
+"""Measure how admission control keeps light requests moving while heavy ones pile up.
+
+Models a server of --workers sync worker processes (like gunicorn's)
+taking requests from one shared queue. A burst of --heavy slow requests
+(--heavy-ms each, standing in for download_all) arrives just ahead of a
+steady stream of --light fast ones (invoice entry). The run is done twice:
+
+- without admission control;
+- with the heavy endpoint limited to --concurrency slots plus --queue
+  waiting, through invoice.admission's lock files.
+
+For each run it prints the latency of light requests, how many heavy ones ran
+and were turned away, and the acquire/release cost of a slot.
+
+    python benchmarks/admission.py [--workers 4] [--heavy 12] [--light 200]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(lock_dir, limits):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.INVOICE_ADMISSION = limits
+    settings.INVOICE_ADMISSION_DIR = lock_dir
+    django.setup()
+
+
+def worker(requests, results, lock_dir, limits, heavy_ms, light_ms):
+    _setup(lock_dir, limits)
+    from invoice.admission import Rejected, acquire
+
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        kind, arrived = item
+        if kind == "heavy" and limits:
+            try:
+                ticket = acquire("heavy")
+            except Rejected:
+                results.put((kind, time.time() - arrived, "rejected"))
+                continue
+            time.sleep(heavy_ms / 1000)
+            ticket.release()
+        else:
+            time.sleep((heavy_ms if kind == "heavy" else light_ms) / 1000)
+        results.put((kind, time.time() - arrived, "ok"))
+
+
+def run(args, lock_dir, limits):
+    ctx = multiprocessing.get_context("spawn")
+    requests, results = ctx.Queue(), ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(requests, results, lock_dir, limits, args.heavy_ms, args.light_ms))
+        for _ in range(args.workers)
+    ]
+    for proc in procs:
+        proc.start()
+    time.sleep(2)  # Let the workers start up
+    for _ in range(args.heavy):
+        requests.put(("heavy", time.time()))
+    for _ in range(args.light):
+        requests.put(("light", time.time()))
+        time.sleep(args.light_interval_ms / 1000)
+    outcomes = [results.get() for _ in range(args.heavy + args.light)]
+    for _ in procs:
+        requests.put(None)
+    for proc in procs:
+        proc.join()
+    light = sorted(latency * 1000 for kind, latency, _ in outcomes if kind == "light")
+    heavy = [status for kind, _, status in outcomes if kind == "heavy"]
+    return light, heavy.count("ok"), heavy.count("rejected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--heavy", type=int, default=12)
+    parser.add_argument("--heavy-ms", type=float, default=1000)
+    parser.add_argument("--light", type=int, default=200)
+    parser.add_argument("--light-ms", type=float, default=5)
+    parser.add_argument("--light-interval-ms", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--queue", type=int, default=1)
+    args = parser.parse_args()
+
+    lock_dir = tempfile.mkdtemp()
+    try:
+        limited = {"heavy": {"concurrency": args.concurrency, "queue": args.queue, "wait": 2 * args.heavy_ms / 1000}}
+        for label, limits in (("no admission control", {}), ("admission control", limited)):
+            light, ran, rejected = run(args, lock_dir, limits)
+            print("%-22s light p50 %7.1f  p99 %7.1f  max %7.1f ms   heavy ran %2d, turned away %2d" % (
+                label, statistics.median(light), light[int(len(light) * 0.99)], light[-1], ran, rejected,
+            ))
+
+        _setup(lock_dir, limited)
+        from invoice.admission import acquire
+
+        began = time.perf_counter()
+        for _ in range(10000):
+            acquire("heavy").release()
+        print("acquire + release of a free slot: %.1f us" % ((time.perf_counter() - began) / 10000 * 1e6))
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+if __name__ == "__main__":
+    main()
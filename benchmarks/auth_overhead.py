@@ -0,0 +1,103 @@
+"""Measure what resolving the logged-in user costs on each request.
+
+Runs the session and authentication middleware for an already logged-in
+client against a scratch SQLite database, once per session engine / auth
+backend combination, and prints the queries and time each request spends
+before a view would run.
+
+    python benchmarks/auth_overhead.py [--requests 2000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSIONS = "django.contrib.sessions.backends."
+CONFIGS = [
+    ("db sessions, ModelBackend", SESSIONS + "db", "django.contrib.auth.backends.ModelBackend"),
+    ("cached_db, ModelBackend", SESSIONS + "cached_db", "django.contrib.auth.backends.ModelBackend"),
+    ("cached_db, CachedModelBackend", SESSIONS + "cached_db", "invoice.auth.CachedModelBackend"),
+    ("signed_cookies, CachedModelBackend", SESSIONS + "signed_cookies", "invoice.auth.CachedModelBackend"),
+]
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def measure(engine, backend, requests):
+    """(queries per request, microseconds per request) for one configuration"""
+    from django.contrib.auth.middleware import AuthenticationMiddleware
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.middleware import SessionMiddleware
+    from django.core.cache import cache
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import Client, RequestFactory, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    with override_settings(SESSION_ENGINE=engine, AUTHENTICATION_BACKENDS=[backend]):
+        cache.clear()
+        from django.conf import settings
+
+        client = Client()
+        client.force_login(User.objects.get(username="bench"))
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        def view(request):
+            assert request.user.is_authenticated
+            return HttpResponse()
+
+        chain = SessionMiddleware(AuthenticationMiddleware(view))
+        factory = RequestFactory()
+
+        def one():
+            request = factory.get("/")
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = cookie
+            chain(request)
+
+        one()  # Warm the caches
+        with CaptureQueriesContext(connection) as queries:
+            one()
+        began = time.perf_counter()
+        for _ in range(requests):
+            one()
+        elapsed = time.perf_counter() - began
+    return len(queries), elapsed / requests * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"))
+        from django.contrib.auth.models import User
+
+        User.objects.create_user(username="bench", password="bench")
+        for label, engine, backend in CONFIGS:
+            queries, micros = measure(engine, backend, args.requests)
+            print("%-36s %d queries  %7.1f us/request" % (label, queries, micros))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Measure online backups of a large SQLite database and the stall they cause writers.
+
+Builds a scratch database of roughly --size-gb from the app's schema (invoices
+with long comments and three lines each). It then starts a writer process
+that commits one invoice every few milliseconds and runs, in turn:
+
+- an idle window;
+- a full backup;
+- an incremental backup after more writes;
+- verify;
+- restore to a new file.
+
+For each phase it prints the duration, the bytes stored, and the writer's
+commit latency (p50/p99/max) while the phase ran.
+
+    python benchmarks/backup.py [--size-gb 2] [--journal wal|delete] [--pages 1024]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    django.setup()
+
+
+def build(db_path, size_gb, journal):
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=%s" % journal)
+    conn.execute("INSERT INTO invoice_product (product_name, cost_price, selling_price, product_unit, "
+                 "product_is_delete, updated_at, quantity_on_hand) VALUES ('Bench', 1, 2, 'pcs', 0, "
+                 "'2025-01-01', 0)")
+    rng = random.Random(1)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(5000)]
+    target = size_gb * 1e9
+    next_id = 1
+    while os.path.getsize(db_path) < target:
+        invoices = [
+            (next_id + i, "2025-01-01", "Customer %d" % ((next_id + i) % 5000), " ".join(rng.choices(words, k=40)))
+            for i in range(20000)
+        ]
+        conn.executemany(
+            "INSERT INTO invoice_invoice (id, date, customer, contact, email, comments, total, updated_at) "
+            "VALUES (?, ?, ?, '', '', ?, 0, '2025-01-01')", invoices,
+        )
+        conn.executemany(
+            "INSERT INTO invoice_invoicedetail (invoice_id, product_id, amount, cost_price, selling_price, updated_at) "
+            "VALUES (?, 1, 2, 1, 2, '2025-01-01')", [(row[0],) for row in invoices for _ in range(3)],
+        )
+        conn.commit()
+        next_id += len(invoices)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def writer(db_path, stop, results):
+    """Commit one invoice every 5 ms; report (start time, latency) per commit"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    samples = []
+    while not stop.is_set():
+        began = time.perf_counter()
+        conn.execute(
+            "INSERT INTO invoice_invoice (date, customer, contact, email, comments, total, updated_at) "
+            "VALUES ('2025-06-01', 'Writer', '', '', 'during backup', 0, '2025-06-01')"
+        )
+        conn.commit()
+        samples.append((began, time.perf_counter() - began))
+        time.sleep(0.005)
+    conn.close()
+    results.put(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=2)
+    parser.add_argument("--journal", choices=["wal", "delete"], default="wal")
+    parser.add_argument("--pages", type=int, default=1024)
+    parser.add_argument("--level", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.sqlite3")
+    backups = os.path.join(workdir, "backups")
+    try:
+        _setup(db_path)
+        from invoice.backup import backup_database, restore_database, verify_backup
+
+        began = time.perf_counter()
+        build(db_path, args.size_gb, args.journal)
+        print("built %.2f GB database (%s journal) in %.0f s" % (
+            os.path.getsize(db_path) / 1e9, args.journal, time.perf_counter() - began))
+
+        ctx = multiprocessing.get_context("spawn")
+        stop, results = ctx.Event(), ctx.Queue()
+        proc = ctx.Process(target=writer, args=(db_path, stop, results))
+        proc.start()
+        time.sleep(1)
+
+        phases = []
+
+        def phase(label, func):
+            began = time.perf_counter()
+            detail = func()
+            phases.append((label, began, time.perf_counter(), detail))
+
+        phase("idle", lambda: time.sleep(5) or "")
+
+        def backup():
+            manifest = backup_database(backups, source_path=db_path, pages=args.pages, level=args.level)
+            return "snapshot %.1f s, stored %.0f MB, %d/%d chunks new" % (
+                manifest["snapshot_seconds"], manifest["bytes_written"] / 1e6,
+                manifest["new_chunks"], len(manifest["chunks"]),
+            )
+
+        phase("full backup", backup)
+        time.sleep(5)  # More invoices from the writer
+        phase("incremental backup", backup)
+        phase("verify", lambda: "problems: %d" % len(verify_backup(None, backups)))
+        phase("restore (new file)", lambda: restore_database(
+            None, backups, target_path=os.path.join(workdir, "restored.sqlite3")) and "")
+
+        stop.set()
+        samples = results.get()
+        proc.join()
+
+        for label, start, end, detail in phases:
+            latencies = sorted(latency * 1000 for began, latency in samples if start <= began < end)
+            if latencies:
+                stats = "writer p50 %6.1f  p99 %7.1f  max %7.1f ms (%d commits)" % (
+                    statistics.median(latencies), latencies[int(len(latencies) * 0.99)], latencies[-1],
+                    len(latencies),
+                )
+            else:
+                stats = "writer made no commits"
+            print("%-20s %6.1f s  %s  %s" % (label, end - start, stats, detail))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure validating and pricing invoice lines from the in-process catalogue.
+
+Fills a scratch database with --products products. It then validates an
+invoice formset of --lines lines repeatedly, with the catalogue-backed
+InvoiceDetailForm and with a plain ModelForm, whose ModelChoiceField queries
+each row's product and whose model validation checks the foreign key again.
+Also reports the cost of rebuilding the catalogue after a product change.
+
+    python benchmarks/catalogue.py [--products 5000] [--lines 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"))
+        from django import forms
+        from django.db import connection, reset_queries
+        from django.forms import formset_factory
+        from django.test.utils import CaptureQueriesContext
+
+        from invoice.catalogue import bump_catalogue, get_catalogue
+        from invoice.forms import InvoiceDetailFormSet
+        from invoice.models import InvoiceDetail, Product
+
+        Product.objects.bulk_create([
+            Product(product_name="Product %d" % i, cost_price=i, selling_price=i * 1.5, product_unit="pcs")
+            for i in range(args.products)
+        ], batch_size=1000)
+        ids = list(Product.objects.values_list("pk", flat=True))
+        step = max(1, len(ids) // args.lines)
+        data = {
+            "form-TOTAL_FORMS": str(args.lines), "form-INITIAL_FORMS": "0",
+            "form-MIN_NUM_FORMS": "0", "form-MAX_NUM_FORMS": "1000",
+        }
+        for i in range(args.lines):
+            data["form-%d-product" % i] = ids[i * step]
+            data["form-%d-amount" % i] = "2"
+
+        QueryFormSet = formset_factory(forms.modelform_factory(InvoiceDetail, fields=["product", "amount"]))
+        get_catalogue()
+        for label, formset_class in (("catalogue", InvoiceDetailFormSet), ("ModelChoiceField", QueryFormSet)):
+            with CaptureQueriesContext(connection) as queries:
+                assert formset_class(data).is_valid()
+            began = time.perf_counter()
+            for _ in range(args.runs):
+                formset = formset_class(data)
+                formset.is_valid()
+                sum(f.cleaned_data["product"].selling_price for f in formset)
+            elapsed = (time.perf_counter() - began) / args.runs
+            print("%-18s %7.3f ms per %d-line invoice  %3d queries" % (label, elapsed * 1000, args.lines, len(queries)))
+            reset_queries()
+
+        began = time.perf_counter()
+        for _ in range(20):
+            bump_catalogue()
+            get_catalogue()
+        print("rebuild after a product change: %.1f ms for %d products" % (
+            (time.perf_counter() - began) / 20 * 1000, args.products))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
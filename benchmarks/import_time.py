@@ -0,0 +1,66 @@
+"""Measure how long a cold worker spends importing the project.
+
+Runs ``python -X importtime`` in a fresh interpreter that sets up Django and
+imports the URLconf (which pulls in every view), then prints the total import
+time and the slowest top-level packages.
+
+    python benchmarks/import_time.py [--runs 5] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = (
+    "import os, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_system_management.settings');"
+    "django.setup();"
+    "import invoice_system_management.urls"
+)
+
+
+def import_profile():
+    """One cold import; returns ({top-level package: cumulative microseconds}, all module names)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    packages = defaultdict(int)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        # Nested imports are indented one extra space per level; keep the top level only
+        if name.startswith("  "):
+            continue
+        packages[name.strip().split(".")[0]] += int(cumulative_us)
+    return packages, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    totals = [sum(packages.values()) / 1000 for packages, _ in profiles]
+    print("total import time: median %.1f ms, min %.1f ms over %d runs"
+          % (statistics.median(totals), min(totals), args.runs))
+
+    last, modules = profiles[-1]
+    print("pandas imported: %s" % ("yes" if "pandas" in modules else "no"))
+    print("fpdf imported:   %s" % ("yes" if "fpdf" in modules else "no"))
+    print("slowest top-level packages (last run):")
+    for name, micros in sorted(last.items(), key=lambda item: -item[1])[:args.top]:
+        print("  %-30s %8.1f ms" % (name, micros / 1000))
+
+
+if __name__ == "__main__":
+    main()
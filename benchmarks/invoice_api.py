@@ -0,0 +1,142 @@
+"""Measure the invoice read API against the HTML invoice list.
+
+Fills a scratch database with --invoices invoices of --lines lines each, then
+fetches the same invoices:
+
+- as the HTML list page (view_invoice);
+- as one API page with every field;
+- as one API page with a few fields;
+- as an NDJSON stream.
+
+Each is fetched through the test client, uncompressed and with gzip and
+brotli. For each it prints the time per request and the body size. It then
+times building the API's rows against model instances, and encoding them with
+orjson against the standard library json module.
+
+    python benchmarks/invoice_api.py [--invoices 2000] [--lines 3]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    settings.DEBUG = False  # No query log
+    settings.INVOICE_ADMISSION = {}
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def build(invoices, lines):
+    from invoice.models import Invoice, InvoiceDetail, Product
+
+    products = Product.objects.bulk_create([
+        Product(product_name="Product %d" % i, cost_price=i, selling_price=i * 1.5, product_unit="pcs")
+        for i in range(1, 201)
+    ])
+    Invoice.objects.bulk_create([
+        Invoice(customer="Customer %d" % (i % 500), contact="98765%05d" % i, email="c%d@example.com" % i,
+                comments="Delivered to the front desk", total=lines * 30.0)
+        for i in range(invoices)
+    ], batch_size=1000)
+    ids = list(Invoice.objects.values_list("pk", flat=True))
+    rows = []
+    for pk in ids:
+        for j in range(lines):
+            product = products[(pk + j) % len(products)]
+            rows.append(InvoiceDetail(invoice_id=pk, product=product, product_name=product.product_name, amount=2,
+                                      cost_price=10, selling_price=15))
+    InvoiceDetail.objects.bulk_create(rows, batch_size=2000)
+
+
+def fetch(client, url, encoding, runs):
+    """(ms per request, body bytes)"""
+    headers = {"HTTP_ACCEPT_ENCODING": encoding} if encoding else {}
+    began = time.perf_counter()
+    for _ in range(runs):
+        response = client.get(url, **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        assert response.status_code == 200, response.status_code
+    return (time.perf_counter() - began) / runs * 1000, len(body)
+
+
+def timed(func, runs):
+    began = time.perf_counter()
+    for _ in range(runs):
+        result = func()
+    return (time.perf_counter() - began) / runs * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.serializers.json import DjangoJSONEncoder
+        from django.test import Client
+        from django.urls import reverse
+
+        from invoice.api import INVOICE_FIELDS, LINE_FIELDS, dumps, invoice_page
+        from invoice.models import Invoice
+
+        build(args.invoices, args.lines)
+        settings.INVOICE_API_MAX_PAGE_SIZE = args.invoices
+        client = Client()
+        client.force_login(User.objects.create_user("bench"))
+
+        api = reverse("invoice_api")
+        targets = [
+            ("HTML list", reverse("view_invoice")),
+            ("API, all fields", "%s?limit=%d" % (api, args.invoices)),
+            ("API, 4 fields", "%s?limit=%d&fields=date,total,lines.product_id,lines.amount" % (api, args.invoices)),
+            ("NDJSON stream", "%s?format=ndjson" % api),
+        ]
+        print("%d invoices, %d lines each" % (args.invoices, args.lines))
+        for label, url in targets:
+            cells = []
+            for encoding in (None, "gzip", "br"):
+                ms, size = fetch(client, url, encoding, args.runs)
+                cells.append("%-5s %7.1f ms %8.1f KB" % (encoding or "plain", ms, size / 1024))
+            print("%-16s %s" % (label, "   ".join(cells)))
+
+        fields = list(INVOICE_FIELDS), list(LINE_FIELDS)
+        ms, rows = timed(lambda: invoice_page(*fields, limit=args.invoices), args.runs)
+        print("rows from values():             %7.1f ms" % ms)
+        ms, _ = timed(lambda: [(invoice, list(invoice.invoicedetail_set.all()))
+                               for invoice in Invoice.objects.prefetch_related("invoicedetail_set__product")],
+                      args.runs)
+        print("model instances (prefetched):   %7.1f ms" % ms)
+        ms, _ = timed(lambda: dumps({"invoices": rows}), args.runs * 4)
+        print("encode with orjson:             %7.1f ms" % ms)
+        ms, _ = timed(lambda: json.dumps({"invoices": rows}, cls=DjangoJSONEncoder, separators=(",", ":")),
+                      args.runs * 4)
+        print("encode with json:               %7.1f ms" % ms)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
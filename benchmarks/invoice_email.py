@@ -0,0 +1,156 @@
+"""Measure batch emailing of invoice PDFs against a local SMTP stand-in.
+
+Starts a minimal SMTP server in this process that accepts and discards mail,
+optionally adding a delay to every new connection (standing in for the TCP,
+TLS and AUTH round trips of a real relay). Queues the same invoices twice and
+sends them through invoice.mailer: once with its shared connection per batch,
+and once opening a fresh connection for every message, the way calling
+send_mail() per invoice would.
+
+    python benchmarks/invoice_email.py [--invoices 200] [--connect-ms 50]
+"""
+import argparse
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's backend: greet, accept every command, drop the data"""
+    connect_delay = 0.0
+    connections = 0
+    messages = 0
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        SMTPSink.connections += 1
+        time.sleep(self.connect_delay)
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif verb == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                SMTPSink.messages += 1
+                self.reply("250 queued")
+            elif verb == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def _setup(db_path, port):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    settings.EMAIL_HOST, settings.EMAIL_PORT = "127.0.0.1", port
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ""
+    settings.EMAIL_USE_TLS = False
+    settings.INVOICE_EMAIL_BACKGROUND = False
+    settings.INVOICE_EMAIL_RATE = 0  # Measure the sending itself, not the throttle
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def fill(count):
+    from invoice.models import Invoice, InvoiceDetail, Product
+
+    products = Product.objects.bulk_create([
+        Product(product_name="Product %d" % i, cost_price=i, selling_price=i * 1.5, product_unit="pcs")
+        for i in range(1, 6)
+    ])
+    invoices = Invoice.objects.bulk_create([
+        Invoice(number="INV/%06d" % i, customer="Customer %d" % i, email="customer%d@example.com" % i, total=0)
+        for i in range(count)
+    ])
+    InvoiceDetail.objects.bulk_create([
+        InvoiceDetail(invoice=invoice, product=product, product_name=product.product_name, amount=2,
+                      cost_price=product.cost_price, selling_price=product.selling_price)
+        for invoice in invoices for product in products[:3]
+    ])
+    return Invoice.objects.all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=50, help="Delay added to every new SMTP connection")
+    args = parser.parse_args()
+
+    SMTPSink.connect_delay = args.connect_ms / 1000
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPSink)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"), server.server_address[1])
+        from django.core.mail import get_connection
+
+        from invoice import mailer
+
+        invoices = fill(args.invoices)
+        runs = [("shared connection", mailer.get_connection)]
+        # One connection per message: a backend whose open() always starts over
+        runs.append(("connection per message", lambda: _PerMessage(get_connection())))
+        for label, factory in runs:
+            mailer.queue_invoice_emails(invoices)
+            SMTPSink.connections = SMTPSink.messages = 0
+            original, mailer.get_connection = mailer.get_connection, factory
+            began = time.perf_counter()
+            try:
+                sent, failed = mailer.send_all()
+            finally:
+                mailer.get_connection = original
+            elapsed = time.perf_counter() - began
+            print("%-24s %4d sent  %4d failed  %6.1f msg/s  %4d SMTP connections" % (
+                label, sent, failed, sent / elapsed, SMTPSink.connections,
+            ))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+
+
+class _PerMessage:
+    """Wraps a backend so every send_messages() call opens and closes its own connection"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open(self):
+        pass
+
+    def close(self):
+        self.backend.close()
+
+    def send_messages(self, messages):
+        self.backend.close()
+        return self.backend.send_messages(messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Measure invoice creation under concurrent writers.
+
+Each writer is a separate process posting to the real create_invoice view
+against a scratch SQLite database, so the run covers form validation, invoice
+numbering, line inserts, the sales rollups and the stock ledger. Every invoice
+draws on the same five products. For every writer count it prints throughput,
+latency percentiles, failed requests, whether the invoice numbers came out
+unique (and how many were skipped), and units lost from on-hand stock compared
+with the invoice lines and the ledger (0 means no lost updates).
+
+    python benchmarks/invoice_writes.py [--writers 1 4 16] [--invoices 400] [--mode block gapless]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPENING_STOCK = 1000000
+
+
+def _setup(db_path, mode=None):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    if mode:
+        settings.INVOICE_NUMBER_MODE = mode
+    django.setup()
+
+
+def build_template(db_path):
+    """Migrated database with one user and a few products"""
+    _setup(db_path)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from invoice.models import Product
+    from invoice.stock import adjust_stock
+
+    call_command("migrate", verbosity=0)
+    User.objects.create_user(username="bench", password="bench")
+    Product.objects.bulk_create([
+        Product(product_name="Bench %d" % i, cost_price=i, selling_price=i * 1.5, product_unit="pcs")
+        for i in range(1, 6)
+    ])
+    for product in Product.objects.all():
+        adjust_stock(product, OPENING_STOCK)
+
+
+def writer(db_path, mode, count, start_barrier, results):
+    _setup(db_path, mode)
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+
+    from invoice.models import Product
+
+    client = Client()
+    client.force_login(User.objects.get(username="bench"))
+    products = list(Product.objects.values_list("pk", flat=True))
+    url = reverse("create_invoice")
+    latencies = []
+    errors = 0
+
+    start_barrier.wait()
+    for i in range(count):
+        data = {
+            "customer": "Customer %d" % (i % 50),
+            "form-TOTAL_FORMS": "3",
+            "form-INITIAL_FORMS": "0",
+            "form-MIN_NUM_FORMS": "0",
+            "form-MAX_NUM_FORMS": "1000",
+        }
+        for line in range(3):
+            data["form-%d-product" % line] = products[(i + line) % len(products)]
+            data["form-%d-amount" % line] = "2"
+        began = time.perf_counter()
+        try:
+            ok = client.post(url, data).status_code == 302
+        except Exception:  # "database is locked" and friends surface here
+            ok = False
+        latencies.append(time.perf_counter() - began)
+        errors += not ok
+    results.put((latencies, errors))
+
+
+def check_results(db_path):
+    """(invoices, distinct numbers, numbers skipped, stock units lost) from a finished run"""
+    import sqlite3
+
+    with sqlite3.connect(db_path) as conn:
+        numbers = [row[0] for row in conn.execute("SELECT number FROM invoice_invoice")]
+        sold = dict(conn.execute("SELECT product_id, SUM(amount) FROM invoice_invoicedetail GROUP BY product_id"))
+        ledger = dict(conn.execute("SELECT product_id, SUM(quantity) FROM invoice_stockmovement GROUP BY product_id"))
+        on_hand = dict(conn.execute("SELECT id, quantity_on_hand FROM invoice_product"))
+    sequence = [int(number.rsplit("/", 1)[1]) for number in numbers]
+    skipped = (max(sequence) - len(sequence)) if sequence else 0
+    lost = sum(
+        abs(OPENING_STOCK - sold.get(pk, 0) - quantity) + abs(ledger.get(pk, 0) - quantity)
+        for pk, quantity in on_hand.items()
+    )
+    return len(numbers), len(set(numbers)), skipped, lost
+
+
+def run(template, mode, writers, invoices):
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.sqlite3")
+    shutil.copy(template, db_path)
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(writers + 1)
+    results = ctx.Queue()
+    per_writer = invoices // writers
+    procs = [ctx.Process(target=writer, args=(db_path, mode, per_writer, barrier, results)) for _ in range(writers)]
+    for proc in procs:
+        proc.start()
+    barrier.wait()
+    began = time.perf_counter()
+    outcomes = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - began
+    for proc in procs:
+        proc.join()
+
+    latencies = sorted(latency for batch, _ in outcomes for latency in batch)
+    errors = sum(failed for _, failed in outcomes)
+    created, distinct, skipped, lost = check_results(db_path)
+    shutil.rmtree(workdir)
+    print("%-8s %3d writers  %7.1f inv/s  p50 %6.1f ms  p95 %6.1f ms  failed %4d  unique %s  skipped %d  "
+          "stock lost %d" % (
+              mode, writers, created / elapsed,
+              statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95)] * 1000,
+              errors, "yes" if created == distinct else "NO", skipped, lost,
+          ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--invoices", type=int, default=400, help="Invoices per run, split across writers")
+    parser.add_argument("--mode", nargs="+", choices=["block", "gapless"], default=["block", "gapless"])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, "template.sqlite3")
+    ctx = multiprocessing.get_context("spawn")
+    proc = ctx.Process(target=build_template, args=(template,))
+    proc.start()
+    proc.join()
+    try:
+        for mode in args.mode:
+            for writers in args.writers:
+                run(template, mode, writers, args.invoices)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Compare full-text search with the LIKE scans it replaces.
+
+Fills a scratch SQLite database with synthetic search entries (invoice numbers,
+customer names, emails and a few very common words), then times the same
+queries through invoice.search (ranked) and through icontains filters
+(unranked, stopping at the first 20 hits).
+
+    python benchmarks/search.py [--rows 1000000] [--runs 5] [--optimize]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYLLABLES = "ka ri mo na ve lu sa to pi de ra ni ko ma chi ta la go bu ye".split()
+# Words that appear in a large share of rows, the worst case for ranking
+COMMON = "urgent delivery diwali lamp kettle cash".split()
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    settings.DEBUG = False  # No query log
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def fill(rows, batch_size=20000):
+    """Synthetic entries: customer names from a 50k-word vocabulary plus a few very common words"""
+    from invoice.models import SearchEntry
+
+    rng = random.Random(42)
+    vocabulary = ["".join(rng.choices(SYLLABLES, k=3)) for _ in range(50000)]
+    for start in range(0, rows, batch_size):
+        SearchEntry.objects.bulk_create([
+            SearchEntry(
+                kind=SearchEntry.INVOICE if pk % 3 else SearchEntry.CUSTOMER, object_id=pk,
+                title="INV/2025/%06d %s %s" % (pk, rng.choice(vocabulary).title(), rng.choice(vocabulary).title()),
+                body="%s@example.com %s %s" % (
+                    rng.choice(vocabulary), " ".join(rng.choices(vocabulary, k=5)), " ".join(rng.choices(COMMON, k=2)),
+                ),
+            )
+            for pk in range(start, min(start + batch_size, rows))
+        ])
+    return vocabulary
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        began = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--optimize", action="store_true",
+                        help="Merge the index segments first, as rebuild_search_index does")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"))
+        from django.db.models import Q
+
+        from invoice.models import SearchEntry
+        from django.db import connection
+
+        from invoice.search import FTS_TABLE, search
+
+        began = time.perf_counter()
+        vocabulary = fill(args.rows)
+        print("indexed %d rows in %.1f s" % (args.rows, time.perf_counter() - began))
+        if args.optimize:
+            began = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO {fts}({fts}) VALUES ('optimize')".format(fts=FTS_TABLE))
+            print("merged index segments in %.1f s" % (time.perf_counter() - began))
+
+        rare = vocabulary[1234]
+        queries = [
+            (rare, None), (rare[:4], None), ("diwali", None), ("diwali urgent", None),
+            ("diwali", SearchEntry.CUSTOMER), ("zzqx", None),
+        ]
+        for query, kind in queries:
+            like = SearchEntry.objects.all()
+            if kind:
+                like = like.filter(kind=kind)
+            for term in query.split():
+                like = like.filter(Q(title__icontains=term) | Q(body__icontains=term))
+            fts_ms = timed(lambda: search(query, kind, limit=20), args.runs)
+            like_ms = timed(lambda: list(like[:20]), args.runs)
+            label = "%r%s" % (query, " (%s)" % kind if kind else "")
+            print("%-28s fts ranked %8.2f ms   icontains unranked %8.2f ms" % (label, fts_ms, like_ms))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Measure GST recalculation after a rate change, and the GST summary report.
+
+Fills a scratch database with --invoices invoices of --lines lines each over
+--products products, taxed at 18%. It then moves every product to a new
+rate and brings the stored tax up to date:
+
+- row by row: load each line with its product, work out its tax in Python,
+  save it, then save each invoice's new tax total;
+- with invoice.tax.recalculate(): a few UPDATE statements per batch of
+  invoices.
+
+Both runs must leave the same stored tax. Finally it times the GST summary
+over every invoice, summed from the stored columns, against working the tax
+out again line by line.
+
+    python benchmarks/tax.py [--invoices 10000] [--lines 3] [--batch-size 1000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(db_path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    settings.DEBUG = False  # No query log
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def build(invoices, lines, products):
+    from invoice.models import Invoice, InvoiceDetail, Product
+    from invoice.tax import line_tax
+
+    catalogue = Product.objects.bulk_create([
+        Product(product_name="Product %d" % i, cost_price=i, selling_price=round(i * 1.37 + 0.99, 2),
+                product_unit="pcs", hsn_code="%04d" % (1000 + i % 50), gst_rate=18)
+        for i in range(1, products + 1)
+    ])
+    Invoice.objects.bulk_create([
+        Invoice(customer="Customer %d" % i, inter_state=i % 4 == 0) for i in range(invoices)
+    ], batch_size=1000)
+    rows = []
+    for pk, inter_state in Invoice.objects.values_list("pk", "inter_state"):
+        for j in range(lines):
+            product = catalogue[(pk * 7 + j) % len(catalogue)]
+            amount = 1 + (pk + j) % 5
+            rows.append(InvoiceDetail(
+                invoice_id=pk, product=product, amount=amount, cost_price=product.cost_price,
+                selling_price=product.selling_price, hsn_code=product.hsn_code, tax_rate=18,
+                tax_amount=line_tax(product.selling_price, amount, 18, inter_state),
+            ))
+    InvoiceDetail.objects.bulk_create(rows, batch_size=2000)
+    from invoice.totals import id_shards, recompute_shard
+    for first_id, last_id in id_shards(10 ** 9):
+        recompute_shard(first_id, last_id)  # Fills in totals and tax totals
+
+
+def row_by_row():
+    from django.db import transaction
+
+    from invoice.models import Invoice, InvoiceDetail
+    from invoice.tax import apply_tax, invoice_tax_total
+
+    with transaction.atomic():
+        for invoice in Invoice.objects.all():
+            details = list(InvoiceDetail.objects.filter(invoice=invoice).select_related("product"))
+            for detail in details:
+                apply_tax(detail, detail.product, invoice.inter_state)
+                detail.save(update_fields=["hsn_code", "tax_rate", "tax_amount", "updated_at"])
+            invoice.tax_total = invoice_tax_total(details)
+            invoice.save(update_fields=["tax_total", "updated_at"])
+
+
+def stored_tax():
+    from invoice.models import Invoice, InvoiceDetail
+
+    return (
+        list(InvoiceDetail.objects.order_by("id").values_list("tax_rate", "tax_amount")),
+        list(Invoice.objects.order_by("id").values_list("tax_total", flat=True)),
+    )
+
+
+def summary_row_by_row():
+    from invoice.models import InvoiceDetail
+    from invoice.tax import line_tax
+
+    totals = {}
+    lines = InvoiceDetail.objects.filter(invoice__isnull=False).select_related("invoice", "product")
+    for line in lines.iterator(chunk_size=2000):
+        key = (line.product.hsn_code, line.product.gst_rate)
+        totals[key] = totals.get(key, 0) + line_tax(
+            line.selling_price, line.amount, line.product.gst_rate, line.invoice.inter_state)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"))
+        import datetime
+
+        from invoice.models import Product
+        from invoice.tax import recalculate, tax_summary
+
+        build(args.invoices, args.lines, args.products)
+        line_count = args.invoices * args.lines
+        print("%d invoices, %d lines" % (args.invoices, line_count))
+
+        Product.objects.update(gst_rate=12)
+        began = time.perf_counter()
+        row_by_row()
+        rowwise = time.perf_counter() - began
+        expected = stored_tax()
+
+        Product.objects.update(gst_rate=18)
+        recalculate(batch_size=args.batch_size)
+        Product.objects.update(gst_rate=12)
+        began = time.perf_counter()
+        rerated, retaxed, invoices = recalculate(batch_size=args.batch_size)
+        batched = time.perf_counter() - began
+        assert stored_tax() == expected, "recalculate() and the row-by-row path disagree"
+        print("recalculate, row by row  %7.2f s  (%6.0f lines/s)" % (rowwise, line_count / rowwise))
+        print("recalculate, batched     %7.2f s  (%6.0f lines/s; %d re-rated, %d re-taxed, %d invoice totals)" % (
+            batched, line_count / batched, rerated, retaxed, invoices))
+
+        began = time.perf_counter()
+        rows = tax_summary(datetime.date(2000, 1, 1), datetime.date(2100, 1, 1))
+        stored = time.perf_counter() - began
+        began = time.perf_counter()
+        summary_row_by_row()
+        recomputed = time.perf_counter() - began
+        print("GST summary, stored columns   %7.1f ms  (%d HSN/rate rows)" % (stored * 1000, len(rows)))
+        print("GST summary, recomputed       %7.1f ms" % (recomputed * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Measure a cross-tenant sales report run one tenant at a time and fanned out in parallel.
+
+Creates --tenants scratch tenant databases, each with --days of daily sales
+rows for --products products. It then times invoice.rollups.tenant_sales()
+with a single worker thread and with one thread per tenant. It also times
+opening a fresh connection per query against the kept-open per-tenant
+connection that CONN_MAX_AGE gives.
+
+    python benchmarks/tenants.py [--tenants 8] [--products 500] [--days 365]
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup(db_path, tenant_count):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "invoice_system_management.settings")
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DATABASES.pop("replica", None)
+    directory = os.path.dirname(db_path)
+    settings.INVOICE_TENANTS = {}
+    for index in range(tenant_count):
+        slug = "shop%d" % index
+        settings.INVOICE_TENANTS[slug] = {"hosts": [], "database": "tenant_" + slug}
+        settings.DATABASES["tenant_" + slug] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(directory, slug + ".sqlite3"),
+            "OPTIONS": {"timeout": 20},
+            "CONN_MAX_AGE": 600,
+        }
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    call_command("migrate_tenants", verbosity=0)
+
+
+def fill(products, days):
+    from invoice.models import Product, ProductDailySales
+    from invoice.tenants import tenants, use_tenant
+
+    start = datetime.date(2025, 1, 1)
+    for slug in tenants():
+        rng = random.Random(slug)
+        with use_tenant(slug):
+            items = Product.objects.bulk_create([
+                Product(product_name="Product %d" % i, cost_price=i, selling_price=i * 1.5, product_unit="pcs")
+                for i in range(products)
+            ])
+            ProductDailySales.objects.bulk_create([
+                ProductDailySales(
+                    product=product, day=start + datetime.timedelta(days=day),
+                    quantity=rng.randint(1, 20), revenue=rng.random() * 100, profit=rng.random() * 30,
+                )
+                for product in items for day in range(days)
+            ], batch_size=5000)
+    return start, start + datetime.timedelta(days=days - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        _setup(os.path.join(workdir, "bench.sqlite3"), args.tenants)
+        from django.conf import settings
+        from django.db import connections
+
+        from invoice import rollups
+        from invoice.models import Product
+        from invoice.tenants import use_tenant
+
+        start, end = fill(args.products, args.days)
+        print("%d tenants x %d daily sales rows, %d CPU(s)" % (args.tenants, args.products * args.days, os.cpu_count()))
+
+        for workers in (1, args.tenants):
+            settings.INVOICE_TENANT_REPORT_WORKERS = workers
+            rollups.tenant_sales(start, end)  # Warm the page cache
+            began = time.perf_counter()
+            for _ in range(args.runs):
+                rollups.tenant_sales(start, end)
+            print("report, %2d worker(s)          %8.1f ms" % (workers, (time.perf_counter() - began) / args.runs * 1000))
+
+        queries = 2000
+        with use_tenant("shop0"):
+            for label, reconnect in (("kept-open connection", False), ("connection per query", True)):
+                began = time.perf_counter()
+                for _ in range(queries):
+                    Product.objects.filter(pk=1).exists()
+                    if reconnect:
+                        connections["tenant_shop0"].close()
+                print("%-30s %8.3f ms/query" % (label, (time.perf_counter() - began) / queries * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,168 @@
 from django.contrib import admin
-from .models import Product, Invoice, InvoiceDetail
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+
+from .bulk import delete_invoices
+from .mailer import queue_invoice_emails, wake_sender
+from .routers import use_replica
+from .models import (
+    Product, ProductPrice, StockMovement, Customer, Invoice, InvoiceDetail, ArchivedInvoice, ArchivedInvoiceDetail,
+    ProductDailySales, SearchEntry, InvoiceEmail,
+)
+from .search import index_invoice, matching_ids
+
+
+class ReplicaChangeListMixin:
+    """Serve changelist pages (GET only) from the read replica"""
+
+    @method_decorator(use_replica)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
+
+
+class FullTextSearchMixin:
+    """Answer the changelist search box from the full-text index instead of LIKE scans"""
+    search_kind = None
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=matching_ids(self.search_kind, search_term, self.search_limit)), False
 
 
 # -------------------
 # Product Admin
 # -------------------
+class ProductStatusFilter(admin.SimpleListFilter):
+    """Show live products unless deleted ones are asked for"""
+    title = "status"
+    parameter_name = "status"
+
+    def lookups(self, request, model_admin):
+        return (
+            ("deleted", "Deleted"),
+            ("all", "All"),
+        )
+
+    def choices(self, changelist):
+        # The unfiltered entry means "live" here, not "all"
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": "Live",
+        }
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == str(lookup),
+                "query_string": changelist.get_query_string({self.parameter_name: lookup}),
+                "display": title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() == "deleted":
+            return queryset.filter(product_is_delete=True)
+        if self.value() == "all":
+            return queryset
+        return queryset.filter(product_is_delete=False)
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ("product_name", "cost_price", "selling_price", "product_unit", "product_is_delete")
+class ProductAdmin(FullTextSearchMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    search_kind = SearchEntry.PRODUCT
+    list_display = ("product_name", "cost_price", "selling_price", "product_unit", "hsn_code", "gst_rate",
+                    "quantity_on_hand", "product_is_delete")
     search_fields = ("product_name",)
-    list_filter = ("product_is_delete",)
+    list_filter = (ProductStatusFilter,)
+
+    def get_queryset(self, request):
+        # all_objects so deleted products can still be reviewed and restored
+        return Product.all_objects.all()
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ProductPrice.record(obj)
+
+
+# -------------------
+# Product Price History Admin (append only)
+# -------------------
+@admin.register(ProductPrice)
+class ProductPriceAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ("product", "effective_from", "cost_price", "selling_price", "margin")
+    list_filter = ("effective_from",)
+    search_fields = ("product__product_name",)
+    raw_id_fields = ("product",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# -------------------
+# Stock Ledger Admin (append only; use the product stock page to record movements)
+# -------------------
+@admin.register(StockMovement)
+class StockMovementAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ("created_at", "product", "quantity", "reason", "invoice_id", "note")
+    list_filter = ("reason", "created_at")
+    search_fields = ("product__product_name",)
+    raw_id_fields = ("product",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# -------------------
+# Customer Admin
+# -------------------
+@admin.register(Customer)
+class CustomerAdmin(FullTextSearchMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    search_kind = SearchEntry.CUSTOMER
+    list_display = ("customer_name", "contact", "email")
+    search_fields = ("customer_key",)
+    readonly_fields = ("customer_key",)
 
 
 # -------------------
-# Invoice Detail Inline (for Invoice)
+# Invoice Detail Inline (for Invoice; read only)
 # -------------------
 class InvoiceDetailInline(admin.TabularInline):
     model = InvoiceDetail
-    extra = 1
-    readonly_fields = ("get_total_bill", "get_profit")  # Show auto-calculated values
+    extra = 0
+    can_delete = False
+    # Lines are written by the invoice pages, which also move stock, apply tax and update
+    # the rollups and search index; show auto-calculated values only
+    readonly_fields = ("product", "product_name", "amount", "cost_price", "selling_price", "hsn_code", "tax_rate",
+                       "tax_amount", "get_total_bill", "get_profit")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # -------------------
 # Invoice Admin
 # -------------------
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ("id", "customer", "date", "total_sales_amount", "total_profit")
+class InvoiceAdmin(FullTextSearchMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    search_kind = SearchEntry.INVOICE
+    list_display = ("id", "number", "customer", "date", "total_sales_amount", "total_profit")
     inlines = [InvoiceDetailInline]
-    search_fields = ("customer", "contact", "email")
+    raw_id_fields = ("customer_ref",)
+    # Assigned from the invoice sequence; summed from the lines; changing it means re-taxing the lines
+    readonly_fields = ("number", "tax_total", "total", "inter_state")
+    search_fields = ("number", "customer", "contact", "email")
     list_filter = ("date",)
 
     def total_sales_amount(self, obj):
@@ -39,14 +173,68 @@ class InvoiceAdmin(admin.ModelAdmin):
         return obj.total_profit
     total_profit.short_description = "Profit (₹)"
 
+    actions = ["email_invoices"]
+
+    @admin.action(description="Email selected invoices to their customers")
+    def email_invoices(self, request, queryset):
+        queued = queue_invoice_emails(queryset)
+        self.message_user(request, "Queued %d invoices for emailing (invoices without an email are skipped)." % queued)
+
+    # New invoices are made on the invoice page, which numbers them and writes their lines
+    def has_add_permission(self, request):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        index_invoice(obj, obj.invoicedetail_set.select_related("product"))
+
+    # Deletes go through the chunked bulk path so rollups, stock and search stay in step
+    def delete_model(self, request, obj):
+        delete_invoices(Invoice.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_invoices(queryset)
+
 
 # -------------------
-# Invoice Detail Admin
+# Invoice Email Outbox Admin
+# -------------------
+@admin.register(InvoiceEmail)
+class InvoiceEmailAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ("created_at", "invoice_id", "to", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("to",)
+    readonly_fields = ("claim", "claimed_at", "last_error", "sent_at")
+    actions = ["retry_now"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected emails now")
+    def retry_now(self, request, queryset):
+        retried = queryset.exclude(status__in=[InvoiceEmail.SENT, InvoiceEmail.SENDING]).update(
+            status=InvoiceEmail.QUEUED, next_attempt_at=timezone.now(), attempts=0,
+        )
+        wake_sender()
+        self.message_user(request, "Queued %d emails again." % retried)
+
+
+# -------------------
+# Invoice Detail Admin (read only; lines are edited with their invoice on the invoice pages)
 # -------------------
 @admin.register(InvoiceDetail)
-class InvoiceDetailAdmin(admin.ModelAdmin):
+class InvoiceDetailAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ("invoice", "product", "amount", "get_total_bill", "get_profit")
 
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
     def get_total_bill(self, obj):
         return obj.get_total_bill
     get_total_bill.short_description = "Total (₹)"
@@ -54,3 +242,42 @@ class InvoiceDetailAdmin(admin.ModelAdmin):
     def get_profit(self, obj):
         return obj.get_profit
     get_profit.short_description = "Profit (₹)"
+
+
+# -------------------
+# Archived Invoice Admin (read only)
+# -------------------
+class ArchivedInvoiceDetailInline(admin.TabularInline):
+    model = ArchivedInvoiceDetail
+    extra = 0
+    can_delete = False
+    readonly_fields = ("product", "amount", "cost_price", "selling_price", "hsn_code", "tax_rate", "tax_amount",
+                       "get_total_bill", "get_profit")
+    exclude = ("updated_at",)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(FullTextSearchMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    search_kind = SearchEntry.INVOICE
+    list_display = ("id", "number", "customer", "date", "total", "archived_at")
+    inlines = [ArchivedInvoiceDetailInline]
+    search_fields = ("number", "customer")
+    list_filter = ("date",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# -------------------
+# Product Daily Sales Admin
+# -------------------
+@admin.register(ProductDailySales)
+class ProductDailySalesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ("day", "product", "quantity", "revenue", "profit")
+    list_filter = ("day",)
@@ -0,0 +1,230 @@
+"""Admission control for heavy endpoints.
+
+A view wrapped in admit("name") runs only while it holds one of that
+endpoint's slots. The slots are shared by every worker on the host: they are
+lock files under INVOICE_ADMISSION_DIR held with flock(), so a worker that
+dies frees its slots with it.
+
+    INVOICE_ADMISSION = {
+        "download_all": {"concurrency": 2, "per_user": 1, "queue": 2, "wait": 15},
+    }
+
+- concurrency: requests of the endpoint running at once.
+- per_user: how many of those one user may hold (0 for no limit). A user
+  over it is turned away rather than queued.
+- queue: how many more requests may wait for a slot. A waiting request
+  still occupies its worker, so keep this small.
+- wait: seconds a request waits before giving up.
+
+Requests that find the queue full, or wait too long, get a 503 with
+Retry-After. Outcomes and time spent queued are counted in the cache
+(see metrics()).
+"""
+import errno
+import logging
+import os
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Not POSIX: slots are only shared by the threads of one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ("admitted", "queued", "rejected_busy", "rejected_user", "rejected_timeout")
+
+_local_locks = {}
+_local_guard = threading.Lock()
+
+
+class Rejected(Exception):
+    def __init__(self, outcome, waited=0.0):
+        super().__init__(outcome)
+        self.outcome = outcome
+        self.waited = waited
+
+
+def limits():
+    return getattr(settings, "INVOICE_ADMISSION", {})
+
+
+def admission_dir():
+    return str(getattr(settings, "INVOICE_ADMISSION_DIR", os.path.join(settings.BASE_DIR, "run", "admission")))
+
+
+# -------------------
+# Slots
+# -------------------
+def _try_slot(path):
+    """Take the slot at path if it is free; returns a function that frees it, or None"""
+    if fcntl is None:
+        with _local_guard:
+            lock = _local_locks.setdefault(path, threading.Lock())
+        return lock.release if lock.acquire(blocking=False) else None
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as error:
+        os.close(fd)
+        if error.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+    return lambda: os.close(fd)  # Closing the file drops the lock
+
+
+def _take(name, count):
+    """Any free one of the `count` slots called name; starts at a random one to spread the files"""
+    directory = admission_dir()
+    os.makedirs(directory, exist_ok=True)
+    start = random.randrange(count)
+    for offset in range(count):
+        release = _try_slot(os.path.join(directory, "%s.%d.lock" % (name, (start + offset) % count)))
+        if release:
+            return release
+    return None
+
+
+class Ticket:
+    """The slots a request holds and the seconds it queued for them; release() frees them once"""
+
+    def __init__(self, releases, waited):
+        self._releases = releases
+        self.waited = waited
+
+    def release(self):
+        while self._releases:
+            self._releases.pop()()
+
+
+def acquire(name, user=None, sleep=time.sleep):
+    """Hold a slot of endpoint `name` (and one of `user`'s), waiting in the queue if need be.
+
+    Returns a Ticket; raises Rejected when the request has to be turned away.
+    """
+    config = limits()[name]
+    began = time.monotonic()
+    queued = False
+    releases = []
+    try:
+        if config.get("per_user") and user is not None:
+            release = _take("%s.user-%s" % (name, user), config["per_user"])
+            if release is None:
+                raise Rejected("rejected_user")
+            releases.append(release)
+        release = _take(name, config["concurrency"])
+        if release is None:
+            waiting = _take(name + ".queue", config["queue"]) if config.get("queue") else None
+            if waiting is None:
+                raise Rejected("rejected_busy")
+            queued = True
+            try:
+                deadline = began + config.get("wait", 10)
+                delay = 0.01
+                while release is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Rejected("rejected_timeout", time.monotonic() - began)
+                    sleep(min(delay, remaining))
+                    delay = min(delay * 2, 0.2)
+                    release = _take(name, config["concurrency"])
+            finally:
+                waiting()
+        releases.append(release)
+    except BaseException:
+        for release in reversed(releases):
+            release()
+        raise
+    return Ticket(releases, time.monotonic() - began if queued else 0.0)
+
+
+# -------------------
+# Metrics
+# -------------------
+def _metric_key(name, field):
+    return "invoice_admission:%s:%s" % (name, field)
+
+
+def _count(name, field, amount=1):
+    key = _metric_key(name, field)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+
+def record(name, outcome, waited=0.0):
+    _count(name, outcome)
+    if waited:
+        _count(name, "queued")
+        _count(name, "queued_ms", int(waited * 1000))
+
+
+def metrics():
+    """{endpoint: {outcome: count, "queued_ms": total}} for every configured endpoint.
+
+    Counted in the cache, so with a per-process cache each worker has its own.
+    """
+    fields = OUTCOMES + ("queued_ms",)
+    result = {}
+    for name in limits():
+        values = cache.get_many([_metric_key(name, field) for field in fields])
+        result[name] = {field: values.get(_metric_key(name, field), 0) for field in fields}
+    return result
+
+
+# -------------------
+# Views
+# -------------------
+def _busy(name):
+    config = limits()[name]
+    response = HttpResponse("The server is busy with other requests like this one. Please try again shortly.",
+                            status=503, content_type="text/plain")
+    response["Retry-After"] = str(config.get("retry_after", max(1, int(config.get("wait", 10)))))
+    return response
+
+
+def admit(name):
+    """Run the view only with a slot of endpoint `name` held; a 503 with Retry-After when there is none.
+
+    A streamed response keeps its slot until the body has been sent.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if name not in limits():
+                return view(request, *args, **kwargs)
+            user = getattr(request, "user", None)
+            user = user.pk if user is not None and user.is_authenticated else request.META.get("REMOTE_ADDR")
+            try:
+                ticket = acquire(name, user)
+            except Rejected as rejection:
+                record(name, rejection.outcome, rejection.waited)
+                logger.warning("Turned away %s request from %s: %s", name, user, rejection.outcome)
+                return _busy(name)
+            record(name, "admitted", ticket.waited)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                ticket.release()
+                raise
+            response["Server-Timing"] = "admission;dur=%.1f" % (ticket.waited * 1000)
+            if response.streaming:
+                # Django runs these when it closes the response, after the last chunk
+                response._resource_closers.append(ticket.release)
+            else:
+                ticket.release()
+            return response
+
+        return wrapper
+
+    return decorator
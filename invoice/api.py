@@ -0,0 +1,230 @@
+"""Read API for invoices with their lines embedded.
+
+Rows are read with values(), so no model instances are built, and encoded
+with orjson when it is installed. ?fields= picks what is returned:
+
+    ?fields=id,date,total                  invoices only, no line query
+    ?fields=id,customer,lines              every line field
+    ?fields=date,lines.product_name,lines.amount
+
+An invoice's id is always returned, since it is the pagination cursor. A
+page holds the invoices with ids below ?after=, newest first. ?format=ndjson
+streams every remaining invoice as one JSON object per line instead.
+Responses are compressed with brotli or gzip when the client accepts it.
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .models import Invoice, InvoiceDetail
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder, about eight times slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Field name in the API -> values() field or expression
+INVOICE_FIELDS = {
+    "id": "id",
+    "number": "number",
+    "date": "date",
+    "customer": "customer",
+    "customer_ref_id": "customer_ref_id",
+    "contact": "contact",
+    "email": "email",
+    "comments": "comments",
+    "total": "total",
+    "inter_state": "inter_state",
+    "tax_total": "tax_total",
+    "updated_at": "updated_at",
+}
+LINE_FIELDS = {
+    "id": "id",
+    "product_id": "product_id",
+    "product_name": "product_name",
+    "product_unit": F("product__product_unit"),
+    "amount": "amount",
+    "cost_price": "cost_price",
+    "selling_price": "selling_price",
+    "hsn_code": "hsn_code",
+    "tax_rate": "tax_rate",
+    "tax_amount": "tax_amount",
+    "updated_at": "updated_at",
+}
+
+# Brotli's default quality (11) is meant for static files; 4 compresses
+# better than gzip at about the same speed
+BROTLI_QUALITY = 4
+COMPRESS_MIN_LENGTH = 200
+
+
+def page_size():
+    return getattr(settings, "INVOICE_API_PAGE_SIZE", 100)
+
+
+def max_page_size():
+    return getattr(settings, "INVOICE_API_MAX_PAGE_SIZE", 1000)
+
+
+# -------------------
+# Queries
+# -------------------
+def parse_fields(value):
+    """(invoice fields, line fields or None) for a ?fields= value; ValueError names an unknown field"""
+    if not value:
+        return list(INVOICE_FIELDS), list(LINE_FIELDS)
+    invoice_fields, line_fields = ["id"], None
+    for name in (name.strip() for name in value.split(",")):
+        if not name:
+            continue
+        if name == "lines":
+            fields = list(LINE_FIELDS)
+        elif name.startswith("lines."):
+            fields = [name[len("lines."):]]
+            if fields[0] not in LINE_FIELDS:
+                raise ValueError("Unknown line field %r." % fields[0])
+        elif name in INVOICE_FIELDS:
+            if name not in invoice_fields:
+                invoice_fields.append(name)
+            continue
+        else:
+            raise ValueError("Unknown invoice field %r." % name)
+        line_fields = line_fields or []
+        line_fields.extend(field for field in fields if field not in line_fields)
+    return invoice_fields, line_fields
+
+
+def _values(queryset, fields, mapping, *extra):
+    """queryset.values() returning each of `fields` under its API name"""
+    plain = [name for name in fields if mapping[name] == name]
+    renamed = {name: F(mapping[name]) if isinstance(mapping[name], str) else mapping[name]
+               for name in fields if name not in plain}
+    return queryset.values(*plain, *extra, **renamed)
+
+
+def attach_lines(invoices, line_fields):
+    """Give every invoice dict a "lines" list, read with one query for the whole batch"""
+    by_invoice = {}
+    for invoice in invoices:
+        invoice["lines"] = by_invoice[invoice["id"]] = []
+    if not by_invoice:
+        return invoices
+    rows = _values(InvoiceDetail.objects.filter(invoice_id__in=list(by_invoice)).order_by("id"),
+                   line_fields, LINE_FIELDS, "invoice_id")
+    for row in rows:
+        by_invoice[row.pop("invoice_id")].append(row)
+    return invoices
+
+
+def invoice_page(invoice_fields, line_fields=None, after=None, limit=100):
+    """Up to `limit` invoices with ids below `after`, newest first, as dicts"""
+    queryset = Invoice.objects.order_by("-id")
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    invoices = list(_values(queryset, invoice_fields, INVOICE_FIELDS)[:limit])
+    if line_fields is not None:
+        attach_lines(invoices, line_fields)
+    return invoices
+
+
+def iter_invoice_pages(invoice_fields, line_fields=None, after=None, batch_size=500):
+    """Every invoice below `after` in pages of batch_size, each page read with two queries"""
+    while True:
+        invoices = invoice_page(invoice_fields, line_fields, after, batch_size)
+        if not invoices:
+            return
+        yield invoices
+        after = invoices[-1]["id"]
+
+
+# -------------------
+# Encoding
+# -------------------
+def dumps(data):
+    """Compact JSON as bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def ndjson_chunks(pages):
+    """One bytes chunk per page, each invoice on its own line"""
+    for invoices in pages:
+        yield b"".join(dumps(invoice) + b"\n" for invoice in invoices)
+
+
+def accepted_encoding(request):
+    """"br" or "gzip" if the client accepts it (and brotli is installed), else None"""
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        # Flushed per chunk, so the client gets each page as it is read
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(request, response):
+    """Compress the body with the best encoding the client accepts"""
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = accepted_encoding(request)
+    if encoding is None or response.has_header("Content-Encoding") or response.status_code != 200:
+        return response
+    if response.streaming:
+        if encoding == "br":
+            response.streaming_content = _brotli_sequence(response.streaming_content)
+        else:
+            response.streaming_content = compress_sequence(response.streaming_content)
+        del response["Content-Length"]
+    else:
+        if len(response.content) < COMPRESS_MIN_LENGTH:
+            return response
+        if encoding == "br":
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        else:
+            compressed = compress_string(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+    response["Content-Encoding"] = encoding
+    return response
+
+
+def compressed(view):
+    """Compress the view's responses with brotli or gzip, by Accept-Encoding"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return compress_response(request, view(request, *args, **kwargs))
+
+    return wrapper
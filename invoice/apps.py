@@ -1,5 +1,74 @@
 from django.apps import AppConfig
+from django.contrib.staticfiles.apps import StaticFilesConfig
 
 
 class InvoiceConfig(AppConfig):
     name = 'invoice'
+    default = True
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_migrate, post_save
+
+        from . import catalogue, search
+        from .backup import enable_wal
+        from .auth import forget_user
+        from .models import Customer, Product
+
+        # Any change to a user (password, is_active, profile) drops the cached copy
+        User = get_user_model()
+        post_save.connect(forget_user, sender=User, dispatch_uid="invoice_forget_user_on_save")
+        post_delete.connect(forget_user, sender=User, dispatch_uid="invoice_forget_user_on_delete")
+
+        # Products and customers are saved from several places; keep their search entries in step
+        post_save.connect(search.product_saved, sender=Product, dispatch_uid="invoice_index_product")
+        post_delete.connect(search.product_deleted, sender=Product, dispatch_uid="invoice_unindex_product")
+        post_save.connect(search.customer_saved, sender=Customer, dispatch_uid="invoice_index_customer")
+        post_delete.connect(search.customer_deleted, sender=Customer, dispatch_uid="invoice_unindex_customer")
+
+        # Invoice lines are validated and priced from a per-process copy of the catalogue
+        post_save.connect(catalogue.product_changed, sender=Product, dispatch_uid="invoice_catalogue_save")
+        post_delete.connect(catalogue.product_changed, sender=Product, dispatch_uid="invoice_catalogue_delete")
+
+        # Online backups need WAL so writers carry on while a snapshot is copied
+        post_migrate.connect(enable_wal, sender=self, dispatch_uid="invoice_enable_wal")
+
+
+class InvoiceStaticFilesConfig(StaticFilesConfig):
+    """collectstatic without the sources, unminified builds and vendor extras no page loads.
+
+    Directories are only matched by their own name, so nested ones use 'path/*'.
+    """
+    ignore_patterns = StaticFilesConfig.ignore_patterns + [
+        # Sources and uploads, not browser assets
+        'scss', 'less', 'excel',
+        # Unminified copies of the files the templates load
+        'css/sb-admin-2.css',
+        'js/sb-admin-2.js',
+        'js/demo/chart-bar-demo.js',
+        'js/demo/datatables-demo.js',
+        'vendor/bootstrap/js/bootstrap.js*',
+        'vendor/bootstrap/js/bootstrap.min.js*',
+        'vendor/bootstrap/js/bootstrap.bundle.js*',
+        'vendor/chart.js/Chart.js',
+        'vendor/chart.js/Chart.bundle*',
+        'vendor/datatables/*',
+        'vendor/jquery/jquery.js',
+        'vendor/jquery/jquery.slim*',
+        'vendor/jquery-easing/jquery.easing.js',
+        'vendor/jquery-easing/jquery.easing.compatibility.js',
+        # Font Awesome: only css/all.min.css and the webfonts it points at are used
+        'vendor/fontawesome-free/js/*',
+        'vendor/fontawesome-free/svgs/*',
+        'vendor/fontawesome-free/sprites/*',
+        'vendor/fontawesome-free/metadata/*',
+        'vendor/fontawesome-free/attribution.js',
+        'vendor/fontawesome-free/package.json',
+        'vendor/fontawesome-free/css/all.css',
+        'vendor/fontawesome-free/css/brands*',
+        'vendor/fontawesome-free/css/fontawesome*',
+        'vendor/fontawesome-free/css/regular*',
+        'vendor/fontawesome-free/css/solid*',
+        'vendor/fontawesome-free/css/svg-with-js*',
+        'vendor/fontawesome-free/css/v4-shims*',
+    ]
@@ -0,0 +1,66 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .models import ArchivedInvoice, ArchivedInvoiceDetail, Invoice, InvoiceDetail
+from .tenants import tenant_db
+
+INVOICE_FIELDS = (
+    "id", "number", "date", "customer", "customer_ref_id", "contact", "email", "comments", "total", "inter_state",
+    "tax_total", "updated_at",
+)
+LINE_FIELDS = (
+    "id", "invoice_id", "product_id", "product_name", "amount", "cost_price", "selling_price", "hsn_code", "tax_rate",
+    "tax_amount", "updated_at",
+)
+
+
+def fiscal_year_start(year):
+    """First day of fiscal year `year` (FY 2024 starts in 2024)"""
+    month = getattr(settings, "INVOICE_FISCAL_YEAR_START_MONTH", 4)
+    return datetime.date(year, month, 1)
+
+
+def current_fiscal_year(today=None):
+    today = today or timezone.localdate()
+    return today.year if today >= fiscal_year_start(today.year) else today.year - 1
+
+
+def archive_before(cutoff, batch_size=1000, progress=None):
+    """Move invoices dated before cutoff, with their lines, into the archive tables.
+
+    Each batch is copied and deleted in its own transaction so writers are only
+    blocked briefly. The sales rollups are left untouched.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic(using=tenant_db()):
+            ids = list(
+                Invoice.objects.filter(date__lt=cutoff).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            invoices = Invoice.objects.filter(id__in=ids).values(*INVOICE_FIELDS)
+            lines = InvoiceDetail.objects.filter(invoice_id__in=ids).values(*LINE_FIELDS)
+            ArchivedInvoice.objects.bulk_create([ArchivedInvoice(**row) for row in invoices])
+            ArchivedInvoiceDetail.objects.bulk_create([ArchivedInvoiceDetail(**row) for row in lines])
+            InvoiceDetail.objects.filter(invoice_id__in=ids).delete()
+            Invoice.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+        if progress:
+            progress(moved)
+    return moved
+
+
+def get_invoice_with_lines(pk):
+    """Hot invoice or, failing that, its archived copy; returns (invoice, lines, archived)"""
+    invoice = Invoice.objects.filter(pk=pk).first()
+    if invoice is not None:
+        return invoice, InvoiceDetail.objects.filter(invoice=invoice), False
+    invoice = ArchivedInvoice.objects.filter(pk=pk).first()
+    if invoice is not None:
+        return invoice, ArchivedInvoiceDetail.objects.filter(invoice=invoice), True
+    raise Http404("No invoice matches the given query.")
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return "invoice_auth_user:%s" % user_id
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps logged-in users in the cache, so most requests skip the user SELECT.
+
+    Saving a user drops the cached copy (see forget_user). With a per-process
+    cache, other workers can serve the old copy for up to INVOICE_USER_CACHE_SECONDS.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, getattr(settings, "INVOICE_USER_CACHE_SECONDS", 60))
+        return user
+
+
+def forget_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
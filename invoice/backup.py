@@ -0,0 +1,314 @@
+"""Online backups of the SQLite database.
+
+A backup is a consistent snapshot taken through SQLite's backup API, stored
+as fixed-size zlib-compressed chunks named by their SHA-256 plus a JSON
+manifest listing them in order. Chunks already stored by an earlier backup
+are not written again, so each backup only adds the parts of the file that
+changed since.
+
+    <backup dir>/chunks/ab/ab12...ef.z
+    <backup dir>/backup-20250101-020000-123456.json
+"""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connections
+
+from .tenants import current_tenant, tenant_db
+
+MANIFEST_PREFIX = "backup-"
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    pass
+
+
+def database_path(alias=None):
+    connection = connections[alias or tenant_db()]
+    if connection.vendor != "sqlite" or connection.is_in_memory_db():
+        raise BackupError("Only SQLite database files can be backed up with these commands.")
+    return str(connection.settings_dict["NAME"])
+
+
+def backup_dir():
+    """Where backups are kept; a tenant's go in a subdirectory named after it"""
+    directory = str(getattr(settings, "INVOICE_BACKUP_DIR", os.path.join(settings.BASE_DIR, "backups")))
+    tenant = current_tenant()
+    return os.path.join(directory, tenant) if tenant else directory
+
+
+def enable_wal(sender, using="default", **kwargs):
+    """post_migrate receiver: switch a file database to WAL, so a backup reading a
+    snapshot never blocks writers (and readers never block them either).
+
+    The journal mode is stored in the database file, so this sticks.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite" or connection.is_in_memory_db():
+        return
+    if getattr(settings, "INVOICE_SQLITE_WAL", True):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+
+def _table_counts(conn):
+    tables = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' ORDER BY name"
+    )]
+    return {table: conn.execute('SELECT COUNT(*) FROM "%s"' % table).fetchone()[0] for table in tables}
+
+
+def _chunk_path(directory, digest):
+    return os.path.join(directory, "chunks", digest[:2], digest + ".z")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# -------------------
+# Backup
+# -------------------
+def snapshot(source_path, target_path, pages=1024, sleep=0.005, progress=None):
+    """Copy a consistent snapshot of source_path to target_path with the backup API.
+
+    The copy runs inside one read transaction on the source, so pages written
+    by other connections meanwhile never restart it. It goes `pages` pages per
+    step with `sleep` seconds between steps. In WAL mode writers are not
+    blocked at all. In rollback-journal mode they wait until the copy ends.
+    Returns (row counts per table, the source's journal mode).
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    source = sqlite3.connect(source_path, isolation_level=None, timeout=20)
+    target = sqlite3.connect(target_path)
+    try:
+        journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0]
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # Pins the snapshot
+        source.backup(
+            target, pages=pages, sleep=sleep,
+            progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None,
+        )
+        source.execute("COMMIT")
+        # The copy does not need a journal of its own
+        target.execute("PRAGMA journal_mode=DELETE")
+        return _table_counts(target), journal_mode
+    finally:
+        target.close()
+        source.close()
+
+
+def store_chunks(path, directory, chunk_size=CHUNK_SIZE, level=1, progress=None):
+    """Split a file into compressed chunks, skipping ones already stored; returns (digests, new, bytes written)"""
+    digests, new, written = [], 0, 0
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            digest = hashlib.sha256(data).hexdigest()
+            chunk = _chunk_path(directory, digest)
+            if not os.path.exists(chunk):
+                compressed = zlib.compress(data, level)
+                _write_atomic(chunk, compressed)
+                new += 1
+                written += len(compressed)
+            digests.append(digest)
+            if progress:
+                progress(min(len(digests) * chunk_size, size), size)
+    return digests, new, written
+
+
+def backup_database(directory=None, source_path=None, alias=None, pages=1024, sleep=0.005,
+                    chunk_size=CHUNK_SIZE, level=1, progress=None):
+    """Back up the database (the active tenant's, or the SQLite file at source_path) into `directory`.
+
+    Returns the manifest, which is also written next to the chunks.
+    """
+    directory = directory or backup_dir()
+    if source_path is None:
+        alias = alias or tenant_db()
+        source_path = database_path(alias)
+        connections[alias].close()  # Nothing of ours holds a transaction open meanwhile
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    created = datetime.datetime.now(datetime.timezone.utc)
+    snapshot_path = os.path.join(directory, ".snapshot.sqlite3")
+    try:
+        tables, journal_mode = snapshot(
+            source_path, snapshot_path, pages=pages, sleep=sleep,
+            progress=(lambda done, total: progress("copy", done, total)) if progress else None,
+        )
+        snapshot_seconds = time.perf_counter() - started
+        digests, new, written = store_chunks(
+            snapshot_path, directory, chunk_size=chunk_size, level=level,
+            progress=(lambda done, total: progress("store", done, total)) if progress else None,
+        )
+        size = os.path.getsize(snapshot_path)
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+    manifest = {
+        "name": MANIFEST_PREFIX + created.strftime("%Y%m%d-%H%M%S-%f"),
+        "created_at": created.isoformat(),
+        "source": source_path,
+        "size": size,
+        "chunk_size": chunk_size,
+        "chunks": digests,
+        "new_chunks": new,
+        "bytes_written": written,
+        "tables": tables,
+        "journal_mode": journal_mode,
+        "snapshot_seconds": round(snapshot_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    _write_atomic(os.path.join(directory, manifest["name"] + ".json"), json.dumps(manifest, indent=1).encode())
+    return manifest
+
+
+def list_backups(directory=None):
+    """Manifest names in a backup directory, oldest first"""
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name[:-len(".json")] for name in os.listdir(directory)
+        if name.startswith(MANIFEST_PREFIX) and name.endswith(".json")
+    )
+
+
+def load_manifest(name=None, directory=None):
+    """A backup's manifest by name, or the latest one"""
+    directory = directory or backup_dir()
+    names = list_backups(directory)
+    if not names:
+        raise BackupError("No backups in %s." % directory)
+    name = name or names[-1]
+    if name.endswith(".json"):
+        name = name[:-len(".json")]
+    if name not in names:
+        raise BackupError("No backup named %s in %s." % (name, directory))
+    with open(os.path.join(directory, name + ".json")) as f:
+        return json.load(f)
+
+
+def prune(keep, directory=None):
+    """Delete all but the newest `keep` backups and the chunks only they used; returns the names removed"""
+    directory = directory or backup_dir()
+    names = list_backups(directory)
+    removed = names[:-keep] if keep else names
+    for name in removed:
+        os.remove(os.path.join(directory, name + ".json"))
+    in_use = set()
+    for name in list_backups(directory):
+        in_use.update(load_manifest(name, directory)["chunks"])
+    chunks_root = os.path.join(directory, "chunks")
+    for root, _, files in os.walk(chunks_root):
+        for filename in files:
+            if filename[:-len(".z")] not in in_use:
+                os.remove(os.path.join(root, filename))
+    return removed
+
+
+# -------------------
+# Restore and verify
+# -------------------
+def assemble(manifest, target_path, directory=None, progress=None):
+    """Rebuild the database file of a backup at target_path, checking every chunk's hash"""
+    directory = directory or backup_dir()
+    with open(target_path, "wb") as out:
+        for index, digest in enumerate(manifest["chunks"], 1):
+            try:
+                with open(_chunk_path(directory, digest), "rb") as f:
+                    data = zlib.decompress(f.read())
+            except (OSError, zlib.error) as error:
+                raise BackupError("Chunk %s of %s is unreadable: %s" % (digest, manifest["name"], error))
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise BackupError("Chunk %s of %s is corrupt." % (digest, manifest["name"]))
+            out.write(data)
+            if progress:
+                progress(index, len(manifest["chunks"]))
+    if os.path.getsize(target_path) != manifest["size"]:
+        raise BackupError("%s restored to %d bytes, expected %d." % (
+            manifest["name"], os.path.getsize(target_path), manifest["size"]))
+
+
+def check_database(path, manifest):
+    """Problems found in a restored file: integrity_check errors and table counts that differ"""
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check") if row[0] != "ok"]
+        counts = _table_counts(conn)
+    finally:
+        conn.close()
+    for table, expected in manifest["tables"].items():
+        if counts.get(table) != expected:
+            problems.append("%s has %s rows, the backup recorded %d" % (table, counts.get(table), expected))
+    return problems
+
+
+def verify_backup(name=None, directory=None, progress=None):
+    """Restore a backup to a scratch file and check it; returns a list of problems (empty if sound)"""
+    directory = directory or backup_dir()
+    manifest = load_manifest(name, directory)
+    scratch = os.path.join(directory, ".verify.sqlite3")
+    try:
+        assemble(manifest, scratch, directory, progress)
+        return check_database(scratch, manifest)
+    except BackupError as error:
+        return [str(error)]
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+
+
+def restore_database(name=None, directory=None, target_path=None, alias=None, progress=None):
+    """Restore a backup over the database (or to target_path); returns the manifest restored.
+
+    The file is rebuilt and checked beside the target first. An existing
+    database is then overwritten through the backup API, which takes SQLite's
+    locks, so processes that still have it open see the restored contents
+    rather than a half-copied file.
+    """
+    directory = directory or backup_dir()
+    manifest = load_manifest(name, directory)
+    if target_path is None:
+        alias = alias or tenant_db()
+        target_path = database_path(alias)
+        connections[alias].close()
+    staging = target_path + ".restore"
+    try:
+        assemble(manifest, staging, directory, progress)
+        problems = check_database(staging, manifest)
+        if problems:
+            raise BackupError("%s failed verification: %s" % (manifest["name"], "; ".join(problems[:5])))
+        if not os.path.exists(target_path):
+            os.replace(staging, target_path)
+            return manifest
+        source = sqlite3.connect(staging)
+        target = sqlite3.connect(target_path, timeout=60)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+    return manifest
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DO_NOTHING
+from django.db.models.signals import post_delete, pre_delete
+
+from .models import Invoice, InvoiceDetail, SearchEntry, Tombstone
+from .rollups import reverse_lines_sales
+from .stock import reverse_lines_stock
+from .tenants import tenant_db
+
+LINE_FIELDS = ("id", "invoice_id", "product_id", "amount", "cost_price", "selling_price")
+
+
+def default_batch_size():
+    return getattr(settings, "INVOICE_BULK_DELETE_BATCH_SIZE", 1000)
+
+
+def filter_invoices(date_from=None, date_to=None, customer=""):
+    """Live invoices dated between date_from and date_to (inclusive) whose customer contains `customer`"""
+    invoices = Invoice.objects.all()
+    if date_from:
+        invoices = invoices.filter(date__gte=date_from)
+    if date_to:
+        invoices = invoices.filter(date__lte=date_to)
+    if customer:
+        invoices = invoices.filter(customer__icontains=customer)
+    return invoices
+
+
+def _can_raw_delete(model, cleared=()):
+    """True when deleting model rows needs nothing from Django: no delete signal
+    receivers, and every foreign key to it is DO_NOTHING or comes from a model in
+    `cleared` (whose rows pointing here were deleted first)"""
+    if pre_delete.has_listeners(model) or post_delete.has_listeners(model):
+        return False
+    return all(rel.on_delete is DO_NOTHING or rel.related_model in cleared for rel in model._meta.related_objects)
+
+
+def _delete(queryset, cleared=()):
+    if _can_raw_delete(queryset.model, cleared):
+        # One DELETE ... WHERE, without loading the rows first
+        return queryset._raw_delete(queryset.db)
+    return queryset.delete()[0]
+
+
+def delete_invoices(invoices, batch_size=None, limit=None, progress=None):
+    """Delete a queryset of invoices with their lines, in id order, one transaction per batch.
+
+    Each batch takes its lines out of the sales rollups and puts them back
+    into stock, leaves tombstones for delta exports and drops the search
+    entries, exactly as deleting the invoices one by one would. Stops after
+    `limit` invoices if given; returns the number deleted.
+    """
+    batch_size = batch_size or default_batch_size()
+    total = invoices.count() if progress else None
+    deleted = 0
+    last = 0
+    while limit is None or deleted < limit:
+        size = batch_size if limit is None else min(batch_size, limit - deleted)
+        with transaction.atomic(using=tenant_db()):
+            dates = dict(invoices.filter(pk__gt=last).order_by("pk").values_list("pk", "date")[:size])
+            if not dates:
+                break
+            ids = list(dates)
+            lines = list(InvoiceDetail.objects.filter(invoice_id__in=ids).only(*LINE_FIELDS))
+            reverse_lines_sales(lines, dates)
+            reverse_lines_stock(lines, note="Bulk delete of %d invoices" % len(ids))
+            Tombstone.record(InvoiceDetail, [line.pk for line in lines])
+            Tombstone.record(Invoice, ids)
+            _delete(SearchEntry.objects.filter(kind=SearchEntry.INVOICE, object_id__in=ids))
+            _delete(InvoiceDetail.objects.filter(invoice_id__in=ids))
+            _delete(Invoice.objects.filter(pk__in=ids), cleared=(InvoiceDetail,))
+        deleted += len(ids)
+        last = ids[-1]
+        if progress:
+            progress(deleted, total)
+    return deleted
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Sum, Window
+from django.utils.functional import cached_property
+
+from .models import ArchivedInvoice, Invoice, Product
+from .tenants import current_tenant
+
+DETAIL_FRAGMENT = "invoice_detail"
+
+
+def version_of(updated_at, archived=False):
+    prefix = "a" if archived else "h"
+    return "%s%d" % (prefix, int(updated_at.timestamp() * 1000000))
+
+
+def invoice_version(invoice, archived=False):
+    """Changes whenever the invoice is saved (updated_at is auto_now)"""
+    return version_of(invoice.updated_at, archived)
+
+
+def invoice_stamp(pk):
+    """(updated_at, archived) for invoice pk, reading only that column; (None, False) if missing"""
+    for model, archived in ((Invoice, False), (ArchivedInvoice, True)):
+        updated_at = model.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+        if updated_at is not None:
+            return updated_at, archived
+    return None, False
+
+
+def _product_version(field, using=None):
+    stamp = Product.all_objects.using(using).aggregate(latest=Max(field), count=Count("id"))
+    if stamp["latest"] is None:
+        return "empty"
+    return "%s-%d" % (version_of(stamp["latest"]), stamp["count"])
+
+
+def catalogue_version(using=None):
+    """Changes whenever a product is added, edited, soft- or hard-deleted, but not when its stock moves"""
+    return _product_version("catalogue_updated_at", using)
+
+
+def product_list_version(using=None):
+    """catalogue_version() that also changes with stock on hand"""
+    return _product_version("updated_at", using)
+
+
+def detail_fragment_key(invoice, archived=False):
+    # Tenants share the cache, and their invoice ids overlap
+    return make_template_fragment_key(
+        DETAIL_FRAGMENT, [current_tenant() or "", invoice.pk, invoice_version(invoice, archived)],
+    )
+
+
+def invalidate_invoice_detail(invoice, archived=False):
+    cache.delete(detail_fragment_key(invoice, archived))
+
+
+class InvoiceLineSummary:
+    """Invoice lines with line totals and both invoice sums computed by the database.
+
+    The query runs on first access, so a cached fragment never triggers it.
+    """
+
+    def __init__(self, lines):
+        line_total = ExpressionWrapper(F("selling_price") * F("amount"), output_field=FloatField())
+        line_profit = ExpressionWrapper(
+            (F("selling_price") - F("cost_price")) * F("amount"), output_field=FloatField()
+        )
+        self.lines = lines.annotate(
+            line_total=line_total,
+            line_profit=line_profit,
+            sales_sum=Window(Sum(line_total)),
+            profit_sum=Window(Sum(line_profit)),
+        ).order_by("id")
+
+    @cached_property
+    def rows(self):
+        return list(self.lines)
+
+    @property
+    def total_sales(self):
+        return self.rows[0].sales_sum if self.rows else 0
+
+    @property
+    def total_profit(self):
+        return self.rows[0].profit_sum if self.rows else 0
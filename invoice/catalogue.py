@@ -0,0 +1,149 @@
+"""In-process snapshot of the product catalogue, used to validate and price invoice lines.
+
+Each worker keeps every product of the databases it serves as parallel arrays
+ordered by id: ids, cost and selling prices, GST rates, a deleted flag, names,
+units and HSN codes.
+Finding a product is a binary search over the ids, with no query.
+
+A snapshot is labelled with the version key it was built under. The key
+lives in the cache. Saving or deleting a product replaces it, and the next
+lookup in any worker sharing that cache rebuilds the snapshot. With a
+per-process cache, other workers pick up the change when their copy of the
+key expires after INVOICE_CATALOGUE_VERSION_SECONDS and is read again from
+the product table.
+"""
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import catalogue_version
+from .models import Product
+from .tenants import tenant_db
+
+# alias -> Catalogue; replaced whole, never changed in place
+_snapshots = {}
+_build_lock = threading.Lock()
+
+
+def _version_seconds():
+    return getattr(settings, "INVOICE_CATALOGUE_VERSION_SECONDS", 5)
+
+
+def version_key(alias):
+    return "invoice_catalogue_version:%s" % alias
+
+
+class Catalogue:
+    """Every product of one database, soft-deleted ones included"""
+
+    __slots__ = (
+        "version", "alias", "ids", "cost_prices", "selling_prices", "gst_rates", "deleted", "names", "units",
+        "hsn_codes",
+    )
+
+    def __init__(self, version, alias, rows):
+        """rows: (id, name, unit, cost price, selling price, is deleted, HSN code, GST rate), ordered by id"""
+        self.version = version
+        self.alias = alias
+        self.ids = array("q")
+        self.cost_prices = array("d")
+        self.selling_prices = array("d")
+        self.gst_rates = array("d")
+        self.deleted = bytearray()
+        names, units, hsn_codes = [], [], []
+        for pk, name, unit, cost_price, selling_price, is_deleted, hsn_code, gst_rate in rows:
+            self.ids.append(pk)
+            names.append(name)
+            units.append(unit)
+            hsn_codes.append(hsn_code)
+            self.cost_prices.append(cost_price)
+            self.selling_prices.append(selling_price)
+            self.gst_rates.append(gst_rate)
+            self.deleted.append(is_deleted)
+        self.names = tuple(names)
+        self.units = tuple(units)
+        self.hsn_codes = tuple(hsn_codes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _index(self, pk):
+        index = bisect_left(self.ids, pk)
+        if index < len(self.ids) and self.ids[index] == pk:
+            return index
+        return None
+
+    def product(self, pk, include_deleted=False):
+        """A Product for pk filled in from the snapshot, or None if there is no such (live) product.
+
+        It carries the catalogue fields only: use it to read prices and rates and to
+        assign to foreign keys, never to save.
+        """
+        index = self._index(pk)
+        if index is None or (self.deleted[index] and not include_deleted):
+            return None
+        product = Product(
+            id=pk,
+            product_name=self.names[index],
+            product_unit=self.units[index],
+            cost_price=self.cost_prices[index],
+            selling_price=self.selling_prices[index],
+            hsn_code=self.hsn_codes[index],
+            gst_rate=self.gst_rates[index],
+            product_is_delete=bool(self.deleted[index]),
+        )
+        product._state.adding = False
+        product._state.db = self.alias
+        return product
+
+    def choices(self):
+        """(id, name) of every live product, in id order"""
+        return [(pk, name) for pk, name, deleted in zip(self.ids, self.names, self.deleted) if not deleted]
+
+
+def get_catalogue():
+    """The current snapshot for the active database, rebuilt if its version key has moved on"""
+    alias = tenant_db()
+    key = version_key(alias)
+    version = cache.get(key)
+    if version is None:
+        version = catalogue_version(using=alias)
+        # add(), so a replacement written meanwhile by a product save wins
+        if not cache.add(key, version, _version_seconds()):
+            version = cache.get(key, version)
+    snapshot = _snapshots.get(alias)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _build_lock:
+        snapshot = _snapshots.get(alias)
+        if snapshot is None or snapshot.version != version:
+            rows = Product.all_objects.using(alias).order_by("pk").values_list(
+                "pk", "product_name", "product_unit", "cost_price", "selling_price", "product_is_delete",
+                "hsn_code", "gst_rate",
+            )
+            snapshot = _snapshots[alias] = Catalogue(version, alias, rows.iterator(chunk_size=5000))
+    return snapshot
+
+
+def bump_catalogue(alias=None):
+    """Give the catalogue a new version key, so every snapshot of it is rebuilt"""
+    cache.set(version_key(alias or tenant_db()), uuid.uuid4().hex, _version_seconds())
+
+
+def product_changed(sender, instance, using, **kwargs):
+    """post_save/post_delete receiver for Product.
+
+    Bumps now, so this connection's next lookup sees its own write, and again
+    after commit, so no worker keeps a snapshot read before the commit.
+    """
+    bump_catalogue(using)
+    transaction.on_commit(lambda: bump_catalogue(using), using=using)
+
+
+def clear():
+    _snapshots.clear()
@@ -0,0 +1,79 @@
+import hashlib
+import re
+
+from django.http import HttpResponse
+from django.utils.http import http_date, quote_etag
+
+from .caching import invoice_stamp, product_list_version, version_of
+from .context_processors import dashboard_stats
+
+# A single byte range; multi-range requests are answered with the whole body
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def page_etag(request, version):
+    """ETag for an HTML page: the data version plus everything the shared layout shows"""
+    stats = dashboard_stats(request)
+    parts = [
+        version, request.user.pk, request.user.username,
+        stats["total_product"], stats["total_invoice"], stats["total_income"],
+    ]
+    return hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def invoice_page_etag(request, pk):
+    updated_at, archived = invoice_stamp(pk)
+    if updated_at is None:
+        return None  # Let the view raise its 404
+    return page_etag(request, version_of(updated_at, archived))
+
+
+def invoice_pdf_etag(request, pk):
+    updated_at, archived = invoice_stamp(pk)
+    return version_of(updated_at, archived) if updated_at else None
+
+
+def invoice_last_modified(request, pk):
+    return invoice_stamp(pk)[0]
+
+
+def product_list_etag(request):
+    return page_etag(request, product_list_version())
+
+
+def ranged_response(request, content, content_type, etag=None, last_modified=None):
+    """HttpResponse for content that honours a single-range Range header (206/416).
+
+    A range that does not parse, or ends before it starts, is ignored and the
+    whole body is sent, as RFC 9110 asks; only one starting past the end is 416.
+    """
+    size = len(content)
+    header = request.headers.get("Range", "")
+    match = _BYTE_RANGE.match(header.strip()) if request.method == "GET" else None
+
+    # If-Range: only resume when the client still has this version
+    if_range = request.headers.get("If-Range")
+    if match and if_range:
+        current = {quote_etag(etag) if etag else None, http_date(last_modified.timestamp()) if last_modified else None}
+        if if_range.strip() not in current:
+            match = None
+
+    if match and match.group(1) and match.group(2) and int(match.group(1)) > int(match.group(2)):
+        match = None  # bytes=10-5
+
+    if not match or not any(match.groups()):
+        response = HttpResponse(content, content_type=content_type)
+    else:
+        first, last = match.groups()
+        if not first:  # Suffix range: the final N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+        else:
+            response = HttpResponse(content[start:end + 1], content_type=content_type, status=206)
+            response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -1,18 +1,29 @@
-from .models import Product, Invoice, InvoiceDetail
-from django.db.models import Sum, F, FloatField
+from .models import Product, Invoice, ArchivedInvoice, ProductDailySales
+from django.db.models import Sum
+from .tenants import current_tenant, tenants
 
 def dashboard_stats(request):
+    # Conditional GETs compute these for the ETag first; reuse them
+    if hasattr(request, "_dashboard_stats"):
+        return request._dashboard_stats
+
     total_product = Product.objects.count()
-    total_invoice = Invoice.objects.count()
+    total_invoice = Invoice.objects.count() + ArchivedInvoice.objects.count()
     
-    # Calculate total income using aggregation for better performance
-    total_income_data = InvoiceDetail.objects.aggregate(
-        total=Sum(F('selling_price') * F('amount'), output_field=FloatField())
+    # Income comes from the daily rollup, which also covers archived invoices
+    total_income_data = ProductDailySales.objects.aggregate(
+        total=Sum('revenue')
     )
     total_income = total_income_data['total'] or 0
     
-    return {
+    request._dashboard_stats = {
         "total_product": total_product,
         "total_invoice": total_invoice,
         "total_income": total_income,
     }
+    return request._dashboard_stats
+
+
+def tenancy(request):
+    # "tenant" also keys cached fragments, so shops never see each other's
+    return {"tenant": current_tenant() or "", "tenants_enabled": bool(tenants())}
@@ -0,0 +1,161 @@
+import csv
+from itertools import islice
+
+from django.db.models import F, FloatField, ExpressionWrapper
+
+from .models import Invoice, InvoiceDetail, Tombstone
+
+EXPORT_FORMATS = ("csv", "xlsx", "parquet")
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (header, queryset field) for every exported line
+LINE_COLUMNS = [
+    ("Line ID", "id"),
+    ("Invoice ID", "invoice_id"),
+    ("Date", "invoice__date"),
+    ("Customer", "invoice__customer"),
+    ("Contact", "invoice__contact"),
+    ("Email", "invoice__email"),
+    ("Product ID", "product_id"),
+    ("Product", "product_name"),
+    ("Unit", "product__product_unit"),
+    ("Amount", "amount"),
+    ("Cost Price", "cost_price"),
+    ("Selling Price", "selling_price"),
+    ("HSN", "hsn_code"),
+    ("GST Rate", "tax_rate"),
+    ("Tax", "tax_amount"),
+    ("Total", "line_total"),
+    ("Profit", "line_profit"),
+]
+
+HEADERS = [header for header, _ in LINE_COLUMNS]
+
+
+def line_rows(chunk_size=2000):
+    """Every invoice line joined with its invoice and product, read through a chunked cursor"""
+    queryset = InvoiceDetail.objects.filter(invoice__isnull=False).annotate(
+        line_total=ExpressionWrapper(F("selling_price") * F("amount"), output_field=FloatField()),
+        line_profit=ExpressionWrapper(
+            (F("selling_price") - F("cost_price")) * F("amount"), output_field=FloatField()
+        ),
+    ).order_by("id").values_list(*[field for _, field in LINE_COLUMNS])
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def line_chunks(chunk_size=2000):
+    """The export rows grouped into lists of at most chunk_size"""
+    rows = line_rows(chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Echo:
+    """File-like object whose write() hands the value back, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(chunk_size=2000):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADERS)
+    for chunk in line_chunks(chunk_size):
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def write_csv(fileobj, chunk_size=2000):
+    for part in stream_csv(chunk_size):
+        fileobj.write(part)
+
+
+def write_xlsx(fileobj, chunk_size=2000):
+    """Write an xlsx with openpyxl's write-only mode so rows are not kept in memory"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Invoice lines")
+    sheet.append(HEADERS)
+    for chunk in line_chunks(chunk_size):
+        for row in chunk:
+            sheet.append(row)
+    workbook.save(fileobj)
+
+
+def write_parquet(fileobj, chunk_size=2000):
+    """Write a Parquet file with one row group per chunk (needs pyarrow)"""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("Line ID", pa.int64()),
+        ("Invoice ID", pa.int64()),
+        ("Date", pa.date32()),
+        ("Customer", pa.string()),
+        ("Contact", pa.string()),
+        ("Email", pa.string()),
+        ("Product ID", pa.int64()),
+        ("Product", pa.string()),
+        ("Unit", pa.string()),
+        ("Amount", pa.int64()),
+        ("Cost Price", pa.float64()),
+        ("Selling Price", pa.float64()),
+        ("HSN", pa.string()),
+        ("GST Rate", pa.float64()),
+        ("Tax", pa.float64()),
+        ("Total", pa.float64()),
+        ("Profit", pa.float64()),
+    ])
+    with pq.ParquetWriter(fileobj, schema, compression="snappy") as writer:
+        written = False
+        for chunk in line_chunks(chunk_size):
+            frame = pd.DataFrame.from_records(chunk, columns=HEADERS)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            written = True
+        if not written:
+            writer.write_table(schema.empty_table())
+
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "parquet": write_parquet,
+}
+
+
+# Fields returned by the delta export
+DELTA_INVOICE_FIELDS = (
+    "id", "date", "customer", "contact", "email", "comments", "total", "inter_state", "tax_total", "updated_at",
+)
+DELTA_LINE_FIELDS = (
+    "id", "invoice_id", "product_id", "amount", "cost_price", "selling_price", "hsn_code", "tax_rate", "tax_amount",
+    "updated_at",
+)
+
+
+def delta_since(since, until):
+    """Invoices and lines changed, and ids deleted, in the window (since, until]"""
+    changed = {"updated_at__lte": until}
+    deleted = {"deleted_at__lte": until}
+    if since is not None:
+        changed["updated_at__gt"] = since
+        deleted["deleted_at__gt"] = since
+
+    tombstones = {"invoice": [], "invoicedetail": []}
+    for model_name, object_id in Tombstone.objects.filter(**deleted).values_list("model_name", "object_id"):
+        tombstones.setdefault(model_name, []).append(object_id)
+
+    return {
+        "invoices": list(Invoice.objects.filter(**changed).order_by("id").values(*DELTA_INVOICE_FIELDS)),
+        "lines": list(InvoiceDetail.objects.filter(**changed).order_by("id").values(*DELTA_LINE_FIELDS)),
+        "deleted": tombstones,
+    }
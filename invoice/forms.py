@@ -1,9 +1,17 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.forms import formset_factory
-from .models import Product, Invoice, InvoiceDetail
+from .catalogue import get_catalogue
+from .models import Product, Customer, Invoice, InvoiceDetail, StockMovement
 
 
 class ProductForm(forms.ModelForm):
+    # Optional: a product without a rate is exempt
+    gst_rate = forms.TypedChoiceField(
+        choices=Product.GST_RATES, coerce=float, required=False, empty_value=0.0, initial=0.0,
+        widget=forms.Select(attrs={'class': 'form-control', 'id': 'gst_rate'}),
+    )
+
     class Meta:
         model = Product
         fields = [
@@ -11,6 +19,8 @@ class ProductForm(forms.ModelForm):
             'cost_price',
             'selling_price',
             'product_unit',
+            'hsn_code',
+            'gst_rate',
         ]
         widgets = {
             'product_name': forms.TextInput(attrs={
@@ -35,8 +45,73 @@ class ProductForm(forms.ModelForm):
                 'id': 'product_unit',
                 'placeholder': 'Enter unit of the product',
             }),
+            'hsn_code': forms.TextInput(attrs={
+                'class': 'form-control',
+                'id': 'hsn_code',
+                'placeholder': 'Enter HSN or SAC code',
+            }),
+        }
+
+
+class StockAdjustmentForm(forms.Form):
+    reason = forms.ChoiceField(
+        choices=[(StockMovement.RECEIPT, "Stock received"), (StockMovement.ADJUSTMENT, "Adjustment")],
+        widget=forms.Select(attrs={'class': 'form-control', 'id': 'stock_reason'}),
+    )
+    quantity = forms.IntegerField(widget=forms.NumberInput(attrs={
+        'class': 'form-control',
+        'id': 'stock_quantity',
+        'placeholder': 'Units in (negative for units out)',
+    }))
+    note = forms.CharField(max_length=255, required=False, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'id': 'stock_note',
+        'placeholder': 'Supplier, stock count, ...',
+    }))
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data['quantity']
+        if quantity == 0:
+            raise forms.ValidationError("Enter a non-zero quantity.")
+        return quantity
+
+
+class CustomerForm(forms.ModelForm):
+    class Meta:
+        model = Customer
+        fields = [
+            'customer_name',
+            'contact',
+            'email',
+        ]
+        widgets = {
+            'customer_name': forms.TextInput(attrs={
+                'class': 'form-control',
+                'id': 'customer_name',
+                'placeholder': 'Enter name of the customer',
+            }),
+            'contact': forms.TextInput(attrs={
+                'class': 'form-control',
+                'id': 'customer_contact',
+                'placeholder': 'Enter contact of the customer',
+            }),
+            'email': forms.EmailInput(attrs={
+                'class': 'form-control',
+                'id': 'customer_email',
+                'placeholder': 'Enter email of the customer',
+            }),
         }
 
+    def clean_customer_name(self):
+        name = self.cleaned_data['customer_name']
+        key = Customer.normalize_key(name)
+        duplicates = Customer.objects.filter(customer_key=key)
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise forms.ValidationError("A customer with this name already exists.")
+        return name
+
 
 class InvoiceForm(forms.ModelForm):
     class Meta:
@@ -46,6 +121,7 @@ class InvoiceForm(forms.ModelForm):
             'comments',
             'contact',
             'email',
+            'inter_state',
         ]
         widgets = {
             'customer': forms.TextInput(attrs={
@@ -68,10 +144,101 @@ class InvoiceForm(forms.ModelForm):
                 'id': 'invoice_comments',
                 'placeholder': 'Enter comments',
             }),
+            'inter_state': forms.CheckboxInput(attrs={
+                'id': 'invoice_inter_state',
+            }),
         }
 
 
+class InvoiceBulkDeleteForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={
+        'class': 'form-control',
+        'id': 'bulk_date_from',
+        'type': 'date',
+    }))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={
+        'class': 'form-control',
+        'id': 'bulk_date_to',
+        'type': 'date',
+    }))
+    customer = forms.CharField(max_length=255, required=False, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'id': 'bulk_customer',
+        'placeholder': 'Customer name contains',
+    }))
+    all_invoices = forms.BooleanField(required=False, label="All invoices", widget=forms.CheckboxInput(attrs={
+        'id': 'bulk_all_invoices',
+    }))
+    # Invoices deleted by earlier rounds, carried along for the progress bar
+    deleted = forms.IntegerField(min_value=0, required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        filters = self.filters()
+        if not any(filters.values()) and not cleaned_data.get('all_invoices'):
+            raise forms.ValidationError("Pick a date range or customer, or tick \"All invoices\".")
+        return cleaned_data
+
+    def filters(self):
+        return {name: self.cleaned_data.get(name) for name in ('date_from', 'date_to', 'customer')}
+
+
+class CatalogueProductField(forms.ChoiceField):
+    """Choice of a live product, listed and looked up in the in-process catalogue instead of queried.
+
+    Cleans to a Product carrying the catalogue's name, unit and prices. Products
+    passed to keep() are offered and accepted even once soft-deleted, so editing
+    an invoice does not drop its lines for them.
+    """
+    default_error_messages = {
+        'invalid_choice': 'Select a valid choice. That choice is not one of the available choices.',
+    }
+
+    def __init__(self, **kwargs):
+        self.kept_ids = frozenset()
+        super().__init__(choices=self.catalogue_choices, **kwargs)
+
+    def keep(self, product_ids):
+        self.kept_ids = frozenset(pk for pk in product_ids if pk is not None)
+        # Rebind, as the choices of a form's copy of the field still call the original field
+        self.choices = self.catalogue_choices
+
+    def catalogue_choices(self):
+        catalogue = get_catalogue()
+        choices = [('', '---------')] + catalogue.choices()
+        for pk in sorted(self.kept_ids):
+            product = catalogue.product(pk, include_deleted=True)
+            if product is not None and product.product_is_delete:
+                choices.append((pk, "%s (deleted)" % product.product_name))
+        return choices
+
+    def prepare_value(self, value):
+        # Initial data may hold a Product
+        return getattr(value, 'pk', value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            pk = int(value)
+            product = get_catalogue().product(pk, include_deleted=pk in self.kept_ids)
+        except (TypeError, ValueError):
+            product = None
+        if product is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return product
+
+    def validate(self, value):
+        # to_python() has already matched the value against the catalogue
+        forms.Field.validate(self, value)
+
+
 class InvoiceDetailForm(forms.ModelForm):
+    product = CatalogueProductField(required=False, widget=forms.Select(attrs={
+        'class': 'form-control',
+        'id': 'invoice_detail_product',
+    }))
+
     class Meta:
         model = InvoiceDetail
         fields = [
@@ -79,10 +246,6 @@ class InvoiceDetailForm(forms.ModelForm):
             'amount',
         ]
         widgets = {
-            'product': forms.Select(attrs={
-                'class': 'form-control',
-                'id': 'invoice_detail_product',
-            }),
             'amount': forms.TextInput(attrs={
                 'class': 'form-control',
                 'id': 'invoice_detail_amount',
@@ -91,6 +254,17 @@ class InvoiceDetailForm(forms.ModelForm):
             })
         }
 
+    def __init__(self, *args, kept_products=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if kept_products:
+            self.fields['product'].keep(kept_products)
+
+    def _get_validation_exclusions(self):
+        # The model's foreign key check would query for the product the catalogue just found
+        exclude = super()._get_validation_exclusions()
+        exclude.add('product')
+        return exclude
+
 
 class excelUploadForm(forms.Form):
     file = forms.FileField()
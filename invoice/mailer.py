@@ -0,0 +1,214 @@
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.db.models import Q
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .archive import get_invoice_with_lines
+from .models import InvoiceEmail
+from .tenants import current_tenant, tenant_db, use_tenant
+
+logger = logging.getLogger(__name__)
+
+# One background sender per process and tenant; see start_background_sender()
+_sender_locks = {}
+_sender_locks_guard = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# -------------------
+# Queueing
+# -------------------
+def queue_invoice_email(invoice, to=None):
+    """Queue an invoice's PDF for `to` (default: the invoice's own email); returns the outbox row"""
+    email = InvoiceEmail.objects.create(invoice_id=invoice.pk, to=to or invoice.email)
+    wake_sender()
+    return email
+
+
+def queue_invoice_emails(invoices):
+    """Queue every invoice in a queryset that has an email address; returns how many were queued"""
+    rows = [
+        InvoiceEmail(invoice_id=pk, to=to)
+        for pk, to in invoices.exclude(email="").exclude(email__isnull=True).values_list("pk", "email")
+    ]
+    InvoiceEmail.objects.bulk_create(rows, batch_size=500)
+    if rows:
+        wake_sender()
+    return len(rows)
+
+
+def wake_sender():
+    """Start the background sender once the current transaction commits"""
+    if _setting("INVOICE_EMAIL_BACKGROUND", True):
+        tenant = current_tenant()
+        transaction.on_commit(lambda: start_background_sender(tenant), using=tenant_db())
+
+
+# -------------------
+# Sending
+# -------------------
+def build_message(email):
+    """EmailMessage for an outbox row with the invoice PDF attached; Http404 if the invoice is gone"""
+    # fpdf is only needed here, so it is imported on first use
+    from .utils import generate_invoice_pdf
+    invoice, lines, archived = get_invoice_with_lines(email.invoice_id)
+    number = invoice.number or invoice.id
+    message = EmailMessage(
+        subject="Invoice %s" % number,
+        body=render_to_string("invoice/invoice_email.txt", {"invoice": invoice, "number": number}),
+        to=[email.to],
+    )
+    pdf = generate_invoice_pdf(invoice, lines)
+    message.attach("Invoice_%s.pdf" % invoice.id, bytes(pdf), "application/pdf")
+    return message
+
+
+def _claim(batch_size):
+    """Mark up to batch_size due rows as ours. Rows left SENDING by a worker that
+    died are taken over once INVOICE_EMAIL_CLAIM_TIMEOUT has passed."""
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=_setting("INVOICE_EMAIL_CLAIM_TIMEOUT", 600))
+    claimable = (
+        Q(status=InvoiceEmail.QUEUED, next_attempt_at__lte=now)
+        | Q(status=InvoiceEmail.SENDING, claimed_at__lt=stale)
+    )
+    due = list(
+        InvoiceEmail.objects.filter(claimable).order_by("next_attempt_at", "pk").values_list("pk", flat=True)[:batch_size]
+    )
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    # Re-checking claimable in the UPDATE means a row can only be won by one worker
+    InvoiceEmail.objects.filter(claimable, pk__in=due).update(
+        status=InvoiceEmail.SENDING, claim=token, claimed_at=now,
+    )
+    return list(InvoiceEmail.objects.filter(claim=token, status=InvoiceEmail.SENDING).order_by("pk"))
+
+
+def _sent(email):
+    email.status = InvoiceEmail.SENT
+    email.sent_at = timezone.now()
+    email.attempts += 1
+    email.claim = ""
+    email.last_error = ""
+    email.save(update_fields=["status", "sent_at", "attempts", "claim", "last_error"])
+
+
+def _failed(email, error, permanent=False):
+    """Schedule a retry with exponential backoff, or give up"""
+    email.attempts += 1
+    email.claim = ""
+    email.last_error = str(error)[:1000] or error.__class__.__name__
+    if permanent or email.attempts >= _setting("INVOICE_EMAIL_MAX_ATTEMPTS", 5):
+        email.status = InvoiceEmail.FAILED
+    else:
+        email.status = InvoiceEmail.QUEUED
+        delay = _setting("INVOICE_EMAIL_RETRY_SECONDS", 60) * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
+    email.save(update_fields=["status", "attempts", "claim", "last_error", "next_attempt_at"])
+    logger.warning("Invoice email %s to %s failed (attempt %d): %s", email.pk, email.to, email.attempts, error)
+
+
+def send_pending(batch_size=None, sleep=time.sleep):
+    """Send one batch of due emails over a single mail connection; returns (sent, failed).
+
+    Messages go out one send_messages() call at a time on the open connection,
+    so a rejected address only fails its own row, at most INVOICE_EMAIL_RATE
+    per second. A message that cannot be built fails only its own row. A
+    dropped connection is reopened for the rest of the batch; if the server
+    cannot be reached at all, the whole batch is retried later.
+    """
+    batch = _claim(batch_size or _setting("INVOICE_EMAIL_BATCH_SIZE", 50))
+    if not batch:
+        return 0, 0
+    rate = _setting("INVOICE_EMAIL_RATE", 5)
+    interval = 1.0 / rate if rate else 0
+    sent = failed = 0
+    last_send = None
+    mail = get_connection()
+    try:
+        for position, email in enumerate(batch):
+            try:
+                message = build_message(email)
+            except Http404:
+                _failed(email, "Invoice %s no longer exists" % email.invoice_id, permanent=True)
+                failed += 1
+                continue
+            except Exception as error:
+                # Retried like a send failure, so one bad row never strands the rest of the batch
+                _failed(email, error)
+                failed += 1
+                continue
+            if interval and last_send is not None:
+                wait = last_send + interval - time.monotonic()
+                if wait > 0:
+                    sleep(wait)
+            last_send = time.monotonic()
+            try:
+                mail.open()  # No-op while the connection is up
+            except Exception as error:
+                # Server unreachable: the rest of the batch retries later too
+                for waiting in batch[position:]:
+                    _failed(waiting, error)
+                failed += len(batch) - position
+                break
+            try:
+                if not mail.send_messages([message]):
+                    raise RuntimeError("The mail backend did not accept the message")
+            except Exception as error:
+                _failed(email, error)
+                failed += 1
+                mail.close()  # Start clean; the next message reconnects
+            else:
+                _sent(email)
+                sent += 1
+    finally:
+        mail.close()
+    return sent, failed
+
+
+def send_all(batch_size=None, sleep=time.sleep):
+    """Send batches until nothing is due; returns (sent, failed)"""
+    totals = [0, 0]
+    while True:
+        sent, failed = send_pending(batch_size, sleep)
+        if not sent and not failed:
+            return tuple(totals)
+        totals[0] += sent
+        totals[1] += failed
+
+
+def start_background_sender(tenant=None):
+    """Drain a tenant's outbox in a daemon thread, unless this process is already doing so.
+
+    Retries that are not yet due are left for the next run or for the
+    send_invoice_emails command.
+    """
+    with _sender_locks_guard:
+        lock = _sender_locks.setdefault(tenant, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return
+    threading.Thread(target=_drain, args=(tenant, lock), name="invoice-mailer", daemon=True).start()
+
+
+def _drain(tenant, lock):
+    try:
+        with use_tenant(tenant):
+            send_all()
+    except Exception:
+        logger.exception("Sending invoice emails failed")
+    finally:
+        connections.close_all()  # This thread's database connections
+        lock.release()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from invoice.archive import archive_before, current_fiscal_year, fiscal_year_start
+
+
+class Command(BaseCommand):
+    help = "Move invoices from closed fiscal years into the archive tables"
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument("--fiscal-year", type=int, help="Archive everything up to the end of this fiscal year")
+        group.add_argument("--before", help="Archive invoices dated before this date (YYYY-MM-DD)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["fiscal_year"] is not None:
+            cutoff = fiscal_year_start(options["fiscal_year"] + 1)
+        else:
+            cutoff = parse_date(options["before"] or "")
+            if cutoff is None:
+                raise CommandError("--before must be a date in YYYY-MM-DD format.")
+
+        open_year_start = fiscal_year_start(current_fiscal_year())
+        if cutoff > open_year_start:
+            raise CommandError("Only closed fiscal years can be archived (cutoff must be on or before %s)."
+                               % open_year_start)
+
+        moved = archive_before(
+            cutoff,
+            batch_size=options["batch_size"],
+            progress=lambda count: self.stdout.write("%d invoices archived" % count),
+        )
+        self.stdout.write(self.style.SUCCESS("Archived %d invoices dated before %s." % (moved, cutoff)))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.backup import CHUNK_SIZE, BackupError, backup_database, prune
+
+
+class Command(BaseCommand):
+    help = "Take a consistent backup of the running SQLite database (incremental, compressed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Backup directory (default INVOICE_BACKUP_DIR)")
+        parser.add_argument("--pages", type=int, default=1024, help="Database pages copied per step")
+        parser.add_argument("--sleep", type=float, default=0.005, help="Seconds to pause between steps")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Bytes per stored chunk")
+        parser.add_argument("--level", type=int, default=1, choices=range(0, 10),
+                            help="zlib compression level (default 1)")
+        parser.add_argument("--keep", type=int, help="Afterwards, delete all but this many of the newest backups")
+
+    def handle(self, *args, **options):
+        reported = {}
+
+        def progress(stage, done, total):
+            # One line per 10% of each stage
+            tenth = done * 10 // max(total, 1)
+            if reported.get(stage) != tenth:
+                reported[stage] = tenth
+                self.stdout.write("%s: %d%%" % (stage, tenth * 10))
+
+        try:
+            manifest = backup_database(
+                options["dir"], pages=options["pages"], sleep=options["sleep"],
+                chunk_size=options["chunk_size"], level=options["level"], progress=progress,
+            )
+        except BackupError as error:
+            raise CommandError(error)
+
+        if manifest["journal_mode"] != "wal":
+            self.stdout.write(self.style.WARNING(
+                "The database is in %s mode, so writers waited for the copy; run migrate to switch it to WAL."
+                % manifest["journal_mode"]
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            "%s: %.1f MB in %.1f s (snapshot %.1f s), %d of %d chunks new, %.1f MB written." % (
+                manifest["name"], manifest["size"] / 1e6, manifest["seconds"], manifest["snapshot_seconds"],
+                manifest["new_chunks"], len(manifest["chunks"]), manifest["bytes_written"] / 1e6,
+            )
+        ))
+        if options["keep"]:
+            for name in prune(options["keep"], options["dir"]):
+                self.stdout.write("Removed %s" % name)
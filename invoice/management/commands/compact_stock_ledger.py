@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from invoice.stock import compact_ledger, ledger_drift
+
+
+class Command(BaseCommand):
+    help = "Fold old stock movements into one row per product and check on-hand quantities against the ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", help="Compact movements before this date (YYYY-MM-DD)")
+        parser.add_argument("--keep-days", type=int, default=90,
+                            help="Without --before, keep this many days of movements (default 90)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Products per transaction")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            day = parse_date(options["before"])
+            if day is None:
+                raise CommandError("--before must be a date in YYYY-MM-DD format.")
+        else:
+            day = timezone.localdate() - datetime.timedelta(days=options["keep_days"])
+        cutoff = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+        removed = compact_ledger(
+            cutoff,
+            batch_size=options["batch_size"],
+            progress=lambda done, total: self.stdout.write("[%d/%d products] compacted" % (done, total)),
+        )
+        self.stdout.write(self.style.SUCCESS("Removed %d ledger rows older than %s." % (removed, day)))
+
+        drift = ledger_drift()
+        for product_id, on_hand, ledger in drift:
+            self.stdout.write(self.style.WARNING(
+                "Product %d: on hand %d, ledger %d" % (product_id, on_hand, ledger)
+            ))
+        if not drift:
+            self.stdout.write("On-hand quantities match the ledger.")
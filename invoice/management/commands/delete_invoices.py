@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from invoice.bulk import default_batch_size, delete_invoices, filter_invoices
+
+
+class Command(BaseCommand):
+    help = "Delete invoices matching a filter, with their lines, in short transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="Invoices dated on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", help="Invoices dated on or before this date (YYYY-MM-DD)")
+        parser.add_argument("--customer", default="", help="Invoices whose customer name contains this")
+        parser.add_argument("--all", action="store_true", help="Delete every invoice")
+        parser.add_argument("--batch-size", type=int, default=default_batch_size(), help="Invoices per transaction")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation")
+
+    def handle(self, *args, **options):
+        filters = {"customer": options["customer"]}
+        for name in ("date_from", "date_to"):
+            if options[name]:
+                filters[name] = parse_date(options[name])
+                if filters[name] is None:
+                    raise CommandError("Dates must be in YYYY-MM-DD format.")
+        if not any(filters.values()) and not options["all"]:
+            raise CommandError("Give --from, --to or --customer, or --all to delete every invoice.")
+
+        invoices = filter_invoices(**filters)
+        count = invoices.count()
+        if not count:
+            self.stdout.write("No invoices match.")
+            return
+        if options["interactive"]:
+            answer = input("Delete %d invoices with their lines? Type 'yes' to continue: " % count)
+            if answer != "yes":
+                self.stdout.write("Cancelled.")
+                return
+
+        deleted = delete_invoices(
+            invoices,
+            batch_size=options["batch_size"],
+            progress=lambda done, total: self.stdout.write("[%d/%d invoices] deleted" % (done, total)),
+        )
+        self.stdout.write(self.style.SUCCESS("Deleted %d invoices." % deleted))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.exports import EXPORT_FORMATS, WRITERS
+
+
+class Command(BaseCommand):
+    help = "Export every invoice line, joined with invoice and product fields, to CSV, XLSX or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file; the format defaults to its extension")
+        parser.add_argument("--format", choices=EXPORT_FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        export_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if export_format not in EXPORT_FORMATS:
+            raise CommandError("Cannot infer the format from %r, pass --format." % path)
+
+        try:
+            if export_format == "csv":
+                with open(path, "w", newline="", encoding="utf-8") as fileobj:
+                    WRITERS[export_format](fileobj, options["chunk_size"])
+            else:
+                with open(path, "wb") as fileobj:
+                    WRITERS[export_format](fileobj, options["chunk_size"])
+        except ImportError as exc:
+            raise CommandError("%s export needs an extra package: %s" % (export_format, exc))
+
+        self.stdout.write(self.style.SUCCESS("Exported invoice lines to %s" % path))
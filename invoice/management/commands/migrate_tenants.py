@@ -0,0 +1,32 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from invoice.tenants import tenant_alias, tenants, use_tenant
+
+
+class Command(BaseCommand):
+    help = "Create or update the invoice tables in every tenant's database (or only the tenants named)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenants", nargs="*", metavar="tenant")
+
+    def handle(self, *args, **options):
+        slugs = options["tenants"] or list(tenants())
+        unknown = [slug for slug in slugs if slug not in tenants()]
+        if unknown:
+            raise CommandError("Unknown tenant: %s" % ", ".join(unknown))
+        if not slugs:
+            self.stdout.write("No tenants configured (INVOICE_TENANTS).")
+        for slug in slugs:
+            alias = tenant_alias(slug)
+            connection = connections[alias]
+            if connection.vendor == "sqlite" and not connection.is_in_memory_db():
+                os.makedirs(os.path.dirname(os.path.abspath(connection.settings_dict["NAME"])), exist_ok=True)
+            if options["verbosity"]:
+                self.stdout.write("Migrating %s (database %s)" % (slug, alias))
+            # Data migrations use the ORM, which follows the active tenant
+            with use_tenant(slug):
+                call_command("migrate", database=alias, interactive=False, verbosity=options["verbosity"])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from invoice.rollups import rebuild_product_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-product daily sales rollup from the invoice lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild_product_daily_sales(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} product/day rows."))
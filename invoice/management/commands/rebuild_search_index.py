@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from invoice.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over invoices, products and customers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Indexed %d documents." % count))
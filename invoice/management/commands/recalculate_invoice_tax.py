@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from invoice.models import Invoice, Product
+from invoice.tax import lines_to_rerate, recalculate
+
+
+class Command(BaseCommand):
+    help = ("Bring the GST stored on live invoice lines up to their products' current HSN codes and rates, "
+            "and recompute the invoices' tax totals")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only invoices dated on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Only invoices dated on or before this date (YYYY-MM-DD)")
+        parser.add_argument("--all", action="store_true",
+                            help="Re-tax every live invoice, however old, when --since is not given")
+        parser.add_argument("--product", type=int, action="append", help="Only lines of this product id (repeatable)")
+        parser.add_argument("--hsn", action="append", help="Only lines of products with this HSN code (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Invoices per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Count lines whose rate would change")
+
+    def _date(self, options, name):
+        if not options[name]:
+            return None
+        value = parse_date(options[name])
+        if value is None:
+            raise CommandError("--%s must be a date in YYYY-MM-DD format." % name)
+        return value
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.all()
+        since, until = self._date(options, "since"), self._date(options, "until")
+        if not since and not options["all"] and not options["dry_run"]:
+            # Issued invoices keep the rates they were issued with unless asked otherwise
+            raise CommandError("Pass --since with the date the new rates apply from, or --all to re-tax every "
+                               "live invoice.")
+        if since:
+            invoices = invoices.filter(date__gte=since)
+        if until:
+            invoices = invoices.filter(date__lte=until)
+
+        product_ids = None
+        if options["product"] or options["hsn"]:
+            product_ids = set(options["product"] or ())
+            if options["hsn"]:
+                product_ids.update(
+                    Product.all_objects.filter(hsn_code__in=options["hsn"]).values_list("pk", flat=True)
+                )
+            product_ids = sorted(product_ids)
+
+        if options["dry_run"]:
+            count = lines_to_rerate(invoices, product_ids)
+            self.stdout.write("%d invoice lines have a rate or HSN code that differs from their product's." % count)
+            return
+
+        summary = "%d lines re-rated, %d line tax amounts and %d invoice tax totals changed"
+
+        def progress(last_id, *counts):
+            self.stdout.write("Up to invoice %d: %s" % (last_id, summary % counts))
+
+        counts = recalculate(
+            invoices, product_ids, batch_size=options["batch_size"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS("Recalculated tax: %s." % (summary % counts)))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.backup import BackupError, restore_database
+
+
+class Command(BaseCommand):
+    help = "Restore the SQLite database from a backup, after checking it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", nargs="?", help="Backup to restore (default: the latest)")
+        parser.add_argument("--dir", help="Backup directory (default INVOICE_BACKUP_DIR)")
+        parser.add_argument("--target", help="Write to this file instead of the configured database")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Do not ask for confirmation")
+
+    def handle(self, *args, **options):
+        if options["interactive"] and not options["target"]:
+            answer = input("This replaces everything in the database. Type 'yes' to continue: ")
+            if answer != "yes":
+                self.stdout.write("Cancelled.")
+                return
+        try:
+            manifest = restore_database(options["name"], options["dir"], target_path=options["target"])
+        except BackupError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS("Restored %s (%.1f MB, taken %s)." % (
+            manifest["name"], manifest["size"] / 1e6, manifest["created_at"],
+        )))
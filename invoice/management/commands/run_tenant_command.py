@@ -0,0 +1,26 @@
+import argparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.tenants import tenants, use_tenant
+
+
+class Command(BaseCommand):
+    help = "Run another management command against one tenant's database, or every tenant's in turn"
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant", help="Tenant slug, or 'all'")
+        parser.add_argument("command_name")
+        parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the command")
+
+    def handle(self, *args, **options):
+        slug = options["tenant"]
+        slugs = list(tenants()) if slug == "all" else [slug]
+        if slug != "all" and slug not in tenants():
+            raise CommandError("Unknown tenant: %s" % slug)
+        for slug in slugs:
+            if len(slugs) > 1:
+                self.stdout.write("== %s ==" % slug)
+            with use_tenant(slug):
+                call_command(options["command_name"], *args, stdout=self.stdout._out, stderr=self.stderr._out)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoice.mailer import send_all
+
+
+class Command(BaseCommand):
+    help = "Send queued invoice emails, including retries that have come due"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Messages per mail connection (default INVOICE_EMAIL_BATCH_SIZE)")
+        parser.add_argument("--loop", action="store_true", help="Keep running, checking the outbox every --interval seconds")
+        parser.add_argument("--interval", type=float, default=10)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_all(batch_size=options["batch_size"])
+            if sent or failed or not options["loop"]:
+                self.stdout.write("%d sent, %d failed or retrying" % (sent, failed))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
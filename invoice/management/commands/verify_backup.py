@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.backup import BackupError, list_backups, verify_backup
+
+
+class Command(BaseCommand):
+    help = "Restore a backup to a scratch file and check its chunks, integrity and row counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", nargs="?", help="Backup to check (default: the latest)")
+        parser.add_argument("--all", action="store_true", help="Check every backup")
+        parser.add_argument("--dir", help="Backup directory (default INVOICE_BACKUP_DIR)")
+
+    def handle(self, *args, **options):
+        names = list_backups(options["dir"]) if options["all"] else [options["name"]]
+        if not names:
+            raise CommandError("No backups to verify.")
+        failed = 0
+        for name in names:
+            try:
+                problems = verify_backup(name, options["dir"])
+            except BackupError as error:
+                raise CommandError(error)
+            label = name or "Latest backup"
+            if problems:
+                failed += 1
+                self.stdout.write(self.style.ERROR("%s: %d problems" % (label, len(problems))))
+                for problem in problems[:20]:
+                    self.stdout.write("  %s" % problem)
+            else:
+                self.stdout.write(self.style.SUCCESS("%s: OK" % label))
+        if failed:
+            raise CommandError("%d of %d backups failed verification." % (failed, len(names)))
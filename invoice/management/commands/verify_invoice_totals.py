@@ -0,0 +1,68 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from invoice.totals import id_shards, recompute_shard
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _run_shard(args):
+    first_id, last_id, repair = args
+    from django.db import connections
+
+    try:
+        return recompute_shard(first_id, last_id, repair)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Recompute every Invoice.total and tax_total from its lines in parallel shards and repair mismatches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                            help="Worker processes; 1 runs in this process")
+        parser.add_argument("--shard-size", type=int, default=20000, help="Invoice ids per shard")
+        parser.add_argument("--dry-run", action="store_true", help="Report mismatches without fixing them")
+
+    def handle(self, *args, **options):
+        repair = not options["dry_run"]
+        shards = id_shards(options["shard_size"])
+        if not shards:
+            self.stdout.write("No invoices to check.")
+            return
+
+        jobs = [(first_id, last_id, repair) for first_id, last_id in shards]
+        if options["workers"] <= 1:
+            self._report((recompute_shard(*job) for job in jobs), len(jobs), repair)
+            return
+
+        from django.db import connections
+
+        connections.close_all()
+        with multiprocessing.Pool(options["workers"], initializer=_init_worker) as pool:
+            self._report(pool.imap_unordered(_run_shard, jobs), len(jobs), repair)
+
+    def _report(self, results, shard_count, repair):
+        checked = mismatched = 0
+        for done, (shard_checked, shard_mismatched) in enumerate(results, start=1):
+            checked += shard_checked
+            mismatched += shard_mismatched
+            self.stdout.write(
+                "[%d/%d shards] %d invoices checked, %d mismatched" % (done, shard_count, checked, mismatched)
+            )
+
+        verb = "Repaired" if repair else "Found"
+        self.stdout.write(self.style.SUCCESS(
+            "%s %d mismatched totals out of %d invoices." % (verb, mismatched, checked)
+        ))
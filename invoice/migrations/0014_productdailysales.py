@@ -0,0 +1,57 @@
+# Generated by Django 5.0 on 2026-10-19 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, FloatField, Sum
+
+
+def backfill_product_daily_sales(apps, schema_editor):
+    InvoiceDetail = apps.get_model('invoice', 'InvoiceDetail')
+    ProductDailySales = apps.get_model('invoice', 'ProductDailySales')
+    rows = InvoiceDetail.objects.filter(
+        invoice__isnull=False,
+        product__isnull=False,
+    ).values('product_id', 'invoice__date').annotate(
+        quantity=Sum('amount'),
+        revenue=Sum(F('selling_price') * F('amount'), output_field=FloatField()),
+        profit=Sum((F('selling_price') - F('cost_price')) * F('amount'), output_field=FloatField()),
+    ).order_by()
+    ProductDailySales.objects.bulk_create([
+        ProductDailySales(
+            product_id=row['product_id'],
+            day=row['invoice__date'],
+            quantity=row['quantity'] or 0,
+            revenue=row['revenue'] or 0,
+            profit=row['profit'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0013_invoicedetail_cost_price_invoicedetail_selling_price_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('profit', models.FloatField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoice.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'product'], name='product_sales_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productdailysales',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='unique_product_day_sales'),
+        ),
+        migrations.RunPython(backfill_product_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0 on 2026-10-19 12:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_key(name):
+    return " ".join(str(name or '').split()).casefold()[:255]
+
+
+def dedupe_invoice_customers(apps, schema_editor):
+    Invoice = apps.get_model('invoice', 'Invoice')
+    Customer = apps.get_model('invoice', 'Customer')
+
+    # One customer per normalized name; the newest invoice wins for contact details
+    customers = {}
+    invoice_ids = {}
+    rows = Invoice.objects.order_by('id').values_list('id', 'customer', 'contact', 'email')
+    for invoice_id, name, contact, email in rows.iterator(chunk_size=2000):
+        key = normalize_key(name)
+        if not key:
+            continue
+        entry = customers.setdefault(key, {
+            'customer_name': " ".join(str(name).split()),
+            'contact': '',
+            'email': '',
+        })
+        if contact:
+            entry['contact'] = contact
+        if email:
+            entry['email'] = email
+        invoice_ids.setdefault(key, []).append(invoice_id)
+
+    Customer.objects.bulk_create([
+        Customer(customer_key=key, **fields) for key, fields in customers.items()
+    ], batch_size=1000)
+    for customer_id, key in Customer.objects.values_list('id', 'customer_key'):
+        ids = invoice_ids.get(key, [])
+        for start in range(0, len(ids), 500):
+            Invoice.objects.filter(id__in=ids[start:start + 500]).update(customer_ref_id=customer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0014_productdailysales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_name', models.CharField(max_length=255)),
+                ('customer_key', models.CharField(max_length=255, unique=True)),
+                ('contact', models.CharField(blank=True, default='', max_length=255)),
+                ('email', models.EmailField(blank=True, default='', max_length=254)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='customer_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='invoice.customer'),
+        ),
+        migrations.RunPython(dedupe_invoice_customers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0016_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('product_is_delete', False)), fields=['product_name'], name='live_product_name_idx'),
+        ),
+    ]
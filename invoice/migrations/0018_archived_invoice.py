@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-19 13:00
+
+import django.db.models.deletion
+import invoice.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0017_live_product_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField(db_index=True)),
+                ('customer', models.TextField(default='')),
+                ('contact', models.CharField(blank=True, default='', max_length=255, null=True)),
+                ('email', models.EmailField(blank=True, default='', max_length=254, null=True)),
+                ('comments', models.TextField(blank=True, default='', null=True)),
+                ('total', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer_ref', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_invoices', to='invoice.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceDetail',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.IntegerField(default=1)),
+                ('cost_price', models.FloatField(default=0)),
+                ('selling_price', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoice.archivedinvoice')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='invoice.product')),
+            ],
+            bases=(invoice.models.LineTotalsMixin, models.Model),
+        ),
+    ]
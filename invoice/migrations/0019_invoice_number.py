@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-19 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0018_archived_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=20, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='number',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='number',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
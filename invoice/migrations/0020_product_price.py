@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-19 13:24
+
+import datetime
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_current_prices(apps, schema_editor):
+    # No history exists yet, so today's prices stand in for all earlier dates
+    Product = apps.get_model('invoice', 'Product')
+    ProductPrice = apps.get_model('invoice', 'ProductPrice')
+    since = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    ProductPrice.objects.bulk_create([
+        ProductPrice(product_id=pk, cost_price=cost, selling_price=selling, effective_from=since)
+        for pk, cost, selling in Product.objects.values_list('id', 'cost_price', 'selling_price')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0019_invoice_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost_price', models.FloatField()),
+                ('selling_price', models.FloatField()),
+                ('effective_from', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='invoice.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'effective_from'], name='product_price_asof_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_prices, migrations.RunPython.noop),
+    ]
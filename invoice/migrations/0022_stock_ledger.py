@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-19 13:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0021_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='quantity_on_hand',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('reason', models.CharField(choices=[('sale', 'Sale'), ('sale_reversal', 'Sale reversed'), ('receipt', 'Stock received'), ('adjustment', 'Adjustment'), ('compacted', 'Compacted history')], max_length=20)),
+                ('invoice_id', models.BigIntegerField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='invoice.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'), models.Index(fields=['created_at'], name='stock_movement_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.0 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE invoice_searchentry_fts USING fts5(
+        kind, title, body, content='invoice_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    # ORDER BY rank: title matches weigh ten times body matches, kind is only a filter
+    "INSERT INTO invoice_searchentry_fts(invoice_searchentry_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')",
+    """CREATE TRIGGER invoice_searchentry_ai AFTER INSERT ON invoice_searchentry BEGIN
+        INSERT INTO invoice_searchentry_fts(rowid, kind, title, body) VALUES (new.id, new.kind, new.title, new.body);
+    END""",
+    """CREATE TRIGGER invoice_searchentry_ad AFTER DELETE ON invoice_searchentry BEGIN
+        INSERT INTO invoice_searchentry_fts(invoice_searchentry_fts, rowid, kind, title, body)
+        VALUES ('delete', old.id, old.kind, old.title, old.body);
+    END""",
+    """CREATE TRIGGER invoice_searchentry_au AFTER UPDATE ON invoice_searchentry BEGIN
+        INSERT INTO invoice_searchentry_fts(invoice_searchentry_fts, rowid, kind, title, body)
+        VALUES ('delete', old.id, old.kind, old.title, old.body);
+        INSERT INTO invoice_searchentry_fts(rowid, kind, title, body) VALUES (new.id, new.kind, new.title, new.body);
+    END""",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS invoice_searchentry_ai",
+    "DROP TRIGGER IF EXISTS invoice_searchentry_ad",
+    "DROP TRIGGER IF EXISTS invoice_searchentry_au",
+    "DROP TABLE IF EXISTS invoice_searchentry_fts",
+]
+POSTGRES_TSVECTOR = [
+    """ALTER TABLE invoice_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED""",
+    "CREATE INDEX invoice_searchentry_document_idx ON invoice_searchentry USING GIN (document)",
+]
+POSTGRES_TSVECTOR_DROP = [
+    "DROP INDEX IF EXISTS invoice_searchentry_document_idx",
+    "ALTER TABLE invoice_searchentry DROP COLUMN IF EXISTS document",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS, 'postgresql': POSTGRES_TSVECTOR})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRES_TSVECTOR_DROP})
+
+
+def backfill_search_entries(apps, schema_editor):
+    SearchEntry = apps.get_model('invoice', 'SearchEntry')
+    entries = [
+        SearchEntry(kind='product', object_id=pk, title=name[:255], body=unit or '')
+        for pk, name, unit in apps.get_model('invoice', 'Product').objects.values_list(
+            'id', 'product_name', 'product_unit')
+    ]
+    entries += [
+        SearchEntry(kind='customer', object_id=pk, title=name[:255], body=' '.join(filter(None, [contact, email])))
+        for pk, name, contact, email in apps.get_model('invoice', 'Customer').objects.values_list(
+            'id', 'customer_name', 'contact', 'email')
+    ]
+    for invoice_model, line_model in (('Invoice', 'InvoiceDetail'), ('ArchivedInvoice', 'ArchivedInvoiceDetail')):
+        names = {}
+        for invoice_id, name in apps.get_model('invoice', line_model).objects.filter(
+            product__isnull=False,
+        ).values_list('invoice_id', 'product__product_name'):
+            names.setdefault(invoice_id, set()).add(name)
+        for invoice in apps.get_model('invoice', invoice_model).objects.all():
+            title = '%s %s' % (invoice.number or 'Invoice %s' % invoice.pk, invoice.customer)
+            body = [invoice.contact, invoice.email, invoice.comments] + sorted(names.get(invoice.pk, ()))
+            entries.append(SearchEntry(
+                kind='invoice', object_id=invoice.pk, title=title[:255], body=' '.join(filter(None, body)),
+            ))
+    SearchEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0022_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('invoice', 'Invoice'), ('product', 'Product'), ('customer', 'Customer')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0 on 2026-10-19 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0024_invoice_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='inter_state',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='tax_total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoicedetail',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoicedetail',
+            name='tax_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoicedetail',
+            name='tax_rate',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='inter_state',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tax_total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoicedetail',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='invoicedetail',
+            name='tax_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoicedetail',
+            name='tax_rate',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='gst_rate',
+            field=models.FloatField(choices=[(0.0, '0%'), (0.25, '0.25%'), (3.0, '3%'), (5.0, '5%'), (12.0, '12%'), (18.0, '18%'), (28.0, '28%'), (40.0, '40%')], default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+    ]
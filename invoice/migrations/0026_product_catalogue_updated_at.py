@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-19 15:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0025_gst'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='catalogue_updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_names(apps, schema_editor):
+    # Existing lines take their product's name as it is today
+    Product = apps.get_model('invoice', 'Product')
+    name = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('product_name')[:1])
+    for model in ('InvoiceDetail', 'ArchivedInvoiceDetail'):
+        apps.get_model('invoice', model).objects.filter(product__isnull=False).update(product_name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0026_product_catalogue_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedinvoicedetail',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='invoicedetail',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(copy_product_names, migrations.RunPython.noop),
+    ]
@@ -5,27 +5,230 @@ from django.utils import timezone
 # -------------------
 # Product Model
 # -------------------
+class LiveProductManager(models.Manager):
+    """Products that have not been soft-deleted"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(product_is_delete=False)
+
+
 class Product(models.Model):
+    # GST slabs, in percent; 0 for exempt and nil-rated goods
+    GST_RATES = [
+        (0.0, "0%"),
+        (0.25, "0.25%"),
+        (3.0, "3%"),
+        (5.0, "5%"),
+        (12.0, "12%"),
+        (18.0, "18%"),
+        (28.0, "28%"),
+        (40.0, "40%"),
+    ]
+
     product_name = models.CharField(max_length=255)
     cost_price = models.FloatField(default=0)  # New field: Cost of the product
     selling_price = models.FloatField(default=0)  # New field: Selling price
     product_unit = models.CharField(max_length=255)
+    hsn_code = models.CharField(max_length=8, default='', blank=True)  # HSN (goods) or SAC (services) code
+    gst_rate = models.FloatField(default=0, choices=GST_RATES)
     product_is_delete = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Product list version, stock included
+    # Moves only when save() writes catalogue fields; stock updates leave it alone (see invoice.catalogue)
+    catalogue_updated_at = models.DateTimeField(default=timezone.now, db_index=True, editable=False)
+    # Running total of the stock ledger; only ever changed with F() updates (see invoice.stock)
+    quantity_on_hand = models.IntegerField(default=0, editable=False)
+
+    objects = LiveProductManager()
+    all_objects = models.Manager()  # Includes soft-deleted products
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["product_name"],
+                condition=models.Q(product_is_delete=False),
+                name="live_product_name_idx",
+            ),
+        ]
+
+    CATALOGUE_FIELDS = (
+        "product_name", "product_unit", "cost_price", "selling_price", "hsn_code", "gst_rate", "product_is_delete",
+    )
 
     def __str__(self):
         return str(self.product_name)
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None and not self._state.adding and not kwargs.get("force_insert"):
+            # This instance's stock count may be stale; only invoice.stock writes it, with F() updates
+            update_fields = kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "quantity_on_hand"
+            ]
+        if update_fields is None or set(update_fields) & set(self.CATALOGUE_FIELDS):
+            self.catalogue_updated_at = timezone.now()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "catalogue_updated_at"}
+        super().save(*args, **kwargs)
+
+
+# -------------------
+# Product Price History
+# -------------------
+class ProductPrice(models.Model):
+    """Append-only log of product prices; a row is in force from effective_from until the next one"""
+    # The (product, effective_from) index below also serves plain product lookups
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, related_name="prices")
+    cost_price = models.FloatField()
+    selling_price = models.FloatField()
+    effective_from = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "effective_from"], name="product_price_asof_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product} from {self.effective_from}"
+
+    @property
+    def margin(self):
+        return self.selling_price - self.cost_price
+
+    @classmethod
+    def record(cls, product, when=None):
+        """Append the product's current prices unless they match the latest entry"""
+        latest = cls.objects.filter(product=product).order_by("-effective_from", "-id").first()
+        if latest and (latest.cost_price, latest.selling_price) == (product.cost_price, product.selling_price):
+            return latest
+        return cls.objects.create(
+            product=product, cost_price=product.cost_price, selling_price=product.selling_price,
+            effective_from=when or timezone.now(),
+        )
+
+
+# -------------------
+# Stock Ledger
+# -------------------
+class StockMovement(models.Model):
+    """Append-only stock ledger; a product's movements sum to its quantity_on_hand"""
+    SALE = "sale"
+    SALE_REVERSAL = "sale_reversal"
+    RECEIPT = "receipt"
+    ADJUSTMENT = "adjustment"
+    COMPACTED = "compacted"
+    REASONS = [
+        (SALE, "Sale"),
+        (SALE_REVERSAL, "Sale reversed"),
+        (RECEIPT, "Stock received"),
+        (ADJUSTMENT, "Adjustment"),
+        (COMPACTED, "Compacted history"),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, related_name="stock_movements")
+    quantity = models.IntegerField()  # Positive in, negative out
+    reason = models.CharField(max_length=20, choices=REASONS)
+    invoice_id = models.BigIntegerField(null=True, blank=True)  # Not a FK: invoices get archived
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "created_at"], name="stock_movement_product_idx"),
+            models.Index(fields=["created_at"], name="stock_movement_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product} {self.quantity:+d} ({self.reason})"
+
+
+# -------------------
+# Customer Model
+# -------------------
+class Customer(models.Model):
+    customer_name = models.CharField(max_length=255)
+    customer_key = models.CharField(max_length=255, unique=True)  # Normalized name used for lookups
+    contact = models.CharField(max_length=255, default='', blank=True)
+    email = models.EmailField(default='', blank=True)
+
+    def __str__(self):
+        return str(self.customer_name)
+
+    @staticmethod
+    def normalize_key(name):
+        """Case-folded name with whitespace collapsed, so 'ACME  Ltd' == 'acme ltd'"""
+        return " ".join(str(name or '').split()).casefold()[:255]
+
+    def save(self, *args, **kwargs):
+        self.customer_key = self.normalize_key(self.customer_name)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def for_invoice(cls, name, contact='', email=''):
+        """Find or create the customer an invoice is written for"""
+        key = cls.normalize_key(name)
+        if not key:
+            return None
+        # Invoice.customer is unbounded; databases other than SQLite enforce max_length
+        max_length = cls._meta.get_field('customer_name').max_length
+        customer, created = cls.objects.get_or_create(
+            customer_key=key,
+            defaults={
+                'customer_name': " ".join(str(name).split())[:max_length],
+                'contact': contact or '',
+                'email': email or '',
+            },
+        )
+        changed = []
+        if contact and contact != customer.contact:
+            customer.contact = contact
+            changed.append('contact')
+        if email and email != customer.email:
+            customer.email = email
+            changed.append('email')
+        if changed:
+            customer.save(update_fields=changed)
+        return customer
+
 
 # -------------------
 # Invoice Model
 # -------------------
-class Invoice(models.Model):
+class InvoiceTaxMixin:
+    """GST split of the stored tax total, shared by live and archived invoices"""
+
+    @property
+    def grand_total(self):
+        """Total with tax"""
+        return (self.total or 0) + (self.tax_total or 0)
+
+    @property
+    def integrated_tax(self):
+        """IGST: the whole tax of an inter-state sale"""
+        return self.tax_total if self.inter_state else 0
+
+    @property
+    def central_tax(self):
+        """CGST: half the tax of a sale within the state (SGST is the other half)"""
+        return 0 if self.inter_state else self.tax_total / 2
+
+    state_tax = central_tax
+
+
+class Invoice(InvoiceTaxMixin, models.Model):
+    number = models.CharField(max_length=32, unique=True, blank=True, null=True)  # Sequential, per fiscal year
     date = models.DateField(auto_now_add=True)
     customer = models.TextField(default='')
+    customer_ref = models.ForeignKey(
+        Customer, on_delete=models.SET_NULL, blank=True, null=True, related_name='invoices'
+    )
     contact = models.CharField(max_length=255, default='', blank=True, null=True)
     email = models.EmailField(default='', blank=True, null=True)
     comments = models.TextField(default='', blank=True, null=True)
     total = models.FloatField(default=0)  # Will be auto-calculated
+    inter_state = models.BooleanField(default=False)  # IGST instead of CGST + SGST
+    tax_total = models.FloatField(default=0)  # Sum of the lines' tax_amount
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Invoice {self.id} - {self.customer}"
@@ -46,12 +249,8 @@ class Invoice(models.Model):
 # -------------------
 # Invoice Detail Model
 # -------------------
-class InvoiceDetail(models.Model):
-    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, blank=True, null=True)
-    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
-    amount = models.IntegerField(default=1)
-    cost_price = models.FloatField(default=0)  # Stored at time of sale
-    selling_price = models.FloatField(default=0)  # Stored at time of sale
+class LineTotalsMixin:
+    """Line totals shared by live and archived invoice lines"""
 
     @property
     def get_total_bill(self):
@@ -66,3 +265,179 @@ class InvoiceDetail(models.Model):
         if self.selling_price:
             return (float(self.selling_price) - float(self.cost_price)) * float(self.amount)
         return 0
+
+
+class InvoiceDetail(LineTotalsMixin, models.Model):
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, blank=True, null=True)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
+    product_name = models.CharField(max_length=255, default='', blank=True)  # Stored at time of sale
+    amount = models.IntegerField(default=1)
+    cost_price = models.FloatField(default=0)  # Stored at time of sale
+    selling_price = models.FloatField(default=0)  # Stored at time of sale
+    # GST at time of sale (see invoice.tax)
+    hsn_code = models.CharField(max_length=8, default='', blank=True)
+    tax_rate = models.FloatField(default=0)
+    tax_amount = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+# -------------------
+# Archived Invoice Models (closed fiscal years)
+# -------------------
+class ArchivedInvoice(InvoiceTaxMixin, models.Model):
+    """Invoice moved out of the hot table; keeps its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    number = models.CharField(max_length=32, unique=True, blank=True, null=True)
+    date = models.DateField(db_index=True)
+    customer = models.TextField(default='')
+    customer_ref = models.ForeignKey(
+        Customer, on_delete=models.SET_NULL, blank=True, null=True, related_name='archived_invoices'
+    )
+    contact = models.CharField(max_length=255, default='', blank=True, null=True)
+    email = models.EmailField(default='', blank=True, null=True)
+    comments = models.TextField(default='', blank=True, null=True)
+    total = models.FloatField(default=0)
+    inter_state = models.BooleanField(default=False)
+    tax_total = models.FloatField(default=0)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Invoice {self.id} - {self.customer} (archived)"
+
+    @property
+    def total_profit(self):
+        """Sum of profit from all items in this invoice"""
+        return sum([detail.get_profit for detail in self.archivedinvoicedetail_set.all()])
+
+    @property
+    def total_sales_amount(self):
+        """Total sales amount of this invoice"""
+        return sum([detail.get_total_bill for detail in self.archivedinvoicedetail_set.all()])
+
+
+class ArchivedInvoiceDetail(LineTotalsMixin, models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
+    product_name = models.CharField(max_length=255, default='', blank=True)
+    amount = models.IntegerField(default=1)
+    cost_price = models.FloatField(default=0)
+    selling_price = models.FloatField(default=0)
+    hsn_code = models.CharField(max_length=8, default='', blank=True)
+    tax_rate = models.FloatField(default=0)
+    tax_amount = models.FloatField(default=0)
+    updated_at = models.DateTimeField()
+
+
+# -------------------
+# Invoice Email Outbox
+# -------------------
+class InvoiceEmail(models.Model):
+    """An invoice PDF waiting to be (or already) emailed; see invoice.mailer"""
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUSES = [(QUEUED, "Queued"), (SENDING, "Sending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    invoice_id = models.BigIntegerField()  # Not a FK: invoices get archived
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)  # Worker holding the row while SENDING
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="invoice_email_due_idx"),
+            models.Index(fields=["invoice_id"], name="invoice_email_invoice_idx"),
+        ]
+
+    def __str__(self):
+        return f"Invoice {self.invoice_id} to {self.to} ({self.status})"
+
+
+# -------------------
+# Invoice Number Sequence
+# -------------------
+class InvoiceSequence(models.Model):
+    """Next free invoice number for one series (a fiscal year)"""
+    series = models.CharField(max_length=20, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.series}: next {self.next_value}"
+
+
+# -------------------
+# Search Index
+# -------------------
+class SearchEntry(models.Model):
+    """One searchable document per invoice, product or customer.
+
+    The full-text index over title/body lives beside this table (FTS5 on
+    SQLite, a tsvector column on Postgres), see invoice.search.
+    """
+    INVOICE = "invoice"
+    PRODUCT = "product"
+    CUSTOMER = "customer"
+    KINDS = [(INVOICE, "Invoice"), (PRODUCT, "Product"), (CUSTOMER, "Customer")]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="unique_search_entry"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+
+# -------------------
+# Tombstone Model
+# -------------------
+class Tombstone(models.Model):
+    """Marker left behind by a hard delete so delta exports can report it"""
+    model_name = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id} deleted {self.deleted_at}"
+
+    @classmethod
+    def record(cls, model, ids):
+        model_name = model._meta.model_name
+        cls.objects.bulk_create([cls(model_name=model_name, object_id=pk) for pk in ids], batch_size=500)
+
+
+# -------------------
+# Product Daily Sales (rollup)
+# -------------------
+class ProductDailySales(models.Model):
+    """Per-product, per-day sales totals kept in step with the invoice write path"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0)
+    profit = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "day"], name="unique_product_day_sales"),
+        ]
+        indexes = [
+            models.Index(fields=["day", "product"], name="product_sales_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product} - {self.day}"
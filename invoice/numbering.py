@@ -0,0 +1,87 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from .archive import current_fiscal_year
+from .models import InvoiceSequence
+from .tenants import tenant_db
+
+
+def _mode():
+    return getattr(settings, "INVOICE_NUMBER_MODE", "block")
+
+
+def format_number(year, number):
+    return getattr(settings, "INVOICE_NUMBER_FORMAT", "INV/{year}/{number:06d}").format(year=year, number=number)
+
+
+def reserve_range(series, count):
+    """Advance the series by count and return the first reserved value.
+
+    Must run inside a transaction: the UPDATE locks the sequence row (the whole
+    database on SQLite) until commit, so the value read back is our own.
+    """
+    if not InvoiceSequence.objects.filter(series=series).update(next_value=F("next_value") + count):
+        try:
+            with transaction.atomic(using=tenant_db()):
+                InvoiceSequence.objects.create(series=series, next_value=1 + count)
+            return 1
+        except IntegrityError:
+            # Another writer created the series first
+            InvoiceSequence.objects.filter(series=series).update(next_value=F("next_value") + count)
+    return InvoiceSequence.objects.get(series=series).next_value - count
+
+
+class BlockAllocator:
+    """Hands out numbers from a block reserved per worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def next(self, series, block_size):
+        # Each tenant database has its own sequence rows
+        alias = tenant_db()
+        key = (alias, series)
+        with self._lock:
+            pid, value, end = self._blocks.get(key, (None, 0, 0))
+            # A forked worker must not reuse the block it inherited from its parent
+            if pid != os.getpid() or value >= end:
+                with transaction.atomic(using=alias):
+                    value = reserve_range(series, block_size)
+                end = value + block_size
+            self._blocks[key] = (os.getpid(), value + 1, end)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+allocator = BlockAllocator()
+
+
+def reserve_invoice_number(today=None):
+    """Number for an invoice about to be created; call before its transaction.
+
+    Returns None in gapless mode, or when already inside a transaction (a block
+    reserved there could be rolled back after other invoices used it), in which
+    case allocate_invoice_number() assigns the number inside the transaction.
+    """
+    if _mode() == "gapless" or connections[tenant_db()].in_atomic_block:
+        return None
+    year = current_fiscal_year(today)
+    return format_number(year, allocator.next(str(year), getattr(settings, "INVOICE_NUMBER_BLOCK_SIZE", 20)))
+
+
+def allocate_invoice_number(today=None):
+    """Next number taken inside the caller's transaction, so a rollback releases it.
+
+    Call it first in the transaction: on SQLite a transaction that has already
+    read cannot wait for the write lock and fails with "database is locked".
+    """
+    year = current_fiscal_year(today)
+    return format_number(year, reserve_range(str(year), 1))
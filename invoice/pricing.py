@@ -0,0 +1,30 @@
+from django.db.models import F, OuterRef, Subquery
+
+from .models import Product, ProductPrice
+
+
+def _in_force(when, product):
+    """Latest price row at `when`: one seek on (product, effective_from), read backwards"""
+    return ProductPrice.objects.filter(
+        product=product, effective_from__lte=when,
+    ).order_by("-effective_from", "-id")
+
+
+def price_at(product, when):
+    """The ProductPrice in force for product at `when`, or None before its first price"""
+    return _in_force(when, product).first()
+
+
+def prices_as_of(when, products=None):
+    """Products annotated with the cost, selling price and margin in force at `when`.
+
+    Each product costs one index seek, however long its price history is.
+    """
+    products = Product.all_objects.all() if products is None else products
+    in_force = _in_force(when, OuterRef("pk"))
+    return products.annotate(
+        cost_as_of=Subquery(in_force.values("cost_price")[:1]),
+        selling_as_of=Subquery(in_force.values("selling_price")[:1]),
+    ).filter(cost_as_of__isnull=False).annotate(
+        margin_as_of=F("selling_as_of") - F("cost_as_of"),
+    )
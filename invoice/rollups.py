@@ -0,0 +1,150 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Sum
+
+from .models import InvoiceDetail, ProductDailySales
+from .tenants import for_each_tenant, tenant_db
+
+REPORT_METRICS = ("revenue", "profit", "quantity")
+
+
+def _line_deltas(day, details, sign):
+    """Group invoice lines into (product_id, day) -> [quantity, revenue, profit]"""
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for detail in details:
+        if not detail.product_id:
+            continue
+        row = deltas[(detail.product_id, day)]
+        row[0] += sign * detail.amount
+        row[1] += sign * detail.get_total_bill
+        row[2] += sign * detail.get_profit
+    return deltas
+
+
+def apply_sales(deltas):
+    """Add the given deltas onto the rollup table, creating missing rows"""
+    with transaction.atomic(using=tenant_db()):
+        for (product_id, day), (quantity, revenue, profit) in deltas.items():
+            updated = ProductDailySales.objects.filter(product_id=product_id, day=day).update(
+                quantity=F("quantity") + quantity,
+                revenue=F("revenue") + revenue,
+                profit=F("profit") + profit,
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic(using=tenant_db()):
+                    ProductDailySales.objects.create(
+                        product_id=product_id, day=day,
+                        quantity=quantity, revenue=revenue, profit=profit,
+                    )
+            except IntegrityError:
+                # Another writer created the row first, add on top of it
+                ProductDailySales.objects.filter(product_id=product_id, day=day).update(
+                    quantity=F("quantity") + quantity,
+                    revenue=F("revenue") + revenue,
+                    profit=F("profit") + profit,
+                )
+
+
+def record_invoice_sales(invoice, details):
+    """Add an invoice's lines to the per-product daily rollup"""
+    apply_sales(_line_deltas(invoice.date, details, 1))
+
+
+def reverse_invoice_sales(invoice, details):
+    """Remove an invoice's lines from the per-product daily rollup"""
+    apply_sales(_line_deltas(invoice.date, details, -1))
+
+
+def reverse_lines_sales(details, invoice_dates):
+    """Remove the lines of many invoices at once; invoice_dates maps invoice_id -> invoice date"""
+    by_day = defaultdict(list)
+    for detail in details:
+        by_day[invoice_dates[detail.invoice_id]].append(detail)
+    deltas = {}
+    for day, lines in by_day.items():
+        deltas.update(_line_deltas(day, lines, -1))
+    apply_sales(deltas)
+
+
+def rebuild_product_daily_sales(batch_size=1000):
+    """Recompute the whole rollup table from the invoice lines"""
+    rows = InvoiceDetail.objects.filter(
+        invoice__isnull=False,
+        product__isnull=False,
+    ).values("product_id", "invoice__date").annotate(
+        quantity=Sum("amount"),
+        revenue=Sum(F("selling_price") * F("amount"), output_field=FloatField()),
+        profit=Sum((F("selling_price") - F("cost_price")) * F("amount"), output_field=FloatField()),
+    ).order_by()
+
+    created = 0
+    with transaction.atomic(using=tenant_db()):
+        ProductDailySales.objects.all().delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(ProductDailySales(
+                product_id=row["product_id"],
+                day=row["invoice__date"],
+                quantity=row["quantity"] or 0,
+                revenue=row["revenue"] or 0,
+                profit=row["profit"] or 0,
+            ))
+            if len(batch) >= batch_size:
+                ProductDailySales.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            ProductDailySales.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def top_products(start, end, metric="revenue", limit=10):
+    """Top products between two dates (inclusive), ranked by the given metric"""
+    if metric not in REPORT_METRICS:
+        metric = "revenue"
+    return ProductDailySales.objects.filter(
+        day__range=(start, end),
+    ).values("product_id", "product__product_name", "product__product_unit").annotate(
+        quantity_sum=Sum("quantity"),
+        revenue_sum=Sum("revenue"),
+        profit_sum=Sum("profit"),
+    ).order_by(f"-{metric}_sum", "product_id")[:limit]
+
+
+def _tenant_sales(start, end):
+    """One tenant's part of tenant_sales(): its totals and per-product sums"""
+    rows = ProductDailySales.objects.filter(day__range=(start, end))
+    totals = rows.aggregate(quantity=Sum("quantity"), revenue=Sum("revenue"), profit=Sum("profit"))
+    products = list(rows.values("product__product_name", "product__product_unit").annotate(
+        quantity_sum=Sum("quantity"),
+        revenue_sum=Sum("revenue"),
+        profit_sum=Sum("profit"),
+    ).order_by())
+    return {metric: totals[metric] or 0 for metric in REPORT_METRICS}, products
+
+
+def tenant_sales(start, end, metric="revenue", limit=10):
+    """Sales of every tenant between two dates, queried in parallel.
+
+    Returns (per-tenant totals as {slug: {metric: sum}}, the top products across
+    all tenants). Product ids differ between tenant databases, so products are
+    matched by name and unit.
+    """
+    if metric not in REPORT_METRICS:
+        metric = "revenue"
+    per_tenant = for_each_tenant(_tenant_sales, start, end)
+    combined = {}
+    for totals, products in per_tenant.values():
+        for row in products:
+            key = (row["product__product_name"], row["product__product_unit"])
+            if key in combined:
+                for name in ("quantity_sum", "revenue_sum", "profit_sum"):
+                    combined[key][name] += row[name]
+            else:
+                combined[key] = row
+    top = sorted(combined.values(), key=lambda row: (-row[f"{metric}_sum"], row["product__product_name"]))[:limit]
+    return {slug: totals for slug, (totals, _) in per_tenant.items()}, top
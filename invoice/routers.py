@@ -0,0 +1,86 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+PIN_PRIMARY_COOKIE = "invoice_pin_primary"
+
+_replica_reads = contextvars.ContextVar("invoice_replica_reads", default=False)
+
+
+def replica_alias():
+    """The configured read replica alias, or None when there isn't one"""
+    alias = getattr(settings, "INVOICE_REPLICA_DATABASE", "replica")
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+@contextmanager
+def replica_reads():
+    """Send ORM reads inside this block to the read replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _iter_on_replica(content):
+    with replica_reads():
+        yield from content
+
+
+def use_replica(view):
+    """Serve a read-only view from the replica unless the client has just written"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or PIN_PRIMARY_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+        if getattr(response, "streaming", False) and not hasattr(response, "file_to_stream"):
+            # Streamed bodies run their queries after the view has returned
+            response.streaming_content = _iter_on_replica(response.streaming_content)
+        return response
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """Route reads to the replica inside replica_reads(); every write goes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explicit, otherwise Django writes an instance back to the alias it was read from
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {"default", replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class PrimaryAfterWriteMiddleware:
+    """Pin a client to the primary for a few seconds after it writes, so it reads its own writes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS", "TRACE") and replica_alias():
+            response.set_cookie(
+                PIN_PRIMARY_COOKIE, "1",
+                max_age=getattr(settings, "INVOICE_REPLICA_LAG_SECONDS", 5),
+                httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,196 @@
+import re
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+
+from .models import ArchivedInvoice, ArchivedInvoiceDetail, Customer, Invoice, InvoiceDetail, Product, SearchEntry
+from .tenants import tenant_db
+
+# External-content FTS5 table over invoice_searchentry, kept in step by triggers.
+# Its rank (bm25, title weighted 10:1 over body) is configured in migration 0023.
+FTS_TABLE = "invoice_searchentry_fts"
+# Only the most recent matches of each kind are ranked, so a word found in half
+# the rows costs the same as a rare one
+RANK_WINDOW = 2000
+MAX_TERMS = 10
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def _clip(text, length=255):
+    return " ".join(str(text).split())[:length]
+
+
+# -------------------
+# Documents
+# -------------------
+def invoice_document(invoice, product_names):
+    title = "%s %s" % (invoice.number or "Invoice %s" % invoice.pk, invoice.customer)
+    body = [invoice.contact, invoice.email, invoice.comments] + sorted(set(product_names))
+    return _clip(title), " ".join(filter(None, body))
+
+
+def product_document(product):
+    return _clip(product.product_name), product.product_unit or ""
+
+
+def customer_document(customer):
+    return _clip(customer.customer_name), " ".join(filter(None, [customer.contact, customer.email]))
+
+
+def _upsert(kind, object_id, title, body):
+    # UPDATE first: the common case once an object has been indexed
+    if SearchEntry.objects.filter(kind=kind, object_id=object_id).update(title=title, body=body):
+        return
+    try:
+        with transaction.atomic(using=tenant_db()):
+            SearchEntry.objects.create(kind=kind, object_id=object_id, title=title, body=body)
+    except IntegrityError:
+        SearchEntry.objects.filter(kind=kind, object_id=object_id).update(title=title, body=body)
+
+
+def index_invoice(invoice, details):
+    """(Re)index an invoice from the lines just written, without querying them back"""
+    names = [detail.product.product_name for detail in details if detail.product_id]
+    _upsert(SearchEntry.INVOICE, invoice.pk, *invoice_document(invoice, names))
+
+
+def unindex(kind, ids):
+    SearchEntry.objects.filter(kind=kind, object_id__in=list(ids)).delete()
+
+
+# Products and customers are also written outside the views (admin, Customer.for_invoice),
+# so they are kept in sync by signal receivers connected in InvoiceConfig.ready()
+def product_saved(sender, instance, **kwargs):
+    _upsert(SearchEntry.PRODUCT, instance.pk, *product_document(instance))
+
+
+def customer_saved(sender, instance, **kwargs):
+    _upsert(SearchEntry.CUSTOMER, instance.pk, *customer_document(instance))
+
+
+def product_deleted(sender, instance, **kwargs):
+    unindex(SearchEntry.PRODUCT, [instance.pk])
+
+
+def customer_deleted(sender, instance, **kwargs):
+    unindex(SearchEntry.CUSTOMER, [instance.pk])
+
+
+# -------------------
+# Queries
+# -------------------
+def search(query, kind=None, limit=20):
+    """SearchEntry rows matching every word of query (the last one as a prefix), best first, each with .rank"""
+    terms = _terms(query)
+    if not terms or (kind and kind not in dict(SearchEntry.KINDS)):
+        return []
+
+    vendor = connections[tenant_db()].vendor
+    if vendor == "sqlite":
+        # Whole words first. Prefix queries make FTS5 gather every match of the
+        # prefix, so the last word is only widened to a prefix when whole words
+        # do not fill the page (typing "acm" still finds "Acme").
+        exact = " ".join('"%s"' % term for term in terms)
+        results = _fts_search(exact, kind, limit)
+        if len(results) < limit:
+            found = {entry.pk for entry in results}
+            results += [entry for entry in _fts_search(exact + "*", kind, limit) if entry.pk not in found]
+        return results[:limit]
+
+    kind_sql, params = ("AND e.kind = %s", [kind]) if kind else ("", [])
+
+    if vendor == "postgresql":
+        tsquery = " & ".join("%s:*" % term for term in terms)
+        sql = (
+            "SELECT e.id, e.kind, e.object_id, e.title, e.body, "
+            "ts_rank_cd(e.document, to_tsquery('simple', %s)) AS rank "
+            "FROM invoice_searchentry e WHERE e.document @@ to_tsquery('simple', %s) {kind_sql} "
+            "ORDER BY rank DESC LIMIT %s"
+        ).format(kind_sql=kind_sql)
+        return list(SearchEntry.objects.raw(sql, [tsquery, tsquery] + params + [limit]))
+
+    # Other backends: unranked substring match
+    entries = SearchEntry.objects.all()
+    if kind:
+        entries = entries.filter(kind=kind)
+    for term in terms:
+        entries = entries.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    entries = list(entries[:limit])
+    for entry in entries:
+        entry.rank = 0
+    return entries
+
+
+def _fts_search(match, kind, limit):
+    if not kind:
+        # Window each kind on its own: otherwise a few thousand new invoices
+        # mentioning a word push older products and customers out of the window
+        results = [entry for kind, _ in SearchEntry.KINDS for entry in _fts_search(match, kind, limit)]
+        return sorted(results, key=lambda entry: entry.rank)[:limit]
+    match = "kind:%s AND (%s)" % (kind, match)
+    # Rank only matches at or after the RANK_WINDOW-th newest one, then join
+    # the winners; the rowid bound is walked backwards through the index
+    sql = (
+        "SELECT e.id, e.kind, e.object_id, e.title, e.body, m.rank FROM ("
+        "  SELECT rowid, rank FROM {fts} WHERE {fts} MATCH %s AND rowid >= COALESCE("
+        "    (SELECT rowid FROM {fts} WHERE {fts} MATCH %s ORDER BY rowid DESC LIMIT 1 OFFSET %s), 0)"
+        "  ORDER BY rank LIMIT %s"
+        ") m JOIN invoice_searchentry e ON e.id = m.rowid ORDER BY m.rank"
+    ).format(fts=FTS_TABLE)
+    return list(SearchEntry.objects.raw(sql, [match, match, RANK_WINDOW - 1, limit]))
+
+
+def matching_ids(kind, query, limit=1000):
+    return [entry.object_id for entry in search(query, kind, limit)]
+
+
+# -------------------
+# Rebuild
+# -------------------
+def rebuild_index(batch_size=2000):
+    """Recreate every entry from the source tables; returns the number of entries"""
+    count = 0
+    with transaction.atomic(using=tenant_db()):
+        SearchEntry.objects.all().delete()
+
+        def flush(entries):
+            SearchEntry.objects.bulk_create(entries, batch_size=batch_size)
+            return len(entries)
+
+        for kind, objects, document in (
+            (SearchEntry.PRODUCT, Product.all_objects.all(), product_document),
+            (SearchEntry.CUSTOMER, Customer.objects.all(), customer_document),
+        ):
+            entries = []
+            for obj in objects.iterator(chunk_size=batch_size):
+                title, body = document(obj)
+                entries.append(SearchEntry(kind=kind, object_id=obj.pk, title=title, body=body))
+            count += flush(entries)
+        for invoice_model, line_model in ((Invoice, InvoiceDetail), (ArchivedInvoice, ArchivedInvoiceDetail)):
+            invoices = invoice_model.objects.order_by("pk")
+            start = 0
+            while True:
+                batch = list(invoices.filter(pk__gt=start)[:batch_size])
+                if not batch:
+                    break
+                names = {}
+                for invoice_id, name in line_model.objects.filter(
+                    invoice_id__in=[invoice.pk for invoice in batch], product__isnull=False,
+                ).values_list("invoice_id", "product__product_name"):
+                    names.setdefault(invoice_id, []).append(name)
+                entries = []
+                for invoice in batch:
+                    title, body = invoice_document(invoice, names.get(invoice.pk, []))
+                    entries.append(SearchEntry(kind=SearchEntry.INVOICE, object_id=invoice.pk, title=title, body=body))
+                count += flush(entries)
+                start = batch[-1].pk
+
+    connection = connections[tenant_db()]
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            # Merge the index segments written by the bulk insert
+            cursor.execute("INSERT INTO {fts}({fts}) VALUES ('optimize')".format(fts=FTS_TABLE))
+    return count
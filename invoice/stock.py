@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Product, StockMovement
+from .tenants import tenant_db
+
+
+def _line_quantities(details, sign):
+    """Net quantity per product_id for a set of invoice lines"""
+    quantities = defaultdict(int)
+    for detail in details:
+        if detail.product_id:
+            quantities[detail.product_id] += sign * detail.amount
+    return quantities
+
+
+def apply_movements(quantities, reason, invoice_id=None, note=""):
+    """Write one ledger row per product and move quantity_on_hand by the same amount.
+
+    The ledger is written with one bulk insert. Each product total changes with
+    a single UPDATE ... SET quantity_on_hand = quantity_on_hand + n, so parallel
+    writers never overwrite each other and the row lock lasts only until the
+    caller's transaction commits. Products are updated in id order so
+    concurrent invoices lock them in the same order. Only updated_at moves, not
+    catalogue_updated_at, so sales never make workers rebuild their catalogue.
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    now = timezone.now()
+    with transaction.atomic(using=tenant_db()):
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pk, quantity=qty, reason=reason, invoice_id=invoice_id, note=note,
+                          created_at=now)
+            for pk, qty in quantities.items()
+        ])
+        for pk in sorted(quantities):
+            Product.all_objects.filter(pk=pk).update(
+                quantity_on_hand=F("quantity_on_hand") + quantities[pk], updated_at=now,
+            )
+
+
+def record_invoice_stock(invoice, details):
+    """Take an invoice's lines out of stock"""
+    apply_movements(_line_quantities(details, -1), StockMovement.SALE, invoice.pk)
+
+
+def reverse_invoice_stock(invoice, details):
+    """Put an invoice's lines back into stock"""
+    apply_movements(_line_quantities(details, 1), StockMovement.SALE_REVERSAL, invoice.pk)
+
+
+def reverse_lines_stock(details, note=""):
+    """Put the lines of many invoices back into stock, one movement per product"""
+    apply_movements(_line_quantities(details, 1), StockMovement.SALE_REVERSAL, note=note)
+
+
+def adjust_stock(product, quantity, reason=StockMovement.RECEIPT, note=""):
+    apply_movements({product.pk: quantity}, reason, note=note)
+
+
+def compact_ledger(before, batch_size=500, progress=None):
+    """Fold each product's movements older than `before` into one COMPACTED row.
+
+    quantity_on_hand is untouched: the folded row carries the same total. Each
+    batch of products is rewritten in its own transaction; returns the number
+    of ledger rows removed.
+    """
+    product_ids = list(
+        StockMovement.objects.filter(created_at__lt=before)
+        .values_list("product_id", flat=True).distinct().order_by("product_id")
+    )
+    removed = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        with transaction.atomic(using=tenant_db()):
+            old = StockMovement.objects.filter(product_id__in=batch, created_at__lt=before)
+            totals = dict(old.values("product_id").annotate(total=Sum("quantity")).values_list("product_id", "total"))
+            deleted, _ = old.delete()
+            StockMovement.objects.bulk_create([
+                StockMovement(product_id=pk, quantity=total, reason=StockMovement.COMPACTED,
+                              note="Movements before %s" % before.date(), created_at=before)
+                for pk, total in totals.items()
+            ])
+        removed += deleted - len(totals)
+        if progress:
+            progress(min(start + batch_size, len(product_ids)), len(product_ids))
+    return removed
+
+
+def ledger_drift():
+    """Products whose quantity_on_hand differs from their ledger: [(product_id, on_hand, ledger)]"""
+    ledger = dict(
+        StockMovement.objects.values("product_id").annotate(total=Sum("quantity")).values_list("product_id", "total")
+    )
+    drift = []
+    for pk, on_hand in Product.all_objects.values_list("pk", "quantity_on_hand").order_by("pk"):
+        if on_hand != ledger.get(pk, 0):
+            drift.append((pk, on_hand, ledger.get(pk, 0)))
+    return drift
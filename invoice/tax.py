@@ -0,0 +1,197 @@
+"""GST on invoice lines.
+
+A line's tax is worked out once, when the invoice is written, from its
+product's HSN code and rate, and stored on the line; the invoice keeps the
+sum in tax_total. Reports only add up those columns. When rates change,
+recalculate() rewrites the stored tax with a few UPDATE statements per batch
+of invoices instead of loading and saving lines one by one.
+
+Tax is worked out in whole paise: the line's value in paise times the rate
+in hundredths of a percent, rounded half up. Within a state it is CGST and
+SGST at half the rate each, rounded separately, so the two halves are always
+equal. line_tax() and the SQL used by recalculate() do the same integer
+arithmetic, so they always agree. Both scale with an explicit floor rather
+than a cast, since SQLite truncates when casting to integer and PostgreSQL
+rounds.
+"""
+import math
+
+from django.db import transaction
+from django.db.models import (
+    BigIntegerField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value,
+)
+from django.db.models.functions import Cast, Coalesce, Floor, Round
+from django.utils import timezone
+
+from .models import ArchivedInvoiceDetail, Invoice, InvoiceDetail, Product
+from .tenants import tenant_db
+
+
+def _scaled(value):
+    """Rupees or percent in hundredths, rounded half up"""
+    return math.floor(value * 100 + 0.5)
+
+
+def _divide(numerator, denominator):
+    """Integer division truncating towards zero, as SQL integer division does"""
+    quotient = abs(numerator) // denominator
+    return quotient if numerator >= 0 else -quotient
+
+
+def line_tax(selling_price, amount, rate, inter_state=False):
+    """GST in rupees on `amount` units at selling_price, at `rate` percent"""
+    scaled = _scaled(selling_price) * amount * _scaled(rate)
+    if inter_state:
+        return _divide(scaled + 5000, 10000) / 100
+    return 2 * _divide(scaled + 10000, 20000) / 100
+
+
+def apply_tax(detail, product, inter_state=False):
+    """Copy the product's HSN code and rate onto an unsaved line and work out its tax"""
+    detail.hsn_code = product.hsn_code
+    detail.tax_rate = product.gst_rate
+    detail.tax_amount = line_tax(detail.selling_price, detail.amount, detail.tax_rate, inter_state)
+    return detail.tax_amount
+
+
+def invoice_tax_total(details):
+    return round(sum(detail.tax_amount for detail in details), 2)
+
+
+# -------------------
+# Bulk recalculation
+# -------------------
+def line_tax_expression(inter_state):
+    """line_tax() as a database expression over a line's stored price, amount and rate.
+
+    The floored values are whole numbers already, so the casts to bigint are
+    exact on every backend.
+    """
+    scaled = (
+        Cast(Floor(F("selling_price") * 100 + Value(0.5)), BigIntegerField())
+        * F("amount")
+        * Cast(Floor(F("tax_rate") * 100 + Value(0.5)), BigIntegerField())
+    )
+    if inter_state:
+        paise = (scaled + 5000) / 10000
+    else:
+        paise = (scaled + 10000) / 20000 * 2
+    return ExpressionWrapper(paise / Value(100.0), output_field=FloatField())
+
+
+def _changed_rates(lines):
+    """Lines whose HSN code or rate differ from their product's"""
+    return lines.filter(product__isnull=False).exclude(
+        tax_rate=F("product__gst_rate"), hsn_code=F("product__hsn_code"),
+    )
+
+
+def rerate_batch(invoice_ids, product_ids=None, now=None):
+    """Re-rate and re-tax the lines of these invoices, then their tax totals.
+
+    Every invoice with a changed line gets a new updated_at, even when its
+    total stays the same, so cached pages and PDFs showing its lines are
+    rebuilt. Returns how many lines got a new rate, lines got a new tax
+    amount, and invoices got a new tax total.
+    """
+    now = now or timezone.now()
+    lines = InvoiceDetail.objects.filter(invoice_id__in=invoice_ids)
+    if product_ids is not None:
+        lines = lines.filter(product_id__in=product_ids)
+    product = Product.all_objects.filter(pk=OuterRef("product_id"))
+    rerated = _changed_rates(lines).update(
+        tax_rate=Subquery(product.values("gst_rate")[:1]),
+        hsn_code=Subquery(product.values("hsn_code")[:1]),
+        updated_at=now,
+    )
+    retaxed = 0
+    for inter_state in (False, True):
+        tax = line_tax_expression(inter_state)
+        retaxed += lines.filter(invoice__inter_state=inter_state).alias(tax=tax).exclude(
+            tax_amount=F("tax"),
+        ).update(tax_amount=tax, updated_at=now)
+    if not (rerated or retaxed):
+        return 0, 0, 0
+
+    line_sum = InvoiceDetail.objects.filter(invoice_id=OuterRef("pk")).values("invoice_id").annotate(
+        tax=Round(Sum("tax_amount"), 2),
+    ).values("tax")
+    tax_total = Coalesce(Subquery(line_sum), Value(0.0), output_field=FloatField())
+    invoices = Invoice.objects.filter(id__in=invoice_ids).alias(line_tax=tax_total).exclude(
+        tax_total=F("line_tax"),
+    ).update(tax_total=tax_total, updated_at=now)
+    Invoice.objects.filter(id__in=invoice_ids, invoicedetail__updated_at=now).exclude(updated_at=now).update(
+        updated_at=now,
+    )
+    return rerated, retaxed, invoices
+
+
+def recalculate(invoices=None, product_ids=None, batch_size=1000, progress=None):
+    """Bring the stored GST of live invoices (all, or the `invoices` queryset) up to their products' rates.
+
+    Every invoice passed in is re-taxed, however old, so narrow `invoices` to
+    the period the new rates apply to. Lines of deleted products keep their
+    rates. Only rows that change are written, and get a new updated_at. Each batch of invoices is one
+    transaction. Returns the totals of rerate_batch()'s counts.
+    """
+    invoices = Invoice.objects.all() if invoices is None else invoices
+    counts = [0, 0, 0]
+    last = 0
+    while True:
+        ids = list(invoices.filter(id__gt=last).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic(using=tenant_db()):
+            batch = rerate_batch(ids, product_ids)
+        counts = [total + count for total, count in zip(counts, batch)]
+        last = ids[-1]
+        if progress:
+            progress(last, *counts)
+    return tuple(counts)
+
+
+def lines_to_rerate(invoices=None, product_ids=None):
+    """How many live lines have an HSN code or rate that differs from their product's"""
+    lines = InvoiceDetail.objects.all()
+    if invoices is not None:
+        lines = lines.filter(invoice__in=invoices)
+    if product_ids is not None:
+        lines = lines.filter(product_id__in=product_ids)
+    return _changed_rates(lines).count()
+
+
+# -------------------
+# Reports
+# -------------------
+def tax_summary(start, end):
+    """Taxable value and GST per (HSN code, rate) for invoices dated start..end, archived ones included.
+
+    Straight sums over the stored line columns; returns rows ordered by HSN
+    code and rate, each a dict with quantity, taxable, cgst, sgst, igst, tax.
+    """
+    merged = {}
+    for model in (InvoiceDetail, ArchivedInvoiceDetail):
+        rows = model.objects.filter(invoice__date__range=(start, end)).values("hsn_code", "tax_rate").annotate(
+            quantity=Sum("amount"),
+            taxable=Sum(F("selling_price") * F("amount"), output_field=FloatField()),
+            local=Sum("tax_amount", filter=Q(invoice__inter_state=False), default=0.0),
+            igst=Sum("tax_amount", filter=Q(invoice__inter_state=True), default=0.0),
+        ).order_by()
+        for row in rows:
+            key = (row["hsn_code"], row["tax_rate"])
+            total = merged.setdefault(key, {
+                "hsn_code": row["hsn_code"], "tax_rate": row["tax_rate"],
+                "quantity": 0, "taxable": 0.0, "local": 0.0, "igst": 0.0,
+            })
+            for name in ("quantity", "taxable", "local", "igst"):
+                total[name] += row[name] or 0
+    result = []
+    for key in sorted(merged):
+        row = merged[key]
+        local = row.pop("local")
+        row["cgst"] = row["sgst"] = round(local / 2, 2)
+        row["igst"] = round(row["igst"], 2)
+        row["taxable"] = round(row["taxable"], 2)
+        row["tax"] = round(local + row["igst"], 2)
+        result.append(row)
+    return result
@@ -0,0 +1,181 @@
+"""Several shops (tenants) served by one deployment, each with its own database.
+
+A request picks its tenant by host name or by a /t/<slug>/ URL prefix (see
+TenantMiddleware); code outside a request uses use_tenant(). While a tenant is
+active, TenantRouter sends every query for the invoice app's models to that
+tenant's database alias. Users, sessions and the admin log stay in the
+default database, so one login works for every shop.
+
+    INVOICE_TENANTS = {
+        "kochi": {"hosts": ["kochi.example.com"], "database": "tenant_kochi"},
+    }
+
+Transactions and on_commit() hooks are per database, so code that opens one
+around invoice models passes using=tenant_db().
+"""
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.http import Http404
+from django.http.request import split_domain_port
+from django.urls import get_script_prefix, set_script_prefix
+
+TENANT_APP = "invoice"
+URL_PREFIX = re.compile(r"^/t/(?P<slug>[-\w]+)(?=/|$)")
+
+_tenant = contextvars.ContextVar("invoice_tenant", default=None)
+
+# (size, ThreadPoolExecutor) shared by every cross-tenant call in this process
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def tenants():
+    return getattr(settings, "INVOICE_TENANTS", {})
+
+
+def tenant_alias(slug):
+    """Database alias holding a tenant's invoice data"""
+    return tenants()[slug].get("database") or "tenant_" + slug
+
+
+def current_tenant():
+    """Slug of the active tenant, or None for the default database"""
+    return _tenant.get()
+
+
+def tenant_db():
+    """Alias the invoice app's models use right now"""
+    slug = _tenant.get()
+    return tenant_alias(slug) if slug else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_tenant(slug):
+    """Route the invoice app's queries inside this block to a tenant's database (None: the default one)"""
+    if slug is not None and slug not in tenants():
+        raise KeyError("Unknown tenant %r" % slug)
+    token = _tenant.set(slug)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def _executor(workers):
+    """The process-wide pool, rebuilt only if the number of workers changed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != workers:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            _pool = (workers, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="invoice-tenant"))
+        return _pool[1]
+
+
+def for_each_tenant(func, *args, slugs=None, workers=None, **kwargs):
+    """Call func(*args, **kwargs) once per tenant, in parallel; returns {slug: result}.
+
+    Each call runs in a thread of a long-lived pool with that tenant active.
+    Pool threads keep their per-tenant connections open between calls, up to
+    the database's CONN_MAX_AGE, so a report does not reopen every tenant's
+    database. SQLite releases the GIL while it executes, so queries on
+    different tenant files overlap. func must return evaluated results (lists
+    or numbers), not lazy querysets.
+    """
+    slugs = list(tenants() if slugs is None else slugs)
+    workers = workers or getattr(settings, "INVOICE_TENANT_REPORT_WORKERS", 8)
+
+    def run(slug):
+        try:
+            with use_tenant(slug):
+                return func(*args, **kwargs)
+        finally:
+            # Only drops this thread's connections that are broken or past CONN_MAX_AGE
+            close_old_connections()
+
+    if not slugs:
+        return {}
+    return dict(zip(slugs, _executor(workers).map(run, slugs)))
+
+
+class TenantRouter:
+    """Send the invoice app's reads and writes to the active tenant's database.
+
+    Listed before ReplicaRouter: outside a tenant it has no opinion, so the
+    default database and its replica are used as before.
+    """
+
+    def _db(self, model):
+        if model._meta.app_label == TENANT_APP and _tenant.get():
+            return tenant_db()
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model)
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Tenant databases hold only the invoice app's tables
+        if db != DEFAULT_DB_ALIAS and db in {tenant_alias(slug) for slug in tenants()}:
+            return app_label == TENANT_APP
+        return None
+
+
+def _iter_in_tenant(slug, content):
+    with use_tenant(slug):
+        yield from content
+
+
+class TenantMiddleware:
+    """Activate the tenant named by the request's URL prefix or host name.
+
+    A /t/<slug>/ prefix is moved into the script prefix, so URL resolution
+    sees the usual paths and reverse() and {% url %} keep the prefix. An
+    unknown slug is a 404; an unknown host uses the default database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def resolve(self, request):
+        configured = tenants()
+        if not configured:
+            return None
+        match = URL_PREFIX.match(request.path_info)
+        if match:
+            slug = match.group("slug")
+            if slug not in configured:
+                raise Http404("No such shop")
+            prefix = request.META.get("SCRIPT_NAME", "") + match.group(0)
+            request.META["SCRIPT_NAME"] = prefix
+            request.path_info = request.path_info[match.end():] or "/"
+            set_script_prefix(prefix)
+            return slug
+        host, _ = split_domain_port(request.get_host())
+        for slug, tenant in configured.items():
+            if host in tenant.get("hosts", ()):
+                return slug
+        return None
+
+    def __call__(self, request):
+        script_prefix = get_script_prefix()
+        try:
+            slug = request.tenant = self.resolve(request)
+            if slug is None:
+                return self.get_response(request)
+            with use_tenant(slug):
+                response = self.get_response(request)
+        finally:
+            set_script_prefix(script_prefix)
+        if getattr(response, "streaming", False) and not hasattr(response, "file_to_stream"):
+            # Streamed bodies run their queries after the view has returned
+            response.streaming_content = _iter_in_tenant(slug, response.streaming_content)
+        return response
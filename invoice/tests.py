@@ -1,9 +1,42 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Product, Invoice, InvoiceDetail
+from io import StringIO
+from django.core.management import call_command
+from .models import (
+    Product, Customer, Invoice, InvoiceDetail, ArchivedInvoice, ArchivedInvoiceDetail, ProductDailySales, Tombstone,
+)
 from django.utils import timezone
 
+
+def invoice_data(rows, customer='Test Customer', **fields):
+    """POST data for the create/edit invoice pages: the invoice fields and one line per (product, amount)"""
+    data = {
+        'customer': customer,
+        'form-TOTAL_FORMS': str(len(rows)),
+        'form-INITIAL_FORMS': '0',
+        'form-MIN_NUM_FORMS': '0',
+        'form-MAX_NUM_FORMS': '1000',
+        **fields,
+    }
+    for i, (product, amount) in enumerate(rows):
+        data['form-%d-product' % i] = product.pk
+        data['form-%d-amount' % i] = str(amount)
+    return data
+
+
+class LoggedInMixin:
+    """A client logged in as a plain user, which creates invoices through the invoice page"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def create_invoice(self, rows, **fields):
+        return self.client.post(reverse('create_invoice'), invoice_data(rows, **fields))
+
+
 class BasicTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -271,3 +304,1767 @@ class InvoicePrintPopupTests(TestCase):
         self.assertEqual(str(response.context['new_invoice_id']), str(invoice.id))
         self.assertContains(response, 'id="printInvoiceModal"')
         self.assertContains(response, f"/invoice_pdf/{invoice.id}/")
+
+class ProductSalesRollupTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pen = Product.objects.create(
+            product_name="Pen", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+        self.book = Product.objects.create(
+            product_name="Book", cost_price=50.0, selling_price=60.0, product_unit="pcs"
+        )
+
+    def test_create_invoice_updates_rollup(self):
+        self.create_invoice([(self.pen, 3), (self.book, 1)])
+        self.create_invoice([(self.pen, 2)])
+
+        pen = ProductDailySales.objects.get(product=self.pen)
+        self.assertEqual(pen.quantity, 5)
+        self.assertEqual(pen.revenue, 50.0)
+        self.assertEqual(pen.profit, 25.0)
+        self.assertEqual(ProductDailySales.objects.get(product=self.book).quantity, 1)
+
+    def test_edit_and_delete_keep_rollup_consistent(self):
+        self.create_invoice([(self.pen, 3)])
+        invoice = Invoice.objects.last()
+
+        self.client.post(reverse('edit_invoice', args=[invoice.pk]), invoice_data([(self.book, 2)]))
+        self.assertEqual(ProductDailySales.objects.get(product=self.pen).quantity, 0)
+        self.assertEqual(ProductDailySales.objects.get(product=self.book).revenue, 120.0)
+
+        self.client.post(reverse('delete_invoice', args=[invoice.pk]))
+        self.assertEqual(ProductDailySales.objects.get(product=self.book).quantity, 0)
+        self.assertEqual(ProductDailySales.objects.get(product=self.book).revenue, 0)
+
+    def test_rebuild_matches_incremental(self):
+        self.create_invoice([(self.pen, 3), (self.book, 1)])
+        before = sorted(ProductDailySales.objects.values_list('product_id', 'quantity', 'revenue', 'profit'))
+
+        ProductDailySales.objects.update(quantity=0, revenue=0, profit=0)
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+        after = sorted(ProductDailySales.objects.values_list('product_id', 'quantity', 'revenue', 'profit'))
+        self.assertEqual(before, after)
+
+    def test_top_products_report(self):
+        self.create_invoice([(self.pen, 2), (self.book, 1)])
+
+        response = self.client.get(reverse('product_sales'), {'metric': 'quantity', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        rows = list(response.context['rows'])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['product__product_name'], 'Pen')
+
+        response = self.client.get(reverse('product_sales'), {'metric': 'revenue'})
+        rows = list(response.context['rows'])
+        self.assertEqual(rows[0]['product__product_name'], 'Book')
+
+    def test_impossible_dates_fall_back_to_the_default_range(self):
+        for report in ('product_sales', 'tax_report'):
+            response = self.client.get(reverse(report), {'start': '2024-02-30', 'end': '2024-13-01'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['end'], timezone.localdate())
+
+
+class CustomerTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            product_name="Test Product", cost_price=10.0, selling_price=20.0, product_unit="Unit"
+        )
+
+    def _create_invoice(self, customer, **fields):
+        return self.create_invoice([(self.product, 1)], customer=customer, **fields)
+
+    def test_invoices_link_to_normalized_customer(self):
+        self._create_invoice('Acme  Traders', contact='111')
+        self._create_invoice('acme traders', email='acme@example.com')
+
+        self.assertEqual(Customer.objects.count(), 1)
+        customer = Customer.objects.get()
+        self.assertEqual(customer.customer_key, 'acme traders')
+        self.assertEqual(customer.contact, '111')
+        self.assertEqual(customer.email, 'acme@example.com')
+        self.assertEqual(customer.invoices.count(), 2)
+
+    def test_long_invoice_customer_name_is_truncated(self):
+        response = self._create_invoice('Acme ' * 100)
+        self.assertEqual(response.status_code, 302)
+        customer = Customer.objects.get()
+        self.assertEqual(len(customer.customer_name), 255)
+        self.assertEqual(Invoice.objects.get().customer_ref, customer)
+
+    def test_customer_detail_totals(self):
+        self._create_invoice('Acme Traders')
+        self._create_invoice('ACME TRADERS')
+        self._create_invoice('Someone Else')
+        customer = Customer.objects.get(customer_key='acme traders')
+
+        response = self.client.get(reverse('view_customer_detail', args=[customer.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['invoice_count'], 2)
+        self.assertEqual(response.context['invoice_total'], 40.0)
+
+    def test_archived_invoices_stay_in_customer_history(self):
+        import datetime
+        from .archive import archive_before
+        for _ in range(3):
+            self._create_invoice('Acme Traders')
+        self._create_invoice('Someone Else')
+        customer = Customer.objects.get(customer_key='acme traders')
+        old = customer.invoices.order_by('id').first()
+        Invoice.objects.filter(pk=old.pk).update(date=datetime.date(2000, 1, 1))
+        self.assertEqual(archive_before(datetime.date(2001, 1, 1)), 1)
+
+        response = self.client.get(reverse('view_customer_detail', args=[customer.pk]))
+        self.assertEqual(response.context['invoice_count'], 3)
+        self.assertEqual(response.context['invoice_total'], 60.0)
+        self.assertEqual([row['id'] for row in response.context['invoices']][-1], old.pk)
+        row = next(row for row in self.client.get(reverse('view_customer')).context['customer']
+                   if row.pk == customer.pk)
+        self.assertEqual((row.invoice_count, row.invoice_total), (3, 60.0))
+
+    def test_customer_list_and_duplicate_name(self):
+        Customer.objects.create(customer_name='Acme Traders')
+        response = self.client.get(reverse('view_customer'))
+        self.assertContains(response, 'Acme Traders')
+
+        response = self.client.post(reverse('create_customer'), {'customer_name': ' acme TRADERS '})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class InvoiceLineExportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        self.product = Product.objects.create(
+            product_name="Export Product", cost_price=10.0, selling_price=25.0, product_unit="kg"
+        )
+        self.invoice = Invoice.objects.create(customer="Export Customer", total=75.0)
+        InvoiceDetail.objects.create(
+            invoice=self.invoice, product=self.product, product_name="Export Product", amount=3,
+            cost_price=10.0, selling_price=25.0,
+        )
+        InvoiceDetail.objects.create(
+            invoice=self.invoice, product=self.product, product_name="Export Product", amount=1,
+            cost_price=10.0, selling_price=25.0,
+        )
+
+    def test_csv_export_streams_lines(self):
+        import csv
+        response = self.client.get(reverse('download_invoice_lines'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0][:3], ['Line ID', 'Invoice ID', 'Date'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][3], 'Export Customer')
+        self.assertEqual(float(rows[1][-2]), 75.0)
+        self.assertEqual(float(rows[1][-1]), 45.0)
+
+    def test_xlsx_export(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        response = self.client.get(reverse('download_invoice_lines'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(sheet.max_row, 3)
+        self.assertEqual(sheet.cell(row=2, column=8).value, 'Export Product')
+
+    def test_parquet_export_command(self):
+        import os
+        import tempfile
+        import pandas as pd
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lines.parquet')
+            call_command('export_invoice_lines', path, chunk_size=1, stdout=StringIO())
+            frame = pd.read_parquet(path)
+        self.assertEqual(len(frame), 2)
+        self.assertEqual(frame['Amount'].sum(), 4)
+
+    def test_unknown_format_rejected(self):
+        response = self.client.get(reverse('download_invoice_lines'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DeltaExportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        self.product = Product.objects.create(
+            product_name="Delta Product", cost_price=1.0, selling_price=2.0, product_unit="pcs"
+        )
+        self.old_invoice = Invoice.objects.create(customer="Old Customer", total=2.0)
+        self.old_detail = InvoiceDetail.objects.create(
+            invoice=self.old_invoice, product=self.product, amount=1, cost_price=1.0, selling_price=2.0
+        )
+
+    def _delta(self, since=None, lag=0):
+        params = {'since': since} if since else {}
+        with self.settings(INVOICE_DELTA_LAG_SECONDS=lag):
+            response = self.client.get(reverse('download_delta'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_export_without_watermark(self):
+        data = self._delta()
+        self.assertEqual([row['id'] for row in data['invoices']], [self.old_invoice.pk])
+        self.assertEqual([row['id'] for row in data['lines']], [self.old_detail.pk])
+        self.assertIsNotNone(data['watermark'])
+
+    def test_only_changes_since_watermark(self):
+        watermark = self._delta()['watermark']
+        self.assertEqual(self._delta(watermark)['invoices'], [])
+
+        new_invoice = Invoice.objects.create(customer="New Customer", total=0)
+        data = self._delta(watermark)
+        self.assertEqual([row['id'] for row in data['invoices']], [new_invoice.pk])
+        self.assertEqual(data['lines'], [])
+
+    def test_deletes_reported_as_tombstones(self):
+        watermark = self._delta()['watermark']
+        self.client.post(reverse('delete_invoice', args=[self.old_invoice.pk]))
+
+        data = self._delta(watermark)
+        self.assertEqual(data['deleted']['invoice'], [self.old_invoice.pk])
+        self.assertEqual(data['deleted']['invoicedetail'], [self.old_detail.pk])
+
+    def test_watermark_trails_late_commits(self):
+        import datetime
+        data = self._delta(lag=60)
+        self.assertEqual(data['invoices'], [])  # Too recent to be settled
+        # Stamped 30 s before that read, but only committed after it
+        late = Invoice.objects.create(customer="Late Customer", total=0)
+        Invoice.objects.filter(pk=late.pk).update(updated_at=timezone.now() - datetime.timedelta(seconds=30))
+        data = self._delta(data['watermark'])
+        self.assertEqual([row['id'] for row in data['invoices']], [self.old_invoice.pk, late.pk])
+
+    def test_bad_watermark_rejected(self):
+        response = self.client.get(reverse('download_delta'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('download_delta'), {'since': '2024-02-30T00:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LiveProductTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        self.live = Product.objects.create(
+            product_name="Live Product", cost_price=1.0, selling_price=2.0, product_unit="pcs"
+        )
+        self.deleted = Product.objects.create(
+            product_name="Deleted Product", cost_price=1.0, selling_price=2.0, product_unit="pcs",
+            product_is_delete=True,
+        )
+
+    def test_default_manager_excludes_deleted(self):
+        self.assertEqual(list(Product.objects.all()), [self.live])
+        self.assertEqual(Product.all_objects.count(), 2)
+
+    def test_dashboard_and_dropdown_only_count_live(self):
+        from .forms import InvoiceDetailForm
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_product'], 1)
+        self.assertEqual([pk for pk, name in InvoiceDetailForm().fields['product'].choices if pk], [self.live.pk])
+
+    def test_deleted_product_still_resolves_on_old_lines(self):
+        invoice = Invoice.objects.create(customer="Customer")
+        detail = InvoiceDetail.objects.create(invoice=invoice, product=self.deleted, amount=1)
+        detail = InvoiceDetail.objects.get(pk=detail.pk)
+        self.assertEqual(detail.product, self.deleted)
+
+    def test_delete_product_hides_it(self):
+        self.client.get(reverse('delete_product', args=[self.live.pk]))
+        self.assertFalse(Product.objects.filter(pk=self.live.pk).exists())
+        self.assertTrue(Product.all_objects.get(pk=self.live.pk).product_is_delete)
+
+    def test_admin_lists_live_products_by_default(self):
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpassword')
+        self.client.login(username='admin', password='adminpassword')
+        response = self.client.get(reverse('admin:invoice_product_changelist'))
+        self.assertContains(response, 'Live Product')
+        self.assertNotContains(response, 'Deleted Product')
+
+        response = self.client.get(reverse('admin:invoice_product_changelist'), {'status': 'deleted'})
+        self.assertContains(response, 'Deleted Product')
+
+
+class VerifyInvoiceTotalsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_name="Total Product", cost_price=1.0, selling_price=5.0, product_unit="pcs"
+        )
+        self.good = Invoice.objects.create(customer="Good", total=10.0)
+        InvoiceDetail.objects.create(invoice=self.good, product=self.product, amount=2, selling_price=5.0)
+        self.bad = Invoice.objects.create(customer="Bad", total=99.0)
+        InvoiceDetail.objects.create(invoice=self.bad, product=self.product, amount=3, selling_price=5.0)
+        self.empty = Invoice.objects.create(customer="Empty", total=7.0)
+
+    def test_dry_run_reports_without_fixing(self):
+        out = StringIO()
+        call_command('verify_invoice_totals', workers=1, shard_size=2, dry_run=True, stdout=out)
+        self.assertIn('Found 2 mismatched totals out of 3 invoices', out.getvalue())
+        self.bad.refresh_from_db()
+        self.assertEqual(self.bad.total, 99.0)
+
+    def test_repairs_mismatched_totals(self):
+        before = Invoice.objects.get(pk=self.good.pk).updated_at
+        call_command('verify_invoice_totals', workers=1, shard_size=2, stdout=StringIO())
+
+        self.assertEqual(Invoice.objects.get(pk=self.bad.pk).total, 15.0)
+        self.assertEqual(Invoice.objects.get(pk=self.empty.pk).total, 0.0)
+        self.assertEqual(Invoice.objects.get(pk=self.good.pk).updated_at, before)
+
+
+class ArchiveInvoiceTests(TestCase):
+    def setUp(self):
+        import datetime
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        self.product = Product.objects.create(
+            product_name="Archive Product", cost_price=4.0, selling_price=10.0, product_unit="pcs"
+        )
+        self.old = Invoice.objects.create(customer="Old Customer", total=20.0)
+        InvoiceDetail.objects.create(
+            invoice=self.old, product=self.product, amount=2, cost_price=4.0, selling_price=10.0
+        )
+        Invoice.objects.filter(pk=self.old.pk).update(date=datetime.date(2020, 6, 1))
+        self.recent = Invoice.objects.create(customer="Recent Customer", total=0)
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+
+    def test_archive_closed_fiscal_year(self):
+        call_command('archive_invoices', fiscal_year=2020, stdout=StringIO())
+
+        self.assertFalse(Invoice.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(InvoiceDetail.objects.filter(invoice_id=self.old.pk).exists())
+        self.assertTrue(Invoice.objects.filter(pk=self.recent.pk).exists())
+        archived = ArchivedInvoice.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.total_sales_amount, 20.0)
+        self.assertEqual(archived.total_profit, 12.0)
+        # Rollups are untouched
+        self.assertEqual(ProductDailySales.objects.get(product=self.product).revenue, 20.0)
+
+    def test_open_fiscal_year_cannot_be_archived(self):
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('archive_invoices', before='2999-01-01', stdout=StringIO())
+
+    def test_detail_and_pdf_fall_back_to_archive(self):
+        call_command('archive_invoices', fiscal_year=2020, stdout=StringIO())
+
+        response = self.client.get(reverse('view_invoice_detail', args=[self.old.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['archived'])
+        self.assertEqual(response.context['invoice_detail'].total_sales, 20.0)
+
+        response = self.client.get(reverse('invoice_pdf', args=[self.old.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        response = self.client.get(reverse('view_invoice_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_reports_keep_archived_history(self):
+        call_command('archive_invoices', fiscal_year=2020, stdout=StringIO())
+        response = self.client.get(reverse('monthly_profit'))
+        self.assertIn('June 2020', response.context['months'])
+        self.assertEqual(response.context['total_invoice'], 2)
+        self.assertEqual(response.context['total_income'], 20.0)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # Committed rows and the replica alias, so a stand-in INVOICE_REPLICA_DB file sees the data
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.product = Product.objects.create(
+            product_name="Replica Product", cost_price=1.0, selling_price=2.0, product_unit="pcs"
+        )
+
+    def test_router_without_replica_uses_default(self):
+        from .routers import ReplicaRouter, replica_reads
+        with self.settings(INVOICE_REPLICA_DATABASE='missing'):
+            with replica_reads():
+                self.assertIsNone(ReplicaRouter().db_for_read(Invoice))
+
+    def test_router_sends_only_marked_reads_to_replica(self):
+        from .routers import ReplicaRouter, replica_reads
+        router = ReplicaRouter()
+        # Any configured alias can stand in for the replica here
+        with self.settings(INVOICE_REPLICA_DATABASE='default'):
+            self.assertIsNone(router.db_for_read(Invoice))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Invoice), 'default')
+                self.assertEqual(router.db_for_write(Invoice), 'default')
+            self.assertIsNone(router.db_for_read(Invoice))
+
+    def test_list_views_read_from_replica(self):
+        from unittest import mock
+        from . import routers
+        seen = []
+        original = routers.ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            seen.append(routers._replica_reads.get())
+            return original(router, model, **hints)
+
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read', spy):
+            response = self.client.get(reverse('view_product'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(True, seen)
+
+    def test_reports_served_by_configured_replica(self):
+        from django.conf import settings
+        if 'replica' not in settings.DATABASES:
+            self.skipTest('INVOICE_REPLICA_DB is not set')
+        for name in ('view_product', 'view_invoice', 'monthly_profit', 'product_sales'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+    def test_write_pins_client_to_primary(self):
+        from .routers import PIN_PRIMARY_COOKIE
+        data = {
+            'customer': 'Replica Customer',
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-product': self.product.pk,
+            'form-0-amount': '1',
+        }
+        with self.settings(INVOICE_REPLICA_DATABASE='default'):
+            response = self.client.post(reverse('create_invoice'), data)
+        self.assertIn(PIN_PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_PRIMARY_COOKIE]['max-age'], 5)
+
+
+class LazyImportTests(TestCase):
+    def test_views_do_not_import_heavy_dependencies(self):
+        import subprocess
+        import sys
+        from django.conf import settings
+        code = (
+            "import os, sys, django;"
+            "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_system_management.settings');"
+            "django.setup();"
+            "import invoice_system_management.urls;"
+            "print(','.join(m for m in ('pandas', 'fpdf', 'openpyxl', 'pyarrow') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class StaticPipelineTests(TestCase):
+    def _collected(self):
+        from django.apps import apps
+        from django.contrib.staticfiles.finders import get_finders
+        ignore_patterns = apps.get_app_config('staticfiles').ignore_patterns
+        return {path for finder in get_finders() for path, _ in finder.list(ignore_patterns)}
+
+    def test_unused_vendor_files_are_pruned(self):
+        collected = self._collected()
+        for path in ('vendor/fontawesome-free/css/all.min.css', 'vendor/fontawesome-free/webfonts/fa-solid-900.woff2',
+                     'vendor/jquery/jquery.min.js', 'css/sb-admin-2.min.css', 'img/logo.png'):
+            self.assertIn(path, collected)
+        for path in ('scss/_buttons.scss', 'vendor/bootstrap/scss/bootstrap.scss', 'vendor/jquery/jquery.js',
+                     'vendor/fontawesome-free/svgs/solid/user.svg', 'vendor/datatables/jquery.dataTables.js',
+                     'excel/masterfile.xlsx'):
+            self.assertNotIn(path, collected)
+
+    def test_templates_only_reference_collected_files(self):
+        import re
+        from pathlib import Path
+        collected = self._collected()
+        templates = Path(__file__).resolve().parent / 'templates'
+        for template in templates.rglob('*.html'):
+            for path in re.findall(r"{% static '([^']+)' %}", template.read_text()):
+                self.assertIn(path, collected, '%s references %s' % (template.name, path))
+
+
+class InvoiceDetailCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+        self.product = Product.objects.create(
+            product_name="Cached Product", cost_price=3.0, selling_price=5.0, product_unit="pcs"
+        )
+        self.invoice = Invoice.objects.create(customer="Cache Customer", total=15.0)
+        InvoiceDetail.objects.create(
+            invoice=self.invoice, product=self.product, product_name="Cached Product", amount=3,
+            cost_price=3.0, selling_price=5.0,
+        )
+        InvoiceDetail.objects.create(
+            invoice=self.invoice, product=self.product, product_name="Cached Product", amount=1,
+            cost_price=3.0, selling_price=5.0,
+        )
+
+    def test_totals_computed_in_one_query(self):
+        from .caching import InvoiceLineSummary
+        summary = InvoiceLineSummary(InvoiceDetail.objects.filter(invoice=self.invoice))
+        with self.assertNumQueries(1):
+            self.assertEqual(summary.total_sales, 20.0)
+            self.assertEqual(summary.total_profit, 8.0)
+            self.assertEqual([row.line_total for row in summary.rows], [15.0, 5.0])
+            self.assertEqual(summary.rows[0].product_name, "Cached Product")
+
+    def test_fragment_cached_until_invoice_changes(self):
+        url = reverse('view_invoice_detail', args=[self.invoice.pk])
+        response = self.client.get(url)
+        self.assertContains(response, '20.00')
+
+        # Change a line behind the page's back: the cached fragment is still served
+        InvoiceDetail.objects.filter(invoice=self.invoice).update(amount=10)
+        self.assertContains(self.client.get(url), '20.00')
+
+        # Saving the invoice bumps its version and the fragment is rebuilt
+        self.invoice.save()
+        self.assertContains(self.client.get(url), '100.00')
+
+    def test_fragment_matches_a_fresh_render_after_product_rename(self):
+        from django.core.cache import cache
+        url = reverse('view_invoice_detail', args=[self.invoice.pk])
+        self.client.get(url)
+        self.product.product_name = "Renamed Product"
+        self.product.save()
+        cached = self.client.get(url)
+        cache.clear()
+        fresh = self.client.get(url)
+        self.assertContains(cached, 'Cached Product')
+        self.assertNotContains(fresh, 'Renamed Product')
+        self.assertEqual(cached['ETag'], fresh['ETag'])
+
+    def test_edit_invalidates_fragment(self):
+        url = reverse('view_invoice_detail', args=[self.invoice.pk])
+        self.client.get(url)
+        self.client.post(reverse('edit_invoice', args=[self.invoice.pk]), {
+            'customer': 'Cache Customer',
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-product': self.product.pk,
+            'form-0-amount': '7',
+        })
+        self.assertContains(self.client.get(url), '35.00')
+
+    def test_delete_drops_fragment(self):
+        from django.core.cache import cache
+        from .caching import detail_fragment_key
+        self.client.get(reverse('view_invoice_detail', args=[self.invoice.pk]))
+        key = detail_fragment_key(self.invoice)
+        self.assertIsNotNone(cache.get(key))
+
+        self.client.post(reverse('delete_invoice', args=[self.invoice.pk]))
+        self.assertIsNone(cache.get(key))
+
+
+class InvoiceNumberingTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            product_name="Numbered Product", cost_price=1.0, selling_price=2.0, product_unit="pcs"
+        )
+
+    def _create(self):
+        self.create_invoice([(self.product, 1)])
+        return Invoice.objects.latest('id')
+
+    def test_numbers_are_sequential_per_fiscal_year(self):
+        from .archive import current_fiscal_year
+        year = current_fiscal_year()
+        self.assertEqual(self._create().number, 'INV/%d/000001' % year)
+        self.assertEqual(self._create().number, 'INV/%d/000002' % year)
+
+    def test_rolled_back_invoice_releases_gapless_number(self):
+        import datetime
+        from django.db import transaction
+        from .numbering import allocate_invoice_number
+        day = datetime.date(2031, 6, 1)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(allocate_invoice_number(day), 'INV/2031/000001')
+                raise RuntimeError
+        with transaction.atomic():
+            self.assertEqual(allocate_invoice_number(day), 'INV/2031/000001')
+
+    def test_fiscal_year_rollover_starts_new_series(self):
+        import datetime
+        from django.db import transaction
+        from .numbering import allocate_invoice_number
+        with transaction.atomic():
+            allocate_invoice_number(datetime.date(2031, 3, 31))
+            self.assertEqual(allocate_invoice_number(datetime.date(2031, 3, 31)), 'INV/2030/000002')
+            self.assertEqual(allocate_invoice_number(datetime.date(2031, 4, 1)), 'INV/2031/000001')
+
+
+class InvoiceNumberBlockTests(TransactionTestCase):
+    # Blocks are reserved in their own transaction, so this needs real commits
+    def setUp(self):
+        from .numbering import allocator
+        allocator.clear()
+        self.addCleanup(allocator.clear)
+
+    def test_worker_reserves_a_block_at_a_time(self):
+        import datetime
+        from .models import InvoiceSequence
+        from .numbering import reserve_invoice_number
+        day = datetime.date(2031, 6, 1)
+        with self.settings(INVOICE_NUMBER_MODE='block', INVOICE_NUMBER_BLOCK_SIZE=5):
+            numbers = [reserve_invoice_number(day) for _ in range(7)]
+        self.assertEqual(numbers[0], 'INV/2031/000001')
+        self.assertEqual(len(set(numbers)), 7)
+        # Two blocks of five taken from the shared sequence
+        self.assertEqual(InvoiceSequence.objects.get(series='2031').next_value, 11)
+
+    def test_gapless_mode_defers_to_transaction(self):
+        from .numbering import reserve_invoice_number
+        with self.settings(INVOICE_NUMBER_MODE='gapless'):
+            self.assertIsNone(reserve_invoice_number())
+
+
+class ProductPriceHistoryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def _post(self, name, args=(), **prices):
+        data = {'product_name': 'Lamp', 'product_unit': 'pcs', 'cost_price': 10, 'selling_price': 15}
+        data.update(prices)
+        return self.client.post(reverse(name, args=args), data)
+
+    def test_product_writes_append_price_history(self):
+        from .models import ProductPrice
+        self._post('create_product')
+        lamp = Product.objects.get(product_name='Lamp')
+        self._post('edit_product', [lamp.pk])  # Unchanged prices add nothing
+        self._post('edit_product', [lamp.pk], selling_price=18)
+        prices = ProductPrice.objects.filter(product=lamp).order_by('effective_from', 'id')
+        self.assertEqual([p.selling_price for p in prices], [15, 18])
+
+    def test_as_of_lookups(self):
+        import datetime
+        from .models import ProductPrice
+        from .pricing import price_at, prices_as_of
+        lamp = Product.objects.create(product_name='Lamp', cost_price=12, selling_price=20, product_unit='pcs')
+        now = timezone.now()
+        ProductPrice.objects.create(product=lamp, cost_price=10, selling_price=15,
+                                    effective_from=now - datetime.timedelta(days=30))
+        ProductPrice.record(lamp, when=now - datetime.timedelta(days=10))
+
+        self.assertIsNone(price_at(lamp, now - datetime.timedelta(days=31)))
+        self.assertEqual(price_at(lamp, now - datetime.timedelta(days=20)).selling_price, 15)
+        self.assertEqual(price_at(lamp, now).selling_price, 20)
+        with self.assertNumQueries(1):
+            row, = prices_as_of(now - datetime.timedelta(days=20))
+        self.assertEqual(row.margin_as_of, 5)
+
+    def test_margin_report(self):
+        self._post('create_product')
+        response = self.client.get(reverse('product_margins'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '5.00')
+        self.assertContains(self.client.get(reverse('product_margins'), {'date': '2001-01-01'}),
+                            'No prices recorded by this date.')
+        response = self.client.get(reverse('product_margins'), {'date': '2024-02-30'})
+        self.assertEqual(response.context['date'], timezone.localdate())
+
+
+class ProductCatalogueTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        super().setUp()
+        self.products = [
+            Product.objects.create(product_name="Item %d" % i, cost_price=i, selling_price=i * 2, product_unit="pcs")
+            for i in range(1, 4)
+        ]
+
+    def test_invoice_lines_validated_and_priced_without_product_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .catalogue import get_catalogue
+        from .forms import InvoiceDetailFormSet
+        get_catalogue()
+        data = invoice_data([(product, 2) for product in self.products])
+        with self.assertNumQueries(0):
+            self.assertTrue(InvoiceDetailFormSet(data).is_valid())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('create_invoice'), data)
+        self.assertEqual(response.status_code, 302)
+        product_reads = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and '"invoice_product"' in q['sql']]
+        self.assertEqual(product_reads, [])
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.total, 24.0)
+        self.assertEqual(sorted(InvoiceDetail.objects.values_list('cost_price', 'selling_price')),
+                         [(1.0, 2.0), (2.0, 4.0), (3.0, 6.0)])
+
+    def test_product_changes_replace_the_snapshot(self):
+        from .catalogue import get_catalogue
+        from .forms import InvoiceDetailFormSet
+        first = get_catalogue()
+        self.assertIs(get_catalogue(), first)
+        item = self.products[0]
+        item.selling_price = 5
+        item.save()
+        self.assertEqual(get_catalogue().product(item.pk).selling_price, 5)
+
+        item.product_is_delete = True
+        item.save()
+        self.assertIsNone(get_catalogue().product(item.pk))
+        self.assertTrue(get_catalogue().product(item.pk, include_deleted=True).product_is_delete)
+        formset = InvoiceDetailFormSet(invoice_data([(item, 1)]))
+        self.assertFalse(formset.is_valid())
+        self.assertIn('product', formset.errors[0])
+
+    def test_editing_keeps_lines_of_deleted_products(self):
+        first, second = self.products[:2]
+        data = invoice_data([(first, 2), (second, 1)])
+        self.assertEqual(self.client.post(reverse('create_invoice'), data).status_code, 302)
+        invoice = Invoice.objects.get()
+        self.client.get(reverse('delete_product', args=[first.pk]))
+
+        url = reverse('edit_invoice', args=[invoice.pk])
+        self.assertContains(self.client.get(url), '<option value="%d" selected>Item 1 (deleted)</option>' % first.pk,
+                            html=True)
+        self.assertRedirects(self.client.post(url, data), reverse('view_invoice'))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total, 8.0)
+        self.assertEqual(sorted(InvoiceDetail.objects.values_list('product_id', 'amount')),
+                         [(first.pk, 2), (second.pk, 1)])
+
+    def test_expired_version_key_is_read_from_the_product_table(self):
+        from django.core.cache import cache
+        from .catalogue import get_catalogue, version_key
+        get_catalogue()
+        # Another worker's write, seen here once the cached key expires
+        Product.objects.filter(pk=self.products[1].pk).update(selling_price=9, catalogue_updated_at=timezone.now())
+        self.assertEqual(get_catalogue().product(self.products[1].pk).selling_price, 4)
+        cache.delete(version_key('default'))
+        self.assertEqual(get_catalogue().product(self.products[1].pk).selling_price, 9)
+
+    def test_sales_do_not_rebuild_the_snapshot(self):
+        from django.core.cache import cache
+        from .catalogue import get_catalogue, version_key
+        cache.delete(version_key('default'))
+        first = get_catalogue()  # Labelled with the version read from the product table
+        response = self.create_invoice([(self.products[0], 2)])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity_on_hand, -2)
+        cache.delete(version_key('default'))  # As if the key expired
+        self.assertIs(get_catalogue(), first)
+
+
+class AuthOverheadTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def _auth_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('edit_profile')).status_code, 200)
+        return [q['sql'] for q in queries if 'auth_user' in q['sql'] or 'django_session' in q['sql']]
+
+    def test_session_and_user_come_from_cache(self):
+        self.client.get(reverse('edit_profile'))
+        self.assertEqual(self._auth_queries(), [])
+
+    def test_saving_user_drops_cached_copy(self):
+        from django.core.cache import cache
+        from .auth import user_cache_key
+        self.client.get(reverse('edit_profile'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        # The old session no longer matches the password, so the client is logged out
+        self.assertEqual(self.client.get(reverse('edit_profile')).status_code, 302)
+
+    def test_edit_profile_saves_only_profile_fields(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('edit_profile'), {'username': 'renamed', 'email': 'r@example.com'})
+        update, = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "auth_user"')]
+        self.assertNotIn('password', update)
+        self.assertEqual(User.objects.get(pk=self.user.pk).username, 'renamed')
+
+    def test_signed_cookie_sessions(self):
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            client = Client()
+            client.login(username='testuser', password='testpassword')
+            self.assertEqual(client.get(reverse('edit_profile')).status_code, 200)
+
+    def test_sessions_from_the_plain_model_backend_stay_logged_in(self):
+        client = Client()
+        client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(client.get(reverse('edit_profile')).status_code, 200)
+
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.product = Product.objects.create(
+            product_name="Conditional Product", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+        self.invoice = Invoice.objects.create(customer="Conditional Customer", total=20.0)
+        InvoiceDetail.objects.create(invoice=self.invoice, product=self.product, product_name="Conditional Product",
+                                     amount=2, cost_price=5.0, selling_price=10.0)
+
+    def test_invoice_detail_revalidates_on_version(self):
+        url = reverse('view_invoice_detail', args=[self.invoice.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.invoice.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_list_revalidates_on_catalogue_change(self):
+        url = reverse('view_product')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.product.selling_price = 11.0
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pdf_conditional_and_range(self):
+        url = reverse('invoice_pdf', args=[self.invoice.pk])
+        full = self.client.get(url)
+        body = full.content
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.client.get(url).content, body)  # Same bytes for the same version
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=full['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=full['Last-Modified']).status_code, 304)
+
+        part = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=full['ETag'])
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part.content, body[:10])
+        self.assertEqual(part['Content-Range'], 'bytes 0-9/%d' % len(body))
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=-5').content, body[-5:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=%d-' % len(body)).status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=10-5').content, body)  # Invalid: ignored
+
+    def test_pdf_keeps_the_product_names_it_was_issued_with(self):
+        url = reverse('invoice_pdf', args=[self.invoice.pk])
+        full = self.client.get(url)
+        self.product.product_name = "Renamed Product"
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=full['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url).content, full.content)
+
+
+class StockLedgerTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pen = Product.objects.create(
+            product_name="Stock Pen", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+
+    def _on_hand(self):
+        self.pen.refresh_from_db()
+        return self.pen.quantity_on_hand
+
+    def test_invoice_writes_move_stock(self):
+        from .stock import ledger_drift
+        response = self.client.post(reverse('adjust_product_stock', args=[self.pen.pk]),
+                                    {'reason': 'receipt', 'quantity': '50', 'note': 'Opening stock'})
+        self.assertRedirects(response, reverse('view_product'))
+        self.create_invoice([(self.pen, 8)])
+        self.assertEqual(self._on_hand(), 42)
+
+        invoice = Invoice.objects.latest('id')
+        self.client.post(reverse('edit_invoice', args=[invoice.pk]), invoice_data([(self.pen, 3)]))
+        self.assertEqual(self._on_hand(), 47)
+        self.client.post(reverse('delete_invoice', args=[invoice.pk]))
+        self.assertEqual(self._on_hand(), 50)
+        self.assertEqual(ledger_drift(), [])
+
+    def test_product_edits_keep_concurrent_stock_movements(self):
+        from .stock import adjust_stock, ledger_drift
+        stale = Product.objects.get(pk=self.pen.pk)
+        adjust_stock(self.pen, 10)  # Lands between loading the product and saving it
+        stale.product_name = 'Renamed Pen'
+        stale.save()
+        self.assertEqual(self._on_hand(), 10)
+        self.assertEqual(self.pen.product_name, 'Renamed Pen')
+
+        response = self.client.post(reverse('edit_product', args=[self.pen.pk]), {
+            'product_name': 'Stock Pen', 'product_unit': 'pcs', 'cost_price': 6, 'selling_price': 12,
+        })
+        self.assertRedirects(response, reverse('view_product'))
+        self.client.get(reverse('delete_product', args=[self.pen.pk]))
+        self.assertEqual(self._on_hand(), 10)
+        self.assertEqual(ledger_drift(), [])
+
+    def test_sales_may_take_stock_negative(self):
+        self.create_invoice([(self.pen, 4)])
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(self._on_hand(), -4)
+
+    def test_compaction_keeps_totals(self):
+        import datetime
+        from .models import StockMovement
+        from .stock import adjust_stock, ledger_drift
+        for quantity in (10, -2, -3):
+            adjust_stock(self.pen, quantity)
+        StockMovement.objects.update(created_at=timezone.now() - datetime.timedelta(days=200))
+        adjust_stock(self.pen, 1)
+
+        out = StringIO()
+        call_command('compact_stock_ledger', stdout=out)
+        self.assertIn('Removed 2 ledger rows', out.getvalue())
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('reason', 'quantity')),
+            [('compacted', 5), ('receipt', 1)],
+        )
+        self.assertEqual(self._on_hand(), 6)
+        self.assertEqual(ledger_drift(), [])
+
+    def test_drift_is_reported(self):
+        Product.objects.filter(pk=self.pen.pk).update(quantity_on_hand=3)
+        out = StringIO()
+        call_command('compact_stock_ledger', stdout=out)
+        self.assertIn('on hand 3, ledger 0', out.getvalue())
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.lamp = Product.objects.create(
+            product_name="Brass Desk Lamp", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+        self.client.post(reverse('create_invoice'), {
+            'customer': 'Acme Traders',
+            'email': 'orders@acme.example',
+            'comments': 'Deliver before Diwali',
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-product': self.lamp.pk,
+            'form-0-amount': '2',
+        })
+        self.invoice = Invoice.objects.get()
+
+    def _hits(self, query, kind=None):
+        from .search import search
+        return [(entry.kind, entry.object_id) for entry in search(query, kind)]
+
+    def test_writes_keep_index_in_sync(self):
+        customer = Customer.objects.get()
+        self.assertIn(('invoice', self.invoice.pk), self._hits('diwali'))
+        self.assertIn(('invoice', self.invoice.pk), self._hits('lamp'))  # Product names on the lines
+        self.assertEqual(self._hits('acm', 'customer'), [('customer', customer.pk)])  # Prefix match
+
+        self.lamp.product_name = 'Copper Floor Lamp'
+        self.lamp.save()
+        self.assertEqual(self._hits('copper', 'product'), [('product', self.lamp.pk)])
+        self.assertEqual(self._hits('brass', 'product'), [])
+
+        self.client.post(reverse('delete_invoice', args=[self.invoice.pk]))
+        self.assertEqual(self._hits('diwali'), [])
+
+    def test_title_matches_rank_first(self):
+        lamp_shop = Customer.objects.create(customer_name='Lamp House', customer_key='lamp house')
+        hits = self._hits('lamp')
+        # The invoice only mentions the lamp in its body (the line's product name)
+        self.assertEqual(sorted(hits[:2]), [('customer', lamp_shop.pk), ('product', self.lamp.pk)])
+        self.assertEqual(hits[2], ('invoice', self.invoice.pk))
+
+    def test_search_page_hides_deleted_products(self):
+        response = self.client.get(reverse('search'), {'q': 'brass lamp'})
+        self.assertContains(response, 'Brass Desk Lamp')
+        self.client.get(reverse('delete_product', args=[self.lamp.pk]))
+        response = self.client.get(reverse('search'), {'q': 'brass', 'kind': 'product'})
+        self.assertContains(response, 'Nothing matches')
+
+    def test_common_words_rank_only_recent_matches(self):
+        from unittest import mock
+        from . import search
+        widgets = [
+            Product.objects.create(product_name="Widget %d" % i, product_unit="pcs") for i in range(5)
+        ]
+        with mock.patch.object(search, 'RANK_WINDOW', 2):
+            hits = self._hits('widget', 'product')
+        self.assertEqual(sorted(hits), [('product', widgets[3].pk), ('product', widgets[4].pk)])
+
+    def test_recent_invoices_do_not_hide_older_products(self):
+        from unittest import mock
+        from . import search
+        for i in range(3):
+            self.client.post(reverse('create_invoice'), {
+                'customer': 'Buyer %d' % i,
+                'form-TOTAL_FORMS': '1',
+                'form-INITIAL_FORMS': '0',
+                'form-MIN_NUM_FORMS': '0',
+                'form-MAX_NUM_FORMS': '1000',
+                'form-0-product': self.lamp.pk,
+                'form-0-amount': '1',
+            })
+        with mock.patch.object(search, 'RANK_WINDOW', 2):
+            hits = self._hits('lamp')
+        self.assertEqual(hits[0], ('product', self.lamp.pk))
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(self._hits('"acme (lamp*'), [('invoice', self.invoice.pk)])
+        self.assertEqual(self._hits('acme OR diwali'), [])  # OR is a word to match, not an operator
+        self.assertEqual(self._hits('***'), [])
+
+    def test_rebuild_and_admin_search(self):
+        from .models import SearchEntry
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 documents', out.getvalue())
+        self.assertIn(('invoice', self.invoice.pk), self._hits('orders acme'))
+
+        admin_user = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:invoice_invoice_changelist'), {'q': 'diwali'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.invoice])
+
+
+    def test_admin_cannot_write_lines_past_the_invoice_pages(self):
+        detail = InvoiceDetail.objects.get()
+        admin_user = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get(reverse('admin:invoice_invoice_add')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:invoice_invoicedetail_add')).status_code, 403)
+        self.client.post(reverse('admin:invoice_invoicedetail_change', args=[detail.pk]), {'amount': '50'})
+        self.assertEqual(InvoiceDetail.objects.get().amount, 2)
+
+        # Header edits still save, and reach the search index; the line inline is display only
+        response = self.client.post(reverse('admin:invoice_invoice_change', args=[self.invoice.pk]), {
+            'customer': 'Acme Traders',
+            'contact': '',
+            'email': 'orders@acme.example',
+            'comments': 'Deliver before Holi',
+            'customer_ref': self.invoice.customer_ref_id,
+            'invoicedetail_set-TOTAL_FORMS': '2',
+            'invoicedetail_set-INITIAL_FORMS': '1',
+            'invoicedetail_set-MIN_NUM_FORMS': '0',
+            'invoicedetail_set-MAX_NUM_FORMS': '1000',
+            'invoicedetail_set-0-id': detail.pk,
+            'invoicedetail_set-0-invoice': self.invoice.pk,
+            'invoicedetail_set-0-amount': '50',
+            'invoicedetail_set-1-invoice': self.invoice.pk,
+            'invoicedetail_set-1-product': self.lamp.pk,
+            'invoicedetail_set-1-amount': '3',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Invoice.objects.get().comments, 'Deliver before Holi')
+        self.assertEqual(list(InvoiceDetail.objects.values_list('amount', flat=True)), [2])
+        self.assertIn(('invoice', self.invoice.pk), self._hits('holi'))
+        self.assertEqual(self._hits('diwali'), [])
+
+
+class BulkInvoiceDeleteTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.pen = Product.objects.create(
+            product_name="Bulk Pen", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+        for customer in ('Acme Traders', 'Acme Stores', 'Zen Retail'):
+            self.client.post(reverse('create_invoice'), {
+                'customer': customer,
+                'form-TOTAL_FORMS': '1',
+                'form-INITIAL_FORMS': '0',
+                'form-MIN_NUM_FORMS': '0',
+                'form-MAX_NUM_FORMS': '1000',
+                'form-0-product': self.pen.pk,
+                'form-0-amount': '3',
+            })
+
+    def test_delete_by_filter_keeps_rollups_and_stock(self):
+        from .models import SearchEntry
+        from .stock import ledger_drift
+        response = self.client.get(reverse('delete_all_invoice'), {'customer': 'acme'})
+        self.assertEqual(response.context['matching'], 2)
+        acme_ids = list(Invoice.objects.filter(customer__startswith='Acme').values_list('pk', flat=True))
+        response = self.client.post(reverse('delete_all_invoice'), {'customer': 'acme'})
+        self.assertRedirects(response, reverse('view_invoice'))
+
+        self.assertEqual(list(Invoice.objects.values_list('customer', flat=True)), ['Zen Retail'])
+        self.assertEqual(InvoiceDetail.objects.count(), 1)
+        rollup = ProductDailySales.objects.get()
+        self.assertEqual((rollup.quantity, rollup.revenue, rollup.profit), (3, 30.0, 15.0))
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.quantity_on_hand, -3)
+        self.assertEqual(ledger_drift(), [])
+        self.assertEqual(
+            sorted(Tombstone.objects.filter(model_name='invoice').values_list('object_id', flat=True)), acme_ids
+        )
+        self.assertFalse(SearchEntry.objects.filter(kind=SearchEntry.INVOICE, object_id__in=acme_ids).exists())
+
+    def test_large_deletes_continue_over_several_requests(self):
+        with self.settings(INVOICE_BULK_DELETE_PER_REQUEST=2, INVOICE_BULK_DELETE_BATCH_SIZE=1):
+            response = self.client.post(reverse('delete_all_invoice'), {'all_invoices': 'on'})
+            self.assertEqual((response.context['deleted'], response.context['remaining']), (2, 1))
+            self.assertContains(response, 'id="continueDelete"')
+            response = self.client.post(reverse('delete_all_invoice'), {'all_invoices': 'True', 'deleted': '2'})
+        self.assertRedirects(response, reverse('view_invoice'))
+        self.assertEqual(Invoice.objects.count(), 0)
+        self.assertFalse(ProductDailySales.objects.exclude(quantity=0).exists())
+
+    def test_a_filter_is_required(self):
+        response = self.client.post(reverse('delete_all_invoice'), {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Invoice.objects.count(), 3)
+
+    def test_tampered_progress_count_is_rejected(self):
+        for deleted in ('lots', '-5'):
+            response = self.client.post(reverse('delete_all_invoice'), {'all_invoices': 'on', 'deleted': deleted})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('deleted', response.context['form'].errors)
+        self.assertEqual(Invoice.objects.count(), 3)
+
+    def test_command_and_admin_use_the_bulk_path(self):
+        out = StringIO()
+        call_command('delete_invoices', customer='zen', interactive=False, batch_size=1, stdout=out)
+        self.assertIn('[1/1 invoices] deleted', out.getvalue())
+
+        admin_user = User.objects.create_superuser(username='admin', password='adminpassword')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:invoice_invoice_changelist'), {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(Invoice.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(Invoice.objects.count(), 0)
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.quantity_on_hand, 0)
+        self.assertFalse(ProductDailySales.objects.exclude(quantity=0).exists())
+
+
+class InvoiceEmailTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.pen = Product.objects.create(
+            product_name="Mail Pen", cost_price=5.0, selling_price=10.0, product_unit="pcs"
+        )
+        for customer in ('Acme Traders', 'Zen Retail', 'Walk-in'):
+            self.client.post(reverse('create_invoice'), {
+                'customer': customer,
+                'email': '' if customer == 'Walk-in' else 'billing@%s.example' % customer.split()[0].lower(),
+                'form-TOTAL_FORMS': '1',
+                'form-INITIAL_FORMS': '0',
+                'form-MIN_NUM_FORMS': '0',
+                'form-MAX_NUM_FORMS': '1000',
+                'form-0-product': self.pen.pk,
+                'form-0-amount': '2',
+            })
+        self.invoice = Invoice.objects.get(customer='Acme Traders')
+
+    def test_send_from_detail_page(self):
+        from django.core import mail
+        from .mailer import send_all
+        from .models import InvoiceEmail
+        response = self.client.post(reverse('send_invoice_email', args=[self.invoice.pk]), {'to': ''})
+        self.assertRedirects(response, reverse('view_invoice'))
+        self.assertEqual(len(mail.outbox), 0)  # Nothing is sent during the request
+
+        with self.settings(INVOICE_EMAIL_RATE=0):
+            self.assertEqual(send_all(), (1, 0))
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['billing@acme.example'])
+        self.assertEqual(message.subject, 'Invoice %s' % self.invoice.number)
+        name, content, mimetype = message.attachments[0]
+        self.assertEqual((name, mimetype), ('Invoice_%d.pdf' % self.invoice.pk, 'application/pdf'))
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(InvoiceEmail.objects.get().status, InvoiceEmail.SENT)
+
+        response = self.client.post(reverse('send_invoice_email', args=[self.invoice.pk]), {'to': 'not-an-email'})
+        self.assertEqual(InvoiceEmail.objects.count(), 1)
+
+    def test_batch_shares_one_connection_and_is_throttled(self):
+        from unittest import mock
+        from django.core import mail
+        from . import mailer
+        self.assertEqual(mailer.queue_invoice_emails(Invoice.objects.all()), 2)  # Walk-in has no email
+        waits = []
+        with self.settings(INVOICE_EMAIL_RATE=1), \
+                mock.patch.object(mailer, 'get_connection', wraps=mailer.get_connection) as get_connection:
+            self.assertEqual(mailer.send_all(sleep=waits.append), (2, 0))
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(waits), 1)
+        self.assertGreater(waits[0], 0.9)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failures_retry_with_backoff_then_give_up(self):
+        import datetime
+        from unittest import mock
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from .mailer import queue_invoice_email, send_all
+        from .models import InvoiceEmail
+        email = queue_invoice_email(self.invoice)
+        with self.settings(INVOICE_EMAIL_MAX_ATTEMPTS=2, INVOICE_EMAIL_RETRY_SECONDS=60), \
+                mock.patch.object(EmailBackend, 'send_messages', side_effect=OSError('Connection refused')), \
+                self.assertLogs('invoice.mailer', 'WARNING'):
+            self.assertEqual(send_all(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), ('queued', 1, 'Connection refused'))
+            self.assertGreater(email.next_attempt_at, timezone.now() + datetime.timedelta(seconds=50))
+            self.assertEqual(send_all(), (0, 0))  # Not due yet
+
+            InvoiceEmail.objects.update(next_attempt_at=timezone.now())
+            send_all()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_line_of_a_removed_product_is_still_sent(self):
+        from django.core import mail
+        from .mailer import queue_invoice_email, send_all
+        self.pen.delete()  # Lines keep their name; product is set to NULL
+        self.assertIsNone(InvoiceDetail.objects.filter(invoice=self.invoice).get().product)
+        queue_invoice_email(self.invoice)
+        with self.settings(INVOICE_EMAIL_RATE=0):
+            self.assertEqual(send_all(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_build_error_fails_only_its_own_row(self):
+        from unittest import mock
+        from django.core import mail
+        from . import mailer
+        from .models import InvoiceEmail
+        mailer.queue_invoice_emails(Invoice.objects.all())
+        build = mailer.build_message
+
+        def broken_for_acme(email):
+            if email.invoice_id == self.invoice.pk:
+                raise AttributeError("'NoneType' object has no attribute 'product_name'")
+            return build(email)
+
+        with self.settings(INVOICE_EMAIL_RATE=0), mock.patch.object(mailer, 'build_message', broken_for_acme), \
+                self.assertLogs('invoice.mailer', 'WARNING'):
+            self.assertEqual(mailer.send_all(), (1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        email = InvoiceEmail.objects.get(invoice_id=self.invoice.pk)
+        self.assertEqual((email.status, email.attempts, email.claim), ('queued', 1, ''))
+        self.assertFalse(InvoiceEmail.objects.filter(status=InvoiceEmail.SENDING).exists())
+
+    def test_command_sends_due_emails(self):
+        from django.core import mail
+        from .mailer import queue_invoice_email
+        queue_invoice_email(self.invoice, 'accounts@acme.example')
+        out = StringIO()
+        with self.settings(INVOICE_EMAIL_RATE=0):
+            call_command('send_invoice_emails', stdout=out)
+        self.assertIn('1 sent, 0 failed', out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['accounts@acme.example'])
+
+
+class DatabaseBackupTests(TestCase):
+    def setUp(self):
+        import os
+        import shutil
+        import sqlite3
+        import tempfile
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.source = os.path.join(self.workdir, 'live.sqlite3')
+        self.backups = os.path.join(self.workdir, 'backups')
+        conn = sqlite3.connect(self.source)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE note (id INTEGER PRIMARY KEY, body TEXT)')
+        self._add_rows(conn, 3000)
+        conn.close()
+
+    def _add_rows(self, conn, count):
+        import os
+        conn.executemany('INSERT INTO note (body) VALUES (?)', [(os.urandom(60).hex(),) for _ in range(count)])
+        conn.commit()
+
+    def _count(self, path):
+        import sqlite3
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM note').fetchone()[0]
+        finally:
+            conn.close()
+
+    def _backup(self):
+        from .backup import backup_database
+        return backup_database(self.backups, source_path=self.source, chunk_size=64 * 1024, pages=16, sleep=0)
+
+    def test_incremental_backup_verify_and_restore(self):
+        import os
+        import sqlite3
+        from .backup import restore_database, verify_backup
+        first = self._backup()
+        self.assertEqual((first['tables'], first['journal_mode']), ({'note': 3000}, 'wal'))
+        self.assertEqual(first['new_chunks'], len(first['chunks']))
+
+        live = sqlite3.connect(self.source)
+        self._add_rows(live, 100)
+        second = self._backup()
+        self.assertEqual(second['tables'], {'note': 3100})
+        self.assertLess(second['new_chunks'], len(second['chunks']) // 2)  # Unchanged chunks are shared
+        self.assertEqual(verify_backup(first['name'], self.backups), [])
+        self.assertEqual(verify_backup(None, self.backups), [])
+
+        copy = os.path.join(self.workdir, 'copy.sqlite3')
+        restore_database(second['name'], self.backups, target_path=copy)
+        self.assertEqual(self._count(copy), 3100)
+        # Over a database that is still open elsewhere
+        restore_database(first['name'], self.backups, target_path=self.source)
+        self.assertEqual(live.execute('SELECT COUNT(*) FROM note').fetchone()[0], 3000)
+        live.close()
+
+    def test_damaged_backup_is_not_restored(self):
+        import os
+        from .backup import BackupError, _chunk_path, restore_database, verify_backup
+        manifest = self._backup()
+        with open(_chunk_path(self.backups, manifest['chunks'][3]), 'r+b') as f:
+            f.write(b'garbage')
+        problems = verify_backup(manifest['name'], self.backups)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('unreadable', problems[0])
+        with self.assertRaises(BackupError):
+            restore_database(manifest['name'], self.backups, target_path=self.source)
+        self.assertEqual(self._count(self.source), 3000)
+        self.assertFalse(os.path.exists(self.source + '.restore'))
+
+        out = StringIO()
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('verify_backup', dir=self.backups, stdout=out)
+
+    def test_prune_keeps_chunks_still_in_use(self):
+        import sqlite3
+        from .backup import list_backups, prune, verify_backup
+        first = self._backup()
+        conn = sqlite3.connect(self.source)
+        self._add_rows(conn, 100)
+        conn.close()
+        second = self._backup()
+        self.assertEqual(prune(1, self.backups), [first['name']])
+        self.assertEqual(list_backups(self.backups), [second['name']])
+        self.assertEqual(verify_backup(None, self.backups), [])
+
+    def test_in_memory_database_is_refused(self):
+        from django.core.management.base import CommandError
+        with self.assertRaisesMessage(CommandError, 'Only SQLite database files'):
+            call_command('backup_database', dir=self.backups, stdout=StringIO())
+
+
+class TenantTests(LoggedInMixin, TransactionTestCase):
+    # Committed rows, so the report's pool threads see them; configured tenant aliases too
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            product_name="Tenant Product", cost_price=1.0, selling_price=3.0, product_unit="pcs"
+        )
+
+    def test_router_sends_only_invoice_models_to_active_tenant(self):
+        from .tenants import TenantRouter, tenant_db, use_tenant
+        router = TenantRouter()
+        with self.settings(INVOICE_TENANTS={'kochi': {}}):
+            self.assertIsNone(router.db_for_read(Invoice))
+            with use_tenant('kochi'):
+                self.assertEqual(tenant_db(), 'tenant_kochi')
+                self.assertEqual(router.db_for_read(Invoice), 'tenant_kochi')
+                self.assertEqual(router.db_for_write(Product), 'tenant_kochi')
+                self.assertIsNone(router.db_for_read(User))
+            self.assertEqual(tenant_db(), 'default')
+            self.assertFalse(router.allow_migrate('tenant_kochi', 'auth'))
+            self.assertTrue(router.allow_migrate('tenant_kochi', 'invoice'))
+            self.assertIsNone(router.allow_migrate('default', 'auth'))
+            with self.assertRaises(KeyError):
+                with use_tenant('nowhere'):
+                    pass
+
+    def test_tenant_resolved_from_url_prefix_or_host(self):
+        from unittest import mock
+        from django.urls import get_script_prefix
+        from . import tenants
+        seen = []
+        original = tenants.TenantRouter.db_for_read
+
+        def spy(router, model, **hints):
+            seen.append(tenants.current_tenant())
+            return original(router, model, **hints)
+
+        # Any configured alias can stand in for the tenant's database here
+        shops = {'kochi': {'hosts': ['kochi.example.com'], 'database': 'default'}}
+        with self.settings(INVOICE_TENANTS=shops), mock.patch.object(tenants.TenantRouter, 'db_for_read', spy):
+            response = self.client.get('/t/kochi' + reverse('view_product'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(seen), {'kochi'})
+            # Links stay inside the shop
+            self.assertContains(response, 'href="/t/kochi%s"' % reverse('create_product'))
+            self.assertEqual(get_script_prefix(), '/')
+
+            seen.clear()
+            self.assertEqual(self.client.get(reverse('view_product'), HTTP_HOST='kochi.example.com').status_code, 200)
+            self.assertEqual(set(seen), {'kochi'})
+            seen.clear()
+            self.assertEqual(self.client.get(reverse('view_product')).status_code, 200)
+            self.assertEqual(set(seen), {None})
+            self.assertEqual(self.client.get('/t/nowhere' + reverse('view_product')).status_code, 404)
+
+    def test_cross_tenant_report_runs_per_tenant_in_parallel(self):
+        import threading
+        from unittest import mock
+        from . import rollups
+        self.assertEqual(self.create_invoice([(self.product, 2)]).status_code, 302)
+        threads = []
+        original = rollups._tenant_sales
+
+        def spy(*args):
+            threads.append(threading.current_thread().name)
+            return original(*args)
+
+        shops = {'kochi': {'database': 'default'}, 'calicut': {'database': 'default'}}
+        today = timezone.localdate()
+        with self.settings(INVOICE_TENANTS=shops), mock.patch.object(rollups, '_tenant_sales', spy):
+            totals, top = rollups.tenant_sales(today, today)
+            response = self.client.get(reverse('tenant_sales'))
+        self.assertEqual(totals['kochi'], {'quantity': 2, 'revenue': 6.0, 'profit': 4.0})
+        self.assertEqual(totals['calicut'], totals['kochi'])
+        # Both shops sold the same product, so it is merged across them
+        self.assertEqual([(row['product__product_name'], row['revenue_sum']) for row in top], [('Tenant Product', 12.0)])
+        self.assertTrue(all(name.startswith('invoice-tenant') for name in threads))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['grand_total']['revenue'], 12.0)
+
+    def test_pool_threads_keep_their_tenant_connections(self):
+        import threading
+        from unittest import mock
+        from django.db import connections
+        from . import tenants
+
+        def open_connection():
+            Product.objects.exists()
+            return threading.current_thread().name, connections[tenants.tenant_db()].connection
+
+        wrapper = type(connections['default'])
+        shops = {'kochi': {'database': 'default'}}
+        with self.settings(INVOICE_TENANTS=shops), mock.patch.object(tenants, '_pool', None), \
+                mock.patch.dict(connections.settings['default'], {'CONN_MAX_AGE': 600}):
+            with mock.patch.object(wrapper, 'close', autospec=True, side_effect=wrapper.close) as close:
+                first = tenants.for_each_tenant(open_connection, workers=1)
+                second = tenants.for_each_tenant(open_connection, workers=1)
+            tenants._pool[1].shutdown()
+        self.assertEqual(first, second)  # Same pool thread, same connection
+        self.assertEqual(close.call_count, 0)
+
+    def test_configured_tenant_databases_are_separate(self):
+        from django.conf import settings
+        from .tenants import tenant_alias, use_tenant
+        shops = [slug for slug in settings.INVOICE_TENANTS if tenant_alias(slug) != 'default']
+        if len(shops) < 2:
+            self.skipTest('INVOICE_TENANTS does not name two tenants with their own databases')
+        first, second = shops[:2]
+        with use_tenant(first):
+            self.product = Product.objects.create(
+                product_name="First Shop Product", cost_price=1.0, selling_price=3.0, product_unit="pcs"
+            )
+        response = self.client.post('/t/%s%s' % (first, reverse('create_invoice')), invoice_data([(self.product, 1)]))
+        self.assertEqual(response.status_code, 302)
+        with use_tenant(first):
+            self.assertEqual(Invoice.objects.count(), 1)
+            self.assertEqual(InvoiceDetail.objects.count(), 1)
+        with use_tenant(second):
+            self.assertEqual(Invoice.objects.count(), 0)
+        self.assertEqual(Invoice.objects.count(), 0)
+
+
+class AdmissionControlTests(TestCase):
+    endpoint = 'download_invoice_lines'
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.core.cache import cache
+        cache.clear()
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.limit(concurrency=1, queue=0, wait=1)
+        settings = self.settings(INVOICE_ADMISSION_DIR=workdir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def limit(self, **config):
+        settings = self.settings(INVOICE_ADMISSION={self.endpoint: config})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self):
+        response = self.client.get(reverse(self.endpoint))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def rejected(self):
+        with self.assertLogs('invoice.admission', 'WARNING'):
+            return self.client.get(reverse(self.endpoint))
+
+    def test_busy_endpoint_turns_requests_away_with_retry_after(self):
+        from .admission import acquire, metrics
+        ticket = acquire(self.endpoint, user='someone else')
+        response = self.rejected()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        ticket.release()
+        self.assertEqual(self.get().status_code, 200)
+        counts = metrics()[self.endpoint]
+        self.assertEqual((counts['admitted'], counts['rejected_busy'], counts['queued']), (1, 1, 0))
+
+        self.assertEqual(self.client.get(reverse('admission_stats')).status_code, 302)  # Staff only
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('admission_stats')).json()['metrics'], metrics())
+
+    def test_queued_request_waits_for_a_slot_or_times_out(self):
+        import threading
+        from .admission import acquire, metrics
+        self.limit(concurrency=1, queue=1, wait=0.3)
+        ticket = acquire(self.endpoint, user='someone else')
+        self.assertEqual(self.rejected().status_code, 503)
+        self.limit(concurrency=1, queue=1, wait=5)
+        threading.Timer(0.3, ticket.release).start()
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(float(response['Server-Timing'].split('dur=')[1]), 200)
+        counts = metrics()[self.endpoint]
+        self.assertEqual((counts['admitted'], counts['rejected_timeout'], counts['queued']), (1, 1, 2))
+        self.assertGreaterEqual(counts['queued_ms'], 500)
+
+    def test_per_user_limit(self):
+        from .admission import acquire, metrics
+        self.limit(concurrency=3, per_user=1, queue=0)
+        mine = acquire(self.endpoint, user=self.user.pk)
+        self.assertEqual(self.rejected().status_code, 503)
+        self.assertEqual(metrics()[self.endpoint]['rejected_user'], 1)
+        acquire(self.endpoint, user='someone else').release()
+        mine.release()
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_streamed_response_keeps_its_slot_until_sent(self):
+        from .admission import Rejected, acquire
+        response = self.client.get(reverse(self.endpoint))
+        self.assertTrue(response.streaming)
+        with self.assertRaises(Rejected):
+            acquire(self.endpoint)
+        b''.join(response.streaming_content)
+        acquire(self.endpoint).release()
+
+
+class InvoiceApiTests(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+        settings = override_settings(INVOICE_ADMISSION={})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.product = Product.objects.create(product_name='Pen', cost_price=5, selling_price=10, product_unit='pcs')
+        self.invoices = []
+        for i in range(3):
+            invoice = Invoice.objects.create(customer='Customer %d' % i, total=20 * (i + 1))
+            InvoiceDetail.objects.create(invoice=invoice, product=self.product, product_name='Pen', amount=i + 1,
+                                         cost_price=5, selling_price=10)
+            self.invoices.append(invoice)
+
+    def test_fields_select_invoice_and_line_columns(self):
+        url = reverse('invoice_api')
+        with self.assertNumQueries(2):  # The user, then the page: no line query
+            data = self.client.get(url, {'fields': 'customer,total'}).json()
+        self.assertEqual(data['invoices'][0], {'id': self.invoices[2].pk, 'customer': 'Customer 2', 'total': 60.0})
+
+        data = self.client.get(url, {'fields': 'total,lines.product_name,lines.amount'}).json()
+        self.assertEqual(data['invoices'][-1], {
+            'id': self.invoices[0].pk, 'total': 20.0, 'lines': [{'product_name': 'Pen', 'amount': 1}],
+        })
+        full = self.client.get(url).json()['invoices'][0]
+        self.assertEqual(full['date'], str(self.invoices[2].date))
+        self.assertEqual(full['lines'][0]['product_id'], self.product.pk)
+        self.assertEqual(self.client.get(url, {'fields': 'lines.password'}).status_code, 400)
+
+    def test_pages_follow_the_after_cursor(self):
+        url = reverse('invoice_api')
+        first = self.client.get(url, {'limit': 2, 'fields': 'id'}).json()
+        self.assertEqual([row['id'] for row in first['invoices']], [self.invoices[2].pk, self.invoices[1].pk])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(second, {'invoices': [{'id': self.invoices[0].pk}], 'next': None})
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+
+    def test_compressed_json_and_ndjson_stream(self):
+        import gzip
+        import json
+        import brotli
+        url = reverse('invoice_api')
+        plain = self.client.get(url)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        response = self.client.get(url, {'format': 'ndjson', 'fields': 'customer,lines.amount'},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['customer'] for row in rows], ['Customer 2', 'Customer 1', 'Customer 0'])
+        self.assertEqual(rows[1]['lines'], [{'amount': 2}])
+
+
+class GstTaxTests(LoggedInMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pen = Product.objects.create(product_name='Pen', cost_price=5, selling_price=99.99, product_unit='pcs',
+                                          hsn_code='9608', gst_rate=18)
+        self.rice = Product.objects.create(product_name='Rice', cost_price=40, selling_price=50, product_unit='kg',
+                                           hsn_code='1006', gst_rate=5)
+
+    def _create(self, rows, **fields):
+        self.create_invoice(rows, **fields)
+        return Invoice.objects.latest('id')
+
+    def test_line_tax_rounds_each_half_and_matches_sql(self):
+        from .tax import line_tax, line_tax_expression
+        self.assertEqual(line_tax(99.99, 3, 18, inter_state=True), 53.99)
+        self.assertEqual(line_tax(99.99, 3, 18), 54.0)  # CGST and SGST of 27.00 each
+        self.assertEqual(line_tax(10, 1, 0.25, inter_state=True), 0.03)
+        self.assertEqual(line_tax(10, 1, 0.25), 0.02)
+
+        cases = [(99.99, 3, 18), (10, 1, 0.25), (0.35, 7, 5), (1234.56, 13, 28), (2.675, 1, 3), (50, 2, 0)]
+        for inter_state in (False, True):
+            invoice = Invoice.objects.create(customer='SQL', inter_state=inter_state)
+            for price, amount, rate in cases:
+                InvoiceDetail.objects.create(invoice=invoice, product=self.pen, amount=amount,
+                                             selling_price=price, tax_rate=rate)
+            rows = InvoiceDetail.objects.filter(invoice=invoice).annotate(
+                sql_tax=line_tax_expression(inter_state),
+            ).values_list('selling_price', 'amount', 'tax_rate', 'sql_tax')
+            for price, amount, rate, sql_tax in rows:
+                self.assertEqual(sql_tax, line_tax(price, amount, rate, inter_state), (price, amount, rate))
+
+    def test_invoice_write_stores_tax_per_line(self):
+        invoice = self._create([(self.pen, 3), (self.rice, 2)])
+        lines = {line.product_id: line for line in InvoiceDetail.objects.filter(invoice=invoice)}
+        self.assertEqual((lines[self.pen.pk].hsn_code, lines[self.pen.pk].tax_rate, lines[self.pen.pk].tax_amount),
+                         ('9608', 18, 54.0))
+        self.assertEqual(lines[self.rice.pk].tax_amount, 5.0)
+        self.assertAlmostEqual(invoice.total, 399.97)
+        self.assertEqual(invoice.tax_total, 59.0)
+        self.assertEqual((invoice.central_tax, invoice.state_tax, invoice.integrated_tax), (29.5, 29.5, 0))
+        self.assertAlmostEqual(invoice.grand_total, 458.97)
+        response = self.client.get(reverse('view_invoice_detail', args=[invoice.pk]))
+        self.assertContains(response, 'CGST')
+        self.assertContains(response, '458.97')
+
+        invoice = self._create([(self.pen, 3)], inter_state='on')
+        self.assertEqual((invoice.tax_total, invoice.integrated_tax, invoice.central_tax), (53.99, 53.99, 0))
+
+    def test_recalculate_command_after_rate_change(self):
+        old = self._create([(self.pen, 3), (self.rice, 2)])
+        before = old.updated_at
+        self.pen.gst_rate = 12
+        self.pen.save()
+        new = self._create([(self.pen, 1)])
+
+        out = StringIO()
+        call_command('recalculate_invoice_tax', '--dry-run', stdout=out)
+        self.assertIn('1 invoice lines', out.getvalue())
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):  # Issued invoices are only re-taxed when asked to
+            call_command('recalculate_invoice_tax', stdout=StringIO())
+        with self.assertNumQueries(9):  # The batch's ids, a transaction of five UPDATEs, the empty next batch
+            call_command('recalculate_invoice_tax', '--all', stdout=StringIO())
+
+        old.refresh_from_db()
+        self.assertEqual(InvoiceDetail.objects.get(invoice=old, product=self.pen).tax_amount, 36.0)
+        self.assertEqual(InvoiceDetail.objects.get(invoice=old, product=self.rice).tax_amount, 5.0)
+        self.assertEqual(old.tax_total, 41.0)
+        self.assertGreater(old.updated_at, before)
+        unchanged = new.updated_at
+        new.refresh_from_db()
+        self.assertEqual(new.updated_at, unchanged)
+
+        out = StringIO()
+        call_command('recalculate_invoice_tax', '--since', str(old.date), stdout=out)
+        self.assertIn('0 lines re-rated, 0 line tax amounts and 0 invoice tax totals changed', out.getvalue())
+        out = StringIO()
+        call_command('verify_invoice_totals', '--workers', '1', '--dry-run', stdout=out)
+        self.assertIn('Found 0 mismatched', out.getvalue())
+
+    def test_new_hsn_code_moves_the_invoice_version(self):
+        invoice = self._create([(self.pen, 3)])
+        before = invoice.updated_at
+        self.pen.hsn_code = '9609'
+        self.pen.save()
+        out = StringIO()
+        call_command('recalculate_invoice_tax', '--all', stdout=out)
+        self.assertIn('1 lines re-rated, 0 line tax amounts and 0 invoice tax totals changed', out.getvalue())
+        invoice.refresh_from_db()
+        self.assertGreater(invoice.updated_at, before)  # The detail page shows the code
+
+    def test_tax_report_sums_stored_columns(self):
+        self._create([(self.pen, 3), (self.rice, 2)])
+        self._create([(self.pen, 1)], inter_state='on')
+        archived = ArchivedInvoice.objects.create(id=900, customer='Old', date=timezone.localdate(), total=99.99,
+                                                  tax_total=17.0, updated_at=timezone.now())
+        # A stored amount that no longer matches the rate: reports must not recompute it
+        ArchivedInvoiceDetail.objects.create(id=900, invoice=archived, product=self.pen, amount=1,
+                                             selling_price=99.99, hsn_code='9608', tax_rate=18, tax_amount=17.0,
+                                             updated_at=timezone.now())
+
+        response = self.client.get(reverse('tax_report'))
+        rows = {(row['hsn_code'], row['tax_rate']): row for row in response.context['rows']}
+        pen = rows[('9608', 18)]
+        self.assertEqual((pen['quantity'], pen['taxable']), (5, 499.95))
+        self.assertEqual((pen['cgst'], pen['sgst'], pen['igst'], pen['tax']), (35.5, 35.5, 18.0, 89.0))
+        self.assertEqual(rows[('1006', 5)]['tax'], 5.0)
+        self.assertEqual(response.context['totals']['tax'], 94.0)
+        self.assertContains(response, '94.00')
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models import F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Invoice
+from .tenants import tenant_db
+
+# Totals are floats, anything closer than this is treated as equal
+TOLERANCE = 0.005
+
+
+def id_shards(shard_size):
+    """(first_id, last_id) ranges covering every invoice"""
+    bounds = Invoice.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return []
+    return [
+        (start, min(start + shard_size - 1, bounds["high"]))
+        for start in range(bounds["low"], bounds["high"] + 1, shard_size)
+    ]
+
+
+def recompute_shard(first_id, last_id, repair=True):
+    """Compare stored and recomputed totals and tax totals for one id range; returns (checked, mismatched)"""
+    rows = Invoice.objects.filter(id__range=(first_id, last_id)).annotate(
+        computed=Coalesce(
+            Sum(F("invoicedetail__selling_price") * F("invoicedetail__amount"), output_field=FloatField()),
+            Value(0.0),
+        ),
+        computed_tax=Coalesce(Sum("invoicedetail__tax_amount"), Value(0.0)),
+    ).values_list("id", "total", "computed", "tax_total", "computed_tax")
+
+    checked = 0
+    mismatched = []
+    now = timezone.now()
+    for invoice_id, total, computed, tax_total, computed_tax in rows:
+        checked += 1
+        if abs((total or 0) - computed) > TOLERANCE or abs((tax_total or 0) - computed_tax) > TOLERANCE:
+            mismatched.append(Invoice(id=invoice_id, total=computed, tax_total=round(computed_tax, 2), updated_at=now))
+
+    if repair and mismatched:
+        with transaction.atomic(using=tenant_db()):
+            Invoice.objects.bulk_update(mismatched, ["total", "tax_total", "updated_at"], batch_size=500)
+    return checked, len(mismatched)
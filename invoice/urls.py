@@ -14,24 +14,35 @@ urlpatterns = [
     path('view_product/', views.view_product, name='view_product'),
     path('edit_product/<int:pk>', views.edit_product, name='edit_product'),
     path('delete_product/<int:pk>/', views.delete_product, name='delete_product'),
+    path('product_stock/<int:pk>/', views.adjust_product_stock, name='adjust_product_stock'),
     # path('upload_product_excel', views.upload_product_from_excel,
     #      name='upload_product_excel'),
-    # path('create_customer/', views.create_customer, name='create_customer'),
-    # path('view_customer/', views.view_customer, name='view_customer'),
-    # path('edit_customer/<int:pk>', views.edit_customer, name='edit_customer'),
-    # path('delete_customer/<int:pk>/', views.delete_customer, name='delete_customer'),
+    path('create_customer/', views.create_customer, name='create_customer'),
+    path('view_customer/', views.view_customer, name='view_customer'),
+    path('view_customer/<int:pk>/', views.view_customer_detail, name='view_customer_detail'),
+    path('edit_customer/<int:pk>', views.edit_customer, name='edit_customer'),
+    path('delete_customer/<int:pk>/', views.delete_customer, name='delete_customer'),
 
     path('create_invoice/', views.create_invoice, name='create_invoice'),
     path('edit_invoice/<int:pk>/', views.edit_invoice, name='edit_invoice'),
     path('view_invoice/', views.view_invoice, name='view_invoice'),
     path('delete_invoice/<int:pk>/', views.delete_invoice, name='delete_invoice'),
-    # path('delete_all_invoice/', views.delete_all_invoice,
-    #      name='delete_all_invoice'),
+    path('delete_all_invoice/', views.delete_all_invoice, name='delete_all_invoice'),
     # path('download_all_invoice/', views.download_all,
     #      name='download_all_invoice'),
     path('download_all_invoice/', views.download_all, name='download_all_invoice'),
+    path('download_invoice_lines/', views.download_invoice_lines, name='download_invoice_lines'),
+    path('download_delta/', views.download_delta, name='download_delta'),
     path('invoice_pdf/<int:pk>/', views.download_invoice_pdf, name='invoice_pdf'),
+    path('send_invoice/<int:pk>/', views.send_invoice_email, name='send_invoice_email'),
     path('view_invoice_detail/<int:pk>/',
          views.view_invoice_detail, name='view_invoice_detail'),
     path('monthly_profit/', views.monthly_profit, name='monthly_profit'),
+    path('product_sales/', views.product_sales, name='product_sales'),
+    path('product_margins/', views.product_margins, name='product_margins'),
+    path('tax_report/', views.tax_report, name='tax_report'),
+    path('tenant_sales/', views.tenant_sales_report, name='tenant_sales'),
+    path('admission_stats/', views.admission_stats, name='admission_stats'),
+    path('search/', views.search, name='search'),
+    path('api/invoices/', views.invoice_api, name='invoice_api'),
 ]
@@ -15,11 +15,13 @@ class InvoicePDF(FPDF):
 
 def generate_invoice_pdf(invoice, invoice_details):
     pdf = InvoicePDF()
+    # Same bytes for the same invoice version, so Range requests can be stitched together
+    pdf.set_creation_date(invoice.updated_at)
     pdf.add_page()
     
     # Invoice Details
     pdf.set_font('Helvetica', '', 12)
-    pdf.cell(0, 10, f'Invoice ID: {invoice.id}', ln=True)
+    pdf.cell(0, 10, f'Invoice No: {invoice.number or invoice.id}', ln=True)
     pdf.cell(0, 10, f'Date: {invoice.date}', ln=True)
     pdf.cell(0, 10, f'Customer: {invoice.customer}', ln=True)
     pdf.cell(0, 10, f'Contact: {invoice.contact}', ln=True)
@@ -29,9 +31,12 @@ def generate_invoice_pdf(invoice, invoice_details):
     # Table Header
     pdf.set_font('Helvetica', 'B', 12)
     pdf.cell(60, 10, 'Product', border=1)
-    pdf.cell(40, 10, 'Price', border=1)
-    pdf.cell(40, 10, 'Quantity', border=1)
-    pdf.cell(40, 10, 'Total', border=1)
+    pdf.cell(25, 10, 'HSN', border=1)
+    pdf.cell(25, 10, 'Price', border=1)
+    pdf.cell(20, 10, 'Qty', border=1)
+    pdf.cell(25, 10, 'Total', border=1)
+    pdf.cell(15, 10, 'GST', border=1)
+    pdf.cell(20, 10, 'Tax', border=1)
     pdf.ln()
     
     # Table Rows
@@ -42,7 +47,7 @@ def generate_invoice_pdf(invoice, invoice_details):
         y_start = pdf.get_y()
         
         # Draw Product Name (wrapping)
-        pdf.multi_cell(60, 10, str(detail.product.product_name), border=0, align='L')
+        pdf.multi_cell(60, 10, str(detail.product_name), border=0, align='L')
         
         # Get new Y position after multi_cell
         y_end = pdf.get_y()
@@ -55,18 +60,28 @@ def generate_invoice_pdf(invoice, invoice_details):
         pdf.set_xy(x_start + 60, y_start)
         
         # Draw other cells with the calculated row_height
-        pdf.cell(40, row_height, str(detail.selling_price), border=1)
-        pdf.cell(40, row_height, str(detail.amount), border=1)
-        pdf.cell(40, row_height, str(detail.get_total_bill), border=1)
+        pdf.cell(25, row_height, detail.hsn_code, border=1)
+        pdf.cell(25, row_height, str(detail.selling_price), border=1)
+        pdf.cell(20, row_height, str(detail.amount), border=1)
+        pdf.cell(25, row_height, str(detail.get_total_bill), border=1)
+        pdf.cell(15, row_height, f'{detail.tax_rate:g}%', border=1)
+        pdf.cell(20, row_height, f'{detail.tax_amount:.2f}', border=1)
         
         # Move to next line (below the tallest cell)
         pdf.set_xy(x_start, y_end)
         
     pdf.ln(10)
     
-    # Total
+    # Totals
+    pdf.set_font('Helvetica', '', 12)
+    pdf.cell(0, 8, f'Taxable value: {invoice.total:.2f}', align='R', ln=True)
+    if invoice.inter_state:
+        pdf.cell(0, 8, f'IGST: {invoice.integrated_tax:.2f}', align='R', ln=True)
+    else:
+        pdf.cell(0, 8, f'CGST: {invoice.central_tax:.2f}', align='R', ln=True)
+        pdf.cell(0, 8, f'SGST: {invoice.state_tax:.2f}', align='R', ln=True)
     pdf.set_font('Helvetica', 'B', 14)
-    pdf.cell(0, 10, f'Total: {invoice.total}', align='R', ln=True)
+    pdf.cell(0, 10, f'Total: {invoice.grand_total:.2f}', align='R', ln=True)
     
     # Comments
     if invoice.comments:
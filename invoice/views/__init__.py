@@ -0,0 +1,17 @@
+"""Views, split by feature. Everything is re-exported here for invoice.urls."""
+from .account import edit_profile
+from .api import invoice_api
+from .customers import (
+    create_customer, view_customer, view_customer_detail, edit_customer, delete_customer,
+)
+from .dashboard import getTotalIncome, base
+from .downloads import download_all, download_invoice_lines, download_delta
+from .invoices import (
+    create_invoice, edit_invoice, view_invoice, view_invoice_detail, delete_invoice, delete_all_invoice,
+    send_invoice_email, download_invoice_pdf,
+)
+from .products import create_product, view_product, edit_product, delete_product, adjust_product_stock
+from .reports import (
+    monthly_profit, product_sales, product_margins, tax_report, tenant_sales_report, admission_stats,
+)
+from .search import search
@@ -0,0 +1,27 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.shortcuts import render, redirect
+
+
+@login_required
+def edit_profile(request):
+    if request.method == 'POST':
+        username = request.POST.get('username')
+        email = request.POST.get('email')
+        
+        user = request.user
+        
+        # Check if username already exists for a different user
+        if User.objects.filter(username=username).exclude(pk=user.pk).exists():
+            messages.error(request, 'Username already taken. Please choose another one.')
+            return redirect('edit_profile')
+
+        user.username = username
+        user.email = email
+        user.save(update_fields=['username', 'email'])
+        
+        messages.success(request, 'Profile updated successfully!')
+        return redirect('edit_profile')
+        
+    return render(request, 'invoice/edit_profile.html')
@@ -0,0 +1,43 @@
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+
+from ..admission import admit
+from ..api import (
+    compressed, dumps, invoice_page, iter_invoice_pages, max_page_size, ndjson_chunks, page_size, parse_fields,
+)
+from ..routers import use_replica
+
+
+@admit("invoice_stream")
+def _invoice_stream(request, invoice_fields, line_fields, after):
+    pages = iter_invoice_pages(invoice_fields, line_fields, after, max_page_size())
+    return StreamingHttpResponse(ndjson_chunks(pages), content_type="application/x-ndjson")
+
+
+@login_required
+@use_replica
+@compressed
+def invoice_api(request):
+    """A page of invoices with their lines as JSON, or all of them as NDJSON (see invoice.api)"""
+    try:
+        invoice_fields, line_fields = parse_fields(request.GET.get("fields", ""))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    try:
+        after = int(request.GET["after"]) if request.GET.get("after") else None
+        limit = min(int(request.GET.get("limit") or page_size()), max_page_size())
+    except ValueError:
+        return HttpResponseBadRequest("after and limit must be integers.")
+    if limit < 1:
+        return HttpResponseBadRequest("limit must be at least 1.")
+
+    if request.GET.get("format") == "ndjson":
+        return _invoice_stream(request, invoice_fields, line_fields, after)
+
+    invoices = invoice_page(invoice_fields, line_fields, after, limit)
+    next_url = None
+    if len(invoices) == limit:
+        query = request.GET.copy()
+        query["after"] = invoices[-1]["id"]
+        next_url = "%s?%s" % (request.path, query.urlencode())
+    return HttpResponse(dumps({"invoices": invoices, "next": next_url}), content_type="application/json")
@@ -0,0 +1,114 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils import timezone
+
+from ..forms import CustomerForm
+from ..models import ArchivedInvoice, Customer, Invoice
+from ..routers import use_replica
+from ..tenants import tenant_db
+
+
+# -------------------
+# Customers
+# -------------------
+INVOICE_MODELS = (Invoice, ArchivedInvoice)  # A customer's history spans both tables
+
+
+def _invoice_stat(aggregate, output_field):
+    """Sum over live and archived invoices of aggregate, per customer (a subquery each, so no join fan-out)"""
+    parts = [
+        Coalesce(Subquery(
+            model.objects.filter(customer_ref=OuterRef("pk")).order_by().values("customer_ref")
+            .annotate(value=aggregate).values("value")
+        ), Value(0), output_field=output_field)
+        for model in INVOICE_MODELS
+    ]
+    return parts[0] + parts[1]
+
+
+@login_required
+def create_customer(request):
+    customer = CustomerForm()
+    if request.method == "POST":
+        customer = CustomerForm(request.POST)
+        if customer.is_valid():
+            customer.save()
+            messages.success(request, "Customer created successfully!")
+            return redirect("view_customer")
+
+    context = {
+        "customer": customer,
+    }
+    return render(request, "invoice/create_customer.html", context)
+
+
+@login_required
+@use_replica
+def view_customer(request):
+    customer = Customer.objects.annotate(
+        invoice_count=_invoice_stat(Count("id"), IntegerField()),
+        invoice_total=_invoice_stat(Sum("total"), FloatField()),
+    ).order_by("customer_name")
+    context = {
+        "customer": customer,
+    }
+    return render(request, "invoice/view_customer.html", context)
+
+
+@login_required
+@use_replica
+def view_customer_detail(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    live, archived = (model.objects.filter(customer_ref=customer) for model in INVOICE_MODELS)
+    # Archived invoices keep their ids, so the detail links work for both
+    invoices = live.values("id", "date", "total").union(archived.values("id", "date", "total")).order_by("-id")
+    totals = [
+        queryset.aggregate(invoice_count=Count("id"), invoice_total=Sum("total")) for queryset in (live, archived)
+    ]
+
+    context = {
+        "customer": customer,
+        "invoices": invoices,
+        "invoice_count": sum(total["invoice_count"] for total in totals),
+        "invoice_total": sum(total["invoice_total"] or 0 for total in totals),
+    }
+    return render(request, "invoice/view_customer_detail.html", context)
+
+
+@login_required
+def edit_customer(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    form = CustomerForm(instance=customer)
+
+    if request.method == "POST":
+        form = CustomerForm(request.POST, instance=customer)
+        if form.is_valid():
+            form.save()
+            messages.success(request, "Customer updated successfully!")
+            return redirect("view_customer")
+
+    context = {
+        "customer": form,
+    }
+    return render(request, "invoice/create_customer.html", context)
+
+
+@login_required
+def delete_customer(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    if request.method == "POST":
+        with transaction.atomic(using=tenant_db()):
+            # Unlinking the invoices changes them, so they show up in the next delta export
+            customer.invoices.update(updated_at=timezone.now())
+            customer.delete()
+        messages.success(request, "Customer deleted successfully!")
+        return redirect("view_customer")
+
+    context = {
+        "customer": customer,
+    }
+    return render(request, "invoice/delete_customer.html", context)
@@ -0,0 +1,30 @@
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+
+from ..models import Invoice, Product
+
+
+# -------------------
+# Utility
+# -------------------
+def getTotalIncome():
+    """Total of all invoices (sales, not profit)."""
+    allInvoice = Invoice.objects.all()
+    totalIncome = sum(invoice.total_sales_amount for invoice in allInvoice)
+    return totalIncome
+
+
+# -------------------
+# Dashboard
+# -------------------
+@login_required
+def base(request):
+    total_product = Product.objects.count()
+    total_invoice = Invoice.objects.count()
+    total_income = getTotalIncome()
+    context = {
+        "total_product": total_product,
+        "total_invoice": total_invoice,
+        "total_income": total_income,
+    }
+    return render(request, "invoice/base/base.html", context)
@@ -0,0 +1,107 @@
+import datetime
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..admission import admit
+from ..exports import CONTENT_TYPES, EXPORT_FORMATS, WRITERS, delta_since, stream_csv
+from ..models import Invoice
+from ..routers import use_replica
+
+
+@login_required
+@use_replica
+@admit("download_all")
+def download_all(request):
+    # pandas is slow to import and only this view needs it
+    import pandas as pd
+
+    # Get all invoices
+    invoices = Invoice.objects.all()
+
+    # Create a list of dictionaries
+    data = []
+    for invoice in invoices:
+        data.append({
+            'Date': invoice.date,
+            'Customer': invoice.customer,
+            'Contact': invoice.contact,
+            'Email': invoice.email,
+            'Comments': invoice.comments,
+            'Total': invoice.total,
+            'Profit': invoice.total_profit,
+        })
+
+    # Create DataFrame
+    df = pd.DataFrame(data)
+
+    # Create response
+    response = HttpResponse(content_type='application/vnd.ms-excel')
+    response['Content-Disposition'] = 'attachment; filename="invoices.xlsx"'
+
+    # Write to response
+    df.to_excel(response, index=False)
+
+    return response
+
+
+@login_required
+@use_replica
+@admit("download_invoice_lines")
+def download_invoice_lines(request):
+    """Every invoice line as CSV (streamed), write-only XLSX or Parquet"""
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unsupported export format.")
+    filename = "invoice_lines.%s" % export_format
+
+    if export_format == "csv":
+        response = StreamingHttpResponse(stream_csv(), content_type=CONTENT_TYPES["csv"])
+        response["Content-Disposition"] = 'attachment; filename="%s"' % filename
+        return response
+
+    # Binary formats are spooled to disk, then streamed from the file
+    spool = tempfile.TemporaryFile()
+    try:
+        WRITERS[export_format](spool)
+    except ImportError:
+        spool.close()
+        return HttpResponseBadRequest("%s export is not available on this server." % export_format)
+    spool.seek(0)
+    return FileResponse(
+        spool, as_attachment=True, filename=filename, content_type=CONTENT_TYPES[export_format]
+    )
+
+
+@login_required
+def download_delta(request):
+    """Invoices and lines created, changed or deleted since the ?since= watermark"""
+    # Stays on the primary: a lagging replica would move the watermark past unseen rows
+    since = None
+    if request.GET.get("since"):
+        try:
+            since = parse_datetime(request.GET["since"])
+        except ValueError:  # Well formed but out of range, e.g. February 30th
+            since = None
+        if since is None:
+            return HttpResponseBadRequest("since must be an ISO 8601 datetime.")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, datetime.timezone.utc)
+
+    # Rows are read up to a fixed point, which becomes the next watermark. It
+    # trails the clock, so a transaction that stamped its rows before the read
+    # but commits after it is still picked up by the next call.
+    lag = datetime.timedelta(seconds=getattr(settings, "INVOICE_DELTA_LAG_SECONDS", 60))
+    watermark = timezone.now() - lag
+    if since is not None:
+        watermark = max(watermark, since)
+    data = delta_since(since, watermark)
+    data["since"] = since
+    data["watermark"] = watermark
+    return JsonResponse(data)
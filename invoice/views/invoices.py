@@ -0,0 +1,287 @@
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+
+from ..admission import admit
+from ..archive import get_invoice_with_lines
+from ..bulk import delete_invoices, filter_invoices
+from ..caching import InvoiceLineSummary, invalidate_invoice_detail, invoice_version
+from ..conditional import invoice_last_modified, invoice_page_etag, invoice_pdf_etag, ranged_response
+from ..forms import InvoiceBulkDeleteForm, InvoiceForm, InvoiceDetailFormSet
+from ..mailer import queue_invoice_email
+from ..models import Customer, Invoice, InvoiceDetail, SearchEntry, Tombstone
+from ..numbering import allocate_invoice_number, reserve_invoice_number
+from ..rollups import record_invoice_sales, reverse_invoice_sales
+from ..routers import use_replica
+from ..search import index_invoice, unindex
+from ..stock import record_invoice_stock, reverse_invoice_stock
+from ..tax import apply_tax, invoice_tax_total
+from ..tenants import tenant_db
+
+
+# -------------------
+# Create Invoice
+# -------------------
+@login_required
+def create_invoice(request):
+    form = InvoiceForm()
+    formset = InvoiceDetailFormSet()
+
+    if request.method == "POST":
+        form = InvoiceForm(request.POST)
+        formset = InvoiceDetailFormSet(request.POST)
+        if form.is_valid() and formset.is_valid():
+            number = reserve_invoice_number()
+            with transaction.atomic(using=tenant_db()):
+                invoice = form.save(commit=False)
+                # Write before any read: on SQLite a transaction that has already
+                # read cannot wait for the write lock and fails under contention
+                invoice.number = number or allocate_invoice_number()
+                invoice.save()
+                invoice.customer_ref = Customer.for_invoice(invoice.customer, invoice.contact, invoice.email)
+
+                total = 0
+                details = []
+                for f in formset:
+                    if f.cleaned_data:
+                        product = f.cleaned_data.get("product")
+                        amount = f.cleaned_data.get("amount")
+                        if product and amount:
+                            detail = InvoiceDetail(
+                                invoice=invoice,
+                                product=product,
+                                product_name=product.product_name,
+                                amount=amount,
+                                cost_price=product.cost_price,
+                                selling_price=product.selling_price
+                            )
+                            apply_tax(detail, product, invoice.inter_state)
+                            detail.save()
+                            details.append(detail)
+                            total += detail.get_total_bill
+
+                invoice.total = total
+                invoice.tax_total = invoice_tax_total(details)
+                invoice.save()
+                record_invoice_sales(invoice, details)
+                record_invoice_stock(invoice, details)
+                index_invoice(invoice, details)
+            messages.success(request, "Invoice created successfully!")
+            return redirect(f"{reverse('view_invoice')}?new_invoice_id={invoice.id}")
+
+    context = {
+        "form": form,
+        "formset": formset,
+    }
+    return render(request, "invoice/create_invoice.html", context)
+
+
+@login_required
+def edit_invoice(request, pk):
+    invoice = get_object_or_404(Invoice, pk=pk)
+    form = InvoiceForm(instance=invoice)
+    
+    # Prepare initial data for formset
+    invoice_details = InvoiceDetail.objects.filter(invoice=invoice)
+    initial_data = []
+    for detail in invoice_details:
+        initial_data.append({
+            'product': detail.product_id,
+            'amount': detail.amount,
+        })
+    
+    # Lines for products deleted since stay selectable, so saving does not drop them
+    kept = {"kept_products": [detail.product_id for detail in invoice_details]}
+    formset = InvoiceDetailFormSet(initial=initial_data, form_kwargs=kept)
+    # We need to ensure the formset has enough forms for existing data
+    # formset.extra = 0 # Optional: don't show extra empty rows if we have data? 
+    # Actually, formset_factory with initial data will create forms for initial data + extra.
+    # But we want to populate them.
+    
+    # Better approach for formset with initial data:
+    # The formset_factory doesn't automatically bind model instances like inlineformset_factory.
+    # Since we are using a standard formset, we pass 'initial' list.
+    
+    if request.method == "POST":
+        form = InvoiceForm(request.POST, instance=invoice)
+        formset = InvoiceDetailFormSet(request.POST, form_kwargs=kept)
+        
+        if form.is_valid() and formset.is_valid():
+            with transaction.atomic(using=tenant_db()):
+                invalidate_invoice_detail(invoice)
+                invoice = form.save(commit=False)
+                invoice.customer_ref = Customer.for_invoice(invoice.customer, invoice.contact, invoice.email)
+                invoice.save()
+
+                # Delete existing details to replace with new ones
+                # This is a simple strategy for "editing" - replace all items
+                old_details = list(InvoiceDetail.objects.filter(invoice=invoice))
+                reverse_invoice_sales(invoice, old_details)
+                reverse_invoice_stock(invoice, old_details)
+                Tombstone.record(InvoiceDetail, [detail.pk for detail in old_details])
+                InvoiceDetail.objects.filter(invoice=invoice).delete()
+
+                total = 0
+                details = []
+                for f in formset:
+                    if f.cleaned_data:
+                        product = f.cleaned_data.get("product")
+                        amount = f.cleaned_data.get("amount")
+                        if product and amount:
+                            detail = InvoiceDetail(
+                                invoice=invoice,
+                                product=product,
+                                product_name=product.product_name,
+                                amount=amount,
+                                cost_price=product.cost_price,
+                                selling_price=product.selling_price
+                            )
+                            apply_tax(detail, product, invoice.inter_state)
+                            detail.save()
+                            details.append(detail)
+                            total += detail.get_total_bill
+
+                invoice.total = total
+                invoice.tax_total = invoice_tax_total(details)
+                invoice.save()
+                record_invoice_sales(invoice, details)
+                record_invoice_stock(invoice, details)
+                index_invoice(invoice, details)
+            messages.success(request, "Invoice updated successfully!")
+            return redirect("view_invoice")
+
+    context = {
+        "form": form,
+        "formset": formset,
+    }
+    return render(request, "invoice/create_invoice.html", context)
+
+
+@login_required
+@use_replica
+def view_invoice(request):
+    invoices = Invoice.objects.all().order_by('-id')
+    
+    new_invoice_id = request.GET.get('new_invoice_id')
+    
+    context = {
+        "invoices": invoices,
+        "new_invoice_id": new_invoice_id,
+    }
+    return render(request, "invoice/view_invoice.html", context)
+
+
+@login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=invoice_page_etag)
+def view_invoice_detail(request, pk):
+    invoice, invoice_detail, archived = get_invoice_with_lines(pk)
+
+    # The line table is a cached fragment keyed on the invoice version, so the
+    # lines are only queried when the invoice changed since it was last rendered
+    context = {
+        "invoice": invoice,
+        "invoice_detail": InvoiceLineSummary(invoice_detail),
+        "archived": archived,
+        "version": invoice_version(invoice, archived),
+    }
+    return render(request, "invoice/view_invoice_detail.html", context)
+
+
+@login_required
+def delete_invoice(request, pk):
+    invoice = get_object_or_404(Invoice, pk=pk)
+    invoice_detail = InvoiceDetail.objects.filter(invoice=invoice)
+    if request.method == "POST":
+        with transaction.atomic(using=tenant_db()):
+            details = list(invoice_detail)
+            reverse_invoice_sales(invoice, details)
+            reverse_invoice_stock(invoice, details)
+            Tombstone.record(InvoiceDetail, [detail.pk for detail in details])
+            Tombstone.record(Invoice, [invoice.pk])
+            unindex(SearchEntry.INVOICE, [invoice.pk])
+            invalidate_invoice_detail(invoice)
+            invoice_detail.delete()
+            invoice.delete()
+        return redirect("view_invoice")
+
+    context = {
+        "invoice": invoice,
+        "invoice_detail": invoice_detail,
+    }
+    context = {
+        "invoice": invoice,
+        "invoice_detail": invoice_detail,
+    }
+    return render(request, "invoice/delete_invoice.html", context)
+
+
+@login_required
+def delete_all_invoice(request):
+    """Delete every invoice matching a filter, a bounded number per request.
+
+    GET shows how many invoices match. Each POST deletes up to
+    INVOICE_BULK_DELETE_PER_REQUEST of them in short transactions and, while
+    some remain, renders the progress with a form that posts the next round.
+    """
+    form = InvoiceBulkDeleteForm(request.POST if request.method == "POST" else request.GET or None)
+    context = {"form": form}
+    if form.is_bound and form.is_valid():
+        invoices = filter_invoices(**form.filters())
+        if request.method == "POST":
+            deleted = delete_invoices(invoices, limit=getattr(settings, "INVOICE_BULK_DELETE_PER_REQUEST", 20000))
+            deleted += form.cleaned_data["deleted"] or 0
+            remaining = invoices.count()
+            if not remaining:
+                messages.success(request, "Deleted %d invoices." % deleted)
+                return redirect("view_invoice")
+            context.update(deleted=deleted, remaining=remaining, percent=deleted * 100 // (deleted + remaining))
+        else:
+            context["matching"] = invoices.count()
+    return render(request, "invoice/delete_all_invoice.html", context)
+
+
+@login_required
+@require_POST
+def send_invoice_email(request, pk):
+    """Queue the invoice PDF for emailing; it is sent in the background"""
+    invoice, _, _ = get_invoice_with_lines(pk)
+    to = request.POST.get("to", "").strip() or invoice.email
+    try:
+        validate_email(to)
+    except ValidationError:
+        messages.error(request, "Enter a valid email address to send invoice %s." % (invoice.number or invoice.id))
+    else:
+        queue_invoice_email(invoice, to)
+        messages.success(request, "Invoice %s will be emailed to %s." % (invoice.number or invoice.id, to))
+    return redirect("view_invoice")
+
+
+@login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=invoice_pdf_etag, last_modified_func=invoice_last_modified)
+@admit("invoice_pdf")
+def download_invoice_pdf(request, pk):
+    # fpdf is only needed here, so it is imported on first use
+    from ..utils import generate_invoice_pdf
+    invoice, invoice_detail, archived = get_invoice_with_lines(pk)
+    
+    pdf_content = generate_invoice_pdf(invoice, invoice_detail)
+    
+    response = ranged_response(
+        request, bytes(pdf_content), 'application/pdf',
+        etag=invoice_version(invoice, archived), last_modified=invoice.updated_at,
+    )
+    filename = "Invoice_%s.pdf" % (invoice.id)
+    content = "inline; filename='%s'" % (filename)
+    response['Content-Disposition'] = content
+    return response
@@ -0,0 +1,93 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from ..conditional import product_list_etag
+from ..forms import ProductForm, StockAdjustmentForm
+from ..models import Product, ProductPrice
+from ..routers import use_replica
+from ..stock import adjust_stock
+from ..tenants import tenant_db
+
+
+# -------------------
+# Create Product
+# -------------------
+@login_required
+def create_product(request):
+    product = ProductForm()
+    if request.method == "POST":
+        product = ProductForm(request.POST)
+        if product.is_valid():
+            with transaction.atomic(using=tenant_db()):
+                ProductPrice.record(product.save())
+            messages.success(request, "Product created successfully!")
+            return redirect("view_product")
+
+    context = {
+        "product": product,
+    }
+    return render(request, "invoice/create_product.html", context)
+
+
+@login_required
+@use_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=product_list_etag)
+def view_product(request):
+    product = Product.objects.all()
+    context = {
+        "product": product,
+    }
+    return render(request, "invoice/view_product.html", context)
+
+
+@login_required
+def edit_product(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    form = ProductForm(instance=product)
+
+    if request.method == "POST":
+        form = ProductForm(request.POST, instance=product)
+        if form.is_valid():
+            with transaction.atomic(using=tenant_db()):
+                ProductPrice.record(form.save())
+            messages.success(request, "Product updated successfully!")
+            return redirect("view_product")
+
+    context = {
+        "product": form,
+    }
+    return render(request, "invoice/create_product.html", context)
+
+
+@login_required
+def delete_product(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    product.product_is_delete = True
+    product.save()
+    messages.success(request, "Product deleted successfully!")
+    return redirect("view_product")
+
+
+@login_required
+def adjust_product_stock(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    form = StockAdjustmentForm()
+    if request.method == "POST":
+        form = StockAdjustmentForm(request.POST)
+        if form.is_valid():
+            adjust_stock(product, form.cleaned_data["quantity"], form.cleaned_data["reason"],
+                         form.cleaned_data["note"])
+            messages.success(request, "Stock updated successfully!")
+            return redirect("view_product")
+
+    context = {
+        "product": product,
+        "form": form,
+        "movements": product.stock_movements.order_by("-created_at", "-id")[:20],
+    }
+    return render(request, "invoice/adjust_stock.html", context)
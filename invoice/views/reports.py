@@ -0,0 +1,139 @@
+import datetime
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ..admission import limits, metrics
+from ..models import Product, ProductDailySales
+from ..pricing import prices_as_of
+from ..rollups import REPORT_METRICS, tenant_sales, top_products
+from ..routers import use_replica
+from ..tax import tax_summary
+
+
+@login_required
+@use_replica
+def monthly_profit(request):
+    # Read from the daily rollup so archived years still count
+    monthly_stats = ProductDailySales.objects.annotate(
+        month=TruncMonth('day')
+    ).values('month').annotate(
+        profit=Sum('profit')
+    ).order_by('month')
+
+    months = []
+    profits = []
+    for stat in monthly_stats:
+        if stat['month']:
+            months.append(stat['month'].strftime('%B %Y'))
+            profits.append(stat['profit'])
+
+    context = {
+        'months': json.dumps(months),
+        'profits': json.dumps(profits),
+    }
+    context = {
+        'months': json.dumps(months),
+        'profits': json.dumps(profits),
+    }
+    return render(request, 'invoice/monthly_profit.html', context)
+
+
+def _date_param(request, name):
+    """A YYYY-MM-DD query parameter, or None if missing, malformed or no such day (2024-02-30)"""
+    try:
+        return parse_date(request.GET.get(name, ""))
+    except ValueError:
+        return None
+
+
+def _report_filters(request):
+    """(start, end, metric, limit) from a report's query string; the last 30 days by revenue, top 10"""
+    today = timezone.localdate()
+    end = _date_param(request, "end") or today
+    start = _date_param(request, "start") or end - datetime.timedelta(days=29)
+    metric = request.GET.get("metric", "revenue")
+    if metric not in REPORT_METRICS:
+        metric = "revenue"
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 10)), 100))
+    except ValueError:
+        limit = 10
+    return start, end, metric, limit
+
+
+@login_required
+@use_replica
+def product_sales(request):
+    """Top-N products by revenue, profit or quantity, read from the daily rollup"""
+    start, end, metric, limit = _report_filters(request)
+    context = {
+        "rows": top_products(start, end, metric, limit),
+        "start": start,
+        "end": end,
+        "metric": metric,
+        "metrics": REPORT_METRICS,
+        "limit": limit,
+    }
+    return render(request, "invoice/product_sales.html", context)
+
+
+@login_required
+def tenant_sales_report(request):
+    """Every shop's sales and the top products across all of them, queried in parallel"""
+    start, end, metric, limit = _report_filters(request)
+    totals, rows = tenant_sales(start, end, metric, limit)
+    context = {
+        "tenant_totals": sorted(totals.items()),
+        "grand_total": {name: sum(t[name] for t in totals.values()) for name in REPORT_METRICS},
+        "rows": rows,
+        "start": start,
+        "end": end,
+        "metric": metric,
+        "metrics": REPORT_METRICS,
+        "limit": limit,
+    }
+    return render(request, "invoice/tenant_sales.html", context)
+
+
+@login_required
+@use_replica
+def tax_report(request):
+    """GST per HSN code and rate over a date range, summed from the tax stored on each line"""
+    start, end, _, _ = _report_filters(request)
+    rows = tax_summary(start, end)
+    columns = ("taxable", "cgst", "sgst", "igst", "tax")
+    context = {
+        "rows": rows,
+        "totals": {name: round(sum(row[name] for row in rows), 2) for name in columns},
+        "start": start,
+        "end": end,
+    }
+    return render(request, "invoice/tax_report.html", context)
+
+
+@login_required
+@use_replica
+def product_margins(request):
+    """Cost, selling price and margin of every live product as they stood on a given date"""
+    on = _date_param(request, "date") or timezone.localdate()
+    # End of that day, so a price changed during it counts
+    when = timezone.make_aware(datetime.datetime.combine(on, datetime.time.max))
+    context = {
+        "rows": prices_as_of(when, Product.objects.all()).order_by("-margin_as_of"),
+        "date": on,
+    }
+    return render(request, "invoice/product_margins.html", context)
+
+
+@staff_member_required
+def admission_stats(request):
+    """Admission control limits and counters per endpoint: admitted, queued, rejected, queued_ms"""
+    return JsonResponse({"limits": limits(), "metrics": metrics()})
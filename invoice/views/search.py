@@ -0,0 +1,31 @@
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+
+from ..models import Product, SearchEntry
+from ..routers import use_replica
+from ..search import search as search_entries
+
+
+@login_required
+@use_replica
+def search(request):
+    """Ranked full-text search over invoices, products and customers"""
+    query = request.GET.get("q", "").strip()
+    kind = request.GET.get("kind", "")
+    if kind not in dict(SearchEntry.KINDS):
+        kind = ""
+
+    results = search_entries(query, kind or None, limit=50) if query else []
+    # Deleted products stay indexed for the admin, but not in the app's search
+    product_ids = [entry.object_id for entry in results if entry.kind == SearchEntry.PRODUCT]
+    if product_ids:
+        live = set(Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True))
+        results = [entry for entry in results if entry.kind != SearchEntry.PRODUCT or entry.object_id in live]
+
+    context = {
+        "query": query,
+        "kind": kind,
+        "kinds": SearchEntry.KINDS,
+        "results": results,
+    }
+    return render(request, "invoice/search.html", context)
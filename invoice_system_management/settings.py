@@ -36,19 +36,22 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'invoice.apps.InvoiceStaticFilesConfig',
 
     'invoice',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'invoice.tenants.TenantMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'invoice.routers.PrimaryAfterWriteMiddleware',
 ]
 
 ROOT_URLCONF = 'invoice_system_management.urls'
@@ -65,6 +68,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'invoice.context_processors.dashboard_stats',
+                'invoice.context_processors.tenancy',
             ],
         },
     },
@@ -80,9 +84,92 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a writer waits for SQLite's write lock before "database is locked";
+        # the default 5 is too short with many concurrent invoice writers
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Optional read replica used for reports, exports and list views.
+# Point INVOICE_REPLICA_DB at a second SQLite file (or replace this entry with a
+# Postgres replica); tests mirror it onto the default database.
+if os.environ.get('INVOICE_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['INVOICE_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shops (tenants) served by this deployment, each with its own database for the
+# invoice app; users and sessions stay in the default one. A request picks its
+# tenant by host name or by a /t/<slug>/ URL prefix, and uses the default
+# database without one. Set INVOICE_TENANTS to e.g. "kochi=kochi.example.com,calicut"
+# (slug, optionally =host names separated by |), or fill this in by hand. A tenant
+# without a "database" alias gets a SQLite file under tenants/; create its tables
+# with `python manage.py migrate_tenants`.
+INVOICE_TENANTS = {}
+for _entry in filter(None, os.environ.get('INVOICE_TENANTS', '').split(',')):
+    _slug, _, _hosts = _entry.strip().partition('=')
+    INVOICE_TENANTS[_slug] = {'hosts': list(filter(None, _hosts.split('|')))}
+for _slug, _tenant in INVOICE_TENANTS.items():
+    # Connections are kept open per thread and tenant, instead of reopening the
+    # file (and rerunning its PRAGMAs) on every request
+    DATABASES.setdefault(_tenant.get('database') or 'tenant_' + _slug, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'tenants' / (_slug + '.sqlite3'),
+        'OPTIONS': {'timeout': 20},
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+# Threads used to run a report over every tenant at once
+INVOICE_TENANT_REPORT_WORKERS = 8
+
+DATABASE_ROUTERS = ['invoice.tenants.TenantRouter', 'invoice.routers.ReplicaRouter']
+INVOICE_REPLICA_DATABASE = 'replica'
+# Seconds a client keeps reading from the primary after a write
+INVOICE_REPLICA_LAG_SECONDS = 5
+
+
+# Cache used for sessions, logged-in users and rendered fragments. Per process by
+# default; set INVOICE_REDIS_URL to share one across workers (needs redis-py).
+if os.environ.get('INVOICE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['INVOICE_REDIS_URL'],
+        }
+    }
+
+# Session storage, picked with INVOICE_SESSION_ENGINE:
+#   cached_db      - read from the cache, database only on a miss (default)
+#   signed_cookies - no server-side lookup at all, but logging out cannot revoke
+#                    a copy of the cookie
+#   db             - Django's default, one SELECT per request
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('INVOICE_SESSION_ENGINE', 'cached_db')
+
+# Keeps the logged-in user in the cache instead of loading it on every request.
+# ModelBackend stays listed so sessions started before it was added stay logged
+# in (a session remembers its backend); they use the cache from their next login.
+AUTHENTICATION_BACKENDS = [
+    'invoice.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Seconds a cached user may be served; bounds staleness across per-process caches
+INVOICE_USER_CACHE_SECONDS = 60
+
+# Outgoing mail, used to send invoice PDFs. For development, point it at a local
+# debugging server (e.g. INVOICE_EMAIL_PORT=1025 with `python -m aiosmtpd -n`),
+# or set INVOICE_EMAIL_BACKEND to django.core.mail.backends.filebased.EmailBackend
+# to write each message into INVOICE_EMAIL_FILE_PATH instead.
+EMAIL_BACKEND = os.environ.get('INVOICE_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('INVOICE_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('INVOICE_EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('INVOICE_EMAIL_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('INVOICE_EMAIL_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('INVOICE_EMAIL_USE_TLS') == '1'
+EMAIL_TIMEOUT = 30
+EMAIL_FILE_PATH = os.environ.get('INVOICE_EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
+DEFAULT_FROM_EMAIL = os.environ.get('INVOICE_EMAIL_FROM', 'invoices@localhost')
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -129,7 +216,84 @@ STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
 
+# Production serves collectstatic output through WhiteNoise: hashed file names,
+# gzip/brotli variants and far-future cache headers on hashed files.
+# Run `python manage.py collectstatic` after changing anything under static/.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Month (1-12) in which the fiscal year starts; used when archiving closed years
+INVOICE_FISCAL_YEAR_START_MONTH = 4
+
+# Invoice numbers: 'block' hands each worker a block of numbers at a time, so
+# concurrent writers rarely touch the sequence row (numbers are unique but can
+# skip when a worker exits); 'gapless' takes every number inside the invoice's
+# own transaction, serialising invoice creation on the sequence row.
+INVOICE_NUMBER_MODE = 'block'
+INVOICE_NUMBER_BLOCK_SIZE = 20
+INVOICE_NUMBER_FORMAT = 'INV/{year}/{number:06d}'
+
+# Invoice lines are validated and priced from an in-process copy of the product
+# catalogue. Product saves replace its version key in the cache; with a
+# per-process cache, other workers see a change within this many seconds.
+INVOICE_CATALOGUE_VERSION_SECONDS = 5
+
+# Bulk invoice deletes run in transactions of this many invoices; the delete
+# page stops after INVOICE_BULK_DELETE_PER_REQUEST and continues in a new request.
+INVOICE_BULK_DELETE_BATCH_SIZE = 1000
+INVOICE_BULK_DELETE_PER_REQUEST = 20000
+
+# The delta export (download_delta) only returns rows stamped at least this many
+# seconds ago; keep it above the longest write transaction, or rows stamped before
+# a read but committed after it would be skipped.
+INVOICE_DELTA_LAG_SECONDS = 60
+
+# Invoice emails are queued in the InvoiceEmail outbox and sent off the request
+# path: by a background thread started after the queueing request commits
+# (INVOICE_EMAIL_BACKGROUND) and by `manage.py send_invoice_emails`, which also
+# picks up retries. Each batch shares one mail connection.
+INVOICE_EMAIL_BACKGROUND = True
+INVOICE_EMAIL_BATCH_SIZE = 50
+INVOICE_EMAIL_RATE = 5  # Messages per second, per sender; 0 for no limit
+INVOICE_EMAIL_MAX_ATTEMPTS = 5
+INVOICE_EMAIL_RETRY_SECONDS = 60  # Doubles after every failed attempt
+INVOICE_EMAIL_CLAIM_TIMEOUT = 600  # Seconds before a crashed sender's batch is taken over
+
+# Online backups (manage.py backup_database / verify_backup / restore_database).
+# migrate switches the SQLite file to WAL so backups never block writers.
+INVOICE_BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+INVOICE_SQLITE_WAL = True
+
+# Admission control for heavy endpoints (invoice.admission). Across all workers
+# on this host, at most `concurrency` requests of each run at once and one user
+# holds at most `per_user` of them; up to `queue` more wait up to `wait` seconds
+# for a slot. Everything else gets 503 with Retry-After. Waiting requests still
+# occupy a worker, so keep `queue` well below the worker count. Slots are lock
+# files in INVOICE_ADMISSION_DIR; staff can see the counters at /admission_stats/.
+INVOICE_ADMISSION = {
+    'download_all': {'concurrency': 2, 'per_user': 1, 'queue': 2, 'wait': 15},
+    'download_invoice_lines': {'concurrency': 2, 'per_user': 1, 'queue': 2, 'wait': 15},
+    'invoice_pdf': {'concurrency': 4, 'per_user': 2, 'queue': 4, 'wait': 5},
+    'invoice_stream': {'concurrency': 2, 'per_user': 1, 'queue': 2, 'wait': 15},
+}
+INVOICE_ADMISSION_DIR = os.path.join(BASE_DIR, 'run', 'admission')
+
+# Read API at /api/invoices/ (invoice.api): pages of this many invoices by
+# default, ?limit= up to the maximum, which is also the batch size of
+# ?format=ndjson streams. Install orjson for faster encoding.
+INVOICE_API_PAGE_SIZE = 100
+INVOICE_API_MAX_PAGE_SIZE = 1000